@@ -0,0 +1,449 @@
+"""
+Scraper adapters: one per kind of source, picked by the URL's host
+
+Each adapter declares the hosts it handles and, from its config.PLATFORMS
+entry, the rate limit and cache lifetimes for its pages. AdapterRegistry
+finds the adapter for a URL with a dict lookup on the parsed host (then on
+its parent domains, so www./old./mobile. hosts need no entries of their
+own). Adding a source means writing an adapter and registering it.
+
+Hosts no adapter claims go to the blog adapter, which extracts an article's
+main text, or hands off to the feed adapter when the URL's path or the
+response's content type says it is an RSS/Atom feed.
+"""
+import json
+import re
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+
+import config
+from cache import CachePolicy
+from concurrency import run_blocking
+from extraction import (LINKEDIN_TARGETS, TWITTER_TARGETS, FeedParser, FirstItemDecoder,
+                        extract_article, html_to_text)
+
+
+class SourceError(Exception):
+    """The page was fetched but holds nothing to repurpose; the message is shown as is"""
+
+
+class Adapter:
+    """
+    Scrapes one kind of source
+
+    Subclasses set `platform` (its config.PLATFORMS key and the platform of
+    its results) and `label` (used in error messages), and implement
+    scrape(). Sources with many posts per URL also override items().
+    Adapters fetch through the ContentScraper passed in, which applies the
+    rate limit, size limit and revalidation.
+    """
+
+    platform = ''
+    label = ''
+
+    def __init__(self, settings: Optional[Dict] = None):
+        """
+        Args:
+            settings: Platform settings (defaults to the config.PLATFORMS entry)
+        """
+        settings = settings if settings is not None else config.PLATFORMS.get(self.platform, {})
+        self.settings = settings
+        self.hosts = tuple(settings.get('hosts', settings.get('domains', ())))
+        self.cache = CachePolicy(**settings.get('cache', {}))
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        """
+        Scrape the post at a URL
+
+        Returns:
+            Dictionary containing platform, content, and author information
+
+        Raises:
+            SourceError: Nothing usable on the page
+        """
+        raise NotImplementedError
+
+    async def items(self, scraper, url: str) -> AsyncIterator[Dict[str, str]]:
+        """Every post at the URL, yielded as it is read; just the one for most sources"""
+        yield await self.scrape(scraper, url)
+
+    def result(self, content: str, author: str, **extra) -> Dict[str, str]:
+        """A successful scrape result"""
+        return {'platform': self.platform, 'content': content, 'author': author, 'error': False, **extra}
+
+    def failure(self, message: str) -> Dict[str, str]:
+        """A failed scrape result carrying a message for the user"""
+        return {'platform': self.platform, 'content': message, 'author': 'Unknown', 'error': True}
+
+    def error_message(self, error: Exception) -> str:
+        return f'Error scraping {self.label}: {str(error)}. Please provide the post text manually.'
+
+
+async def first_item(items: AsyncIterator[Dict[str, str]]) -> Dict[str, str]:
+    """The first item of an adapter's items(), closing the download after it"""
+    try:
+        async for item in items:
+            return item
+        raise SourceError("The feed has no items to repurpose.")
+    finally:
+        await items.aclose()
+
+
+async def _read_all(scraper, response: httpx.Response, limit: Optional[int] = None) -> bytes:
+    return b"".join([chunk async for chunk in scraper.read(response, limit)])
+
+
+class TwitterAdapter(Adapter):
+    """
+    Twitter/X posts, read through the nitter.net frontend
+
+    Note: Twitter requires authentication for most scraping; nitter may not
+    have every tweet. For production, consider using the Twitter API.
+    """
+
+    platform = 'twitter'
+    label = 'Twitter'
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        # Same path on the nitter host
+        nitter_url = str(httpx.URL(url).copy_with(host=self.settings.get('fallback_domain', 'nitter.net')))
+        found = await scraper.extract(nitter_url, scraper.headers, TWITTER_TARGETS, self.platform)
+        if not found['content']:
+            raise SourceError('Unable to scrape Twitter content. Please provide the tweet text manually.')
+        return self.result(found['content'], found['author'] or "Unknown")
+
+
+class LinkedInAdapter(Adapter):
+    """
+    LinkedIn posts, from the page's og:description / og:title meta tags
+
+    Note: LinkedIn heavily restricts scraping and requires authentication;
+    this works for public posts only.
+    """
+
+    platform = 'linkedin'
+    label = 'LinkedIn'
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        found = await scraper.extract(url, scraper.headers, LINKEDIN_TARGETS, self.platform)
+        if not found['content']:
+            raise SourceError('Unable to scrape LinkedIn content due to authentication requirements. '
+                              'Please provide the post text manually.')
+        return self.result(found['content'], found['author'] or "Unknown")
+
+
+class RedditAdapter(Adapter):
+    """
+    Reddit posts, through the thread's .json endpoint
+
+    Subreddit URLs (/r/name/, optionally with a sort such as /new) are
+    listings: items() yields their posts, newest first for /r/name/ and
+    /r/name/new.
+    """
+
+    platform = 'reddit'
+    label = 'Reddit'
+
+    # Look more like a real browser
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+        'Accept': 'application/json, text/html',
+        'Accept-Language': 'en-US,en;q=0.9'
+    }
+
+    LISTING_SORTS = {'new', 'hot', 'top', 'rising', 'controversial'}
+
+    def listing_path(self, url: httpx.URL) -> Optional[str]:
+        """The listing's .json path if the URL is a subreddit rather than a post"""
+        parts = [part for part in url.path.split('/') if part]
+        if len(parts) == 2 and parts[0] == 'r':
+            return f"/r/{parts[1]}/new.json"
+        if len(parts) == 3 and parts[0] == 'r' and parts[2] in self.LISTING_SORTS:
+            return f"/r/{parts[1]}/{parts[2]}.json"
+        return None
+
+    async def items(self, scraper, url: str) -> AsyncIterator[Dict[str, str]]:
+        listing_url = httpx.URL(url)
+        path = self.listing_path(listing_url)
+        if path is None:
+            yield await self.scrape(scraper, url)
+            return
+
+        json_url = listing_url.copy_with(path=path, params={'limit': config.REDDIT_LISTING_LIMIT, 'raw_json': 1})
+        async with scraper.fetch(str(json_url), self.HEADERS, self.platform) as response:
+            if 'json' not in response.headers.get('content-type', '').lower():
+                raise ValueError("Reddit returned HTML instead of JSON. The subreddit may not exist or Reddit is blocking the request.")
+            listing = json.loads(await _read_all(scraper, response))
+
+        for child in listing['data']['children']:
+            post = child['data']
+            if post.get('stickied'):
+                continue
+            title, selftext = post.get('title', ''), post.get('selftext', '')
+            yield self.result(
+                f"{title}\n\n{selftext}" if selftext else title,
+                f"u/{post.get('author', 'Unknown')}",
+                url=f"https://www.reddit.com{post['permalink']}",
+                id=post['name'],
+                title=title,
+                published=datetime.fromtimestamp(post.get('created_utc', 0), timezone.utc).isoformat()
+            )
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        if self.listing_path(httpx.URL(url)) is not None:
+            return await first_item(self.items(scraper, url))
+
+        # Add .json to the URL to get JSON response, and ask for as few
+        # comments as Reddit allows since only the post is used
+        post_url = httpx.URL(url)
+        json_url = post_url.copy_with(
+            path=post_url.path.rstrip('/') + '.json',
+            params={'limit': config.REDDIT_COMMENT_LIMIT, 'depth': config.REDDIT_COMMENT_DEPTH}
+        )
+
+        async with scraper.fetch(str(json_url), self.HEADERS, self.platform) as response:
+            content_type = response.headers.get('content-type', '')
+            if 'json' not in content_type.lower():
+                # Usually a block page; slow down before the next request
+                limiter = scraper.rate_limiter.for_host(json_url.host, self.platform)
+                if limiter is not None:
+                    await limiter.throttle()
+                raise ValueError("Reddit returned HTML instead of JSON. The URL may be invalid or Reddit is blocking the request.")
+
+            # The body is [post listing, comment listing]; stop reading
+            # once the post listing is complete
+            decoder = FirstItemDecoder(response.charset_encoding)
+            async for chunk in scraper.read(response):
+                if decoder.feed(chunk):
+                    break
+            listing = decoder.close()
+
+        post_data = listing['data']['children'][0]['data']
+        title = post_data.get('title', '')
+        selftext = post_data.get('selftext', '')
+        author = post_data.get('author', 'Unknown')
+
+        # Combine title and selftext
+        content = f"{title}\n\n{selftext}" if selftext else title
+        return self.result(content, f"u/{author}")
+
+
+class HackerNewsAdapter(Adapter):
+    """
+    Hacker News items (news.ycombinator.com/item?id=...), via the official API
+
+    Text posts and comments use their own text. Link posts with no text use
+    the linked article, scraped (and cached) as a URL of its own.
+    """
+
+    platform = 'hackernews'
+    label = 'Hacker News'
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        item_id = httpx.URL(url).params.get('id', '')
+        if not item_id.isdigit():
+            raise SourceError("That isn't a Hacker News item link (news.ycombinator.com/item?id=...).")
+
+        async with scraper.fetch(f"{config.HN_API_URL}/item/{item_id}.json",
+                                 {**scraper.headers, 'Accept': 'application/json'}, self.platform) as response:
+            item = json.loads(await _read_all(scraper, response))
+        if not item or item.get('deleted') or item.get('dead'):
+            raise SourceError("That Hacker News item doesn't exist or was removed.")
+
+        title = html_to_text(item.get('title') or '')
+        text = await run_blocking(html_to_text, item['text']) if item.get('text') else ''
+        if not text and item.get('url'):
+            linked = await scraper.scrape(item['url'])
+            if not linked.get('error'):
+                text = linked['content']
+        content = f"{title}\n\n{text}" if title and text else (title or text)
+        if not content:
+            raise SourceError("That Hacker News item has no text to repurpose.")
+        return self.result(content, item.get('by') or "Unknown", url=item.get('url') or url)
+
+
+def is_feed_response(response: httpx.Response) -> bool:
+    """True if the response's content type is an RSS/Atom (or plain XML) document"""
+    content_type = response.headers.get('content-type', '').lower()
+    if 'rss' in content_type or 'atom' in content_type:
+        return True
+    return ('/xml' in content_type or '+xml' in content_type) and 'xhtml' not in content_type
+
+
+class FeedAdapter(Adapter):
+    """
+    RSS and Atom feeds
+
+    Entries are parsed as the feed downloads and yielded one by one, so a
+    consumer can start on the first items of a large feed before the rest
+    has arrived. scrape() returns the first entry (usually the newest) and
+    stops the download there.
+    """
+
+    platform = 'rss'
+    label = 'the feed'
+
+    HEADERS = {
+        'User-Agent': config.USER_AGENT,
+        'Accept': 'application/rss+xml, application/atom+xml, application/xml;q=0.9, text/xml;q=0.8, */*;q=0.1'
+    }
+    PATH = re.compile(r'(/feeds?|/rss|/atom|\.rss|\.atom|\.xml|/rss\.php)/?$', re.I)
+
+    def matches(self, url: httpx.URL) -> bool:
+        """True if the URL's path looks like a feed (/feed, /rss, *.xml, ...)"""
+        return bool(self.PATH.search(url.path))
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        return await first_item(self.items(scraper, url))
+
+    async def items(self, scraper, url: str) -> AsyncIterator[Dict[str, str]]:
+        async with scraper.fetch(url, self.HEADERS, self.platform) as response:
+            async for item in self.parse(scraper, response):
+                yield item
+
+    async def parse(self, scraper, response: httpx.Response) -> AsyncIterator[Dict[str, str]]:
+        """Entries of an open feed response, as they are read"""
+        parser = FeedParser()
+        async for chunk in scraper.read(response, config.FEED_MAX_RESPONSE_BYTES):
+            for entry in parser.feed(chunk):
+                item = await self._item(entry, parser.title)
+                if item is not None:
+                    yield item
+        for entry in parser.close():
+            item = await self._item(entry, parser.title)
+            if item is not None:
+                yield item
+
+    async def _item(self, entry: Dict[str, Optional[str]], feed_title: Optional[str]) -> Optional[Dict[str, str]]:
+        body = entry['content'] or entry['summary'] or ''
+        # Entry bodies are HTML; parsing is CPU-bound, keep it off the event loop
+        text = await run_blocking(html_to_text, body) if body else ''
+        title = html_to_text(entry['title'] or '')
+        content = f"{title}\n\n{text}" if title and text else (title or text)
+        if not content:
+            return None
+        return self.result(content, entry['author'] or feed_title or "Unknown",
+                           url=entry['link'], id=entry['id'] or entry['link'], published=entry['published'])
+
+
+class BlogAdapter(Adapter):
+    """
+    Articles on any site no other adapter claims
+
+    The main text is found readability-style (see extraction.extract_article).
+    A response that turns out to be an RSS/Atom feed is parsed as one.
+    """
+
+    platform = 'blog'
+    label = 'the article'
+
+    HEADERS = {
+        'User-Agent': config.USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.8'
+    }
+
+    def __init__(self, settings: Optional[Dict] = None, feeds: Optional[FeedAdapter] = None):
+        """
+        Args:
+            settings: Platform settings (defaults to the config.PLATFORMS entry)
+            feeds: Adapter for responses that are feeds
+        """
+        super().__init__(settings)
+        self.feeds = feeds or FeedAdapter()
+
+    async def scrape(self, scraper, url: str) -> Dict[str, str]:
+        return await first_item(self.items(scraper, url))
+
+    async def items(self, scraper, url: str) -> AsyncIterator[Dict[str, str]]:
+        async with scraper.fetch(url, self.HEADERS, self.platform) as response:
+            if is_feed_response(response):
+                async for item in self.feeds.parse(scraper, response):
+                    yield item
+                return
+            page = await _read_all(scraper, response)
+            encoding = response.charset_encoding
+
+        # Parsing is CPU-bound, keep it off the event loop
+        article = await run_blocking(extract_article, page, encoding)
+        if not article['content']:
+            raise SourceError("Couldn't find the article text on that page. Please provide it manually.")
+        content = article['content']
+        if article['title'] and not content.startswith(article['title']):
+            content = f"{article['title']}\n\n{content}"
+        yield self.result(content, article['author'] or httpx.URL(url).host, url=url)
+
+
+class AdapterRegistry:
+    """
+    Picks the scraper adapter for a URL by its host
+
+    Lookup is a dict hit on the host, then on each parent domain, so the
+    cost doesn't grow with the number of adapters, and a host only matches
+    whole labels ("box.com" is not "x.com").
+    """
+
+    def __init__(self, adapters: Iterable[Adapter] = (), default: Optional[Adapter] = None,
+                 feeds: Optional[FeedAdapter] = None):
+        """
+        Args:
+            adapters: Adapters to register under their hosts
+            default: Adapter for hosts nobody claims (None: those URLs are unsupported)
+            feeds: Adapter for unclaimed URLs whose path looks like a feed
+        """
+        self._by_host: Dict[str, Adapter] = {}
+        self.default = default
+        self.feeds = feeds
+        for adapter in adapters:
+            self.register(adapter)
+
+    def register(self, adapter: Adapter, hosts: Iterable[str] = ()):
+        """Route the adapter's hosts (or the given ones) and their subdomains to it"""
+        for host in hosts or adapter.hosts:
+            self._by_host[host.lower()] = adapter
+
+    def resolve(self, url: str) -> Adapter:
+        """
+        The adapter for a URL
+
+        Raises:
+            ValueError: Not an http(s) URL, or no adapter handles it
+        """
+        try:
+            parsed = httpx.URL(url)
+        except (httpx.InvalidURL, TypeError):
+            raise ValueError(f"Invalid URL: {url}")
+        if parsed.scheme not in ('http', 'https') or not parsed.host:
+            raise ValueError(f"Unsupported URL (expected http or https): {url}")
+
+        host = parsed.host.lower().rstrip('.')
+        while host:
+            adapter = self._by_host.get(host)
+            if adapter is not None:
+                return adapter
+            host = host.partition('.')[2]
+
+        if self.feeds is not None and self.feeds.matches(parsed):
+            return self.feeds
+        if self.default is None:
+            raise ValueError(f"Unsupported platform. URL: {url}")
+        return self.default
+
+    def adapters(self) -> List[Adapter]:
+        """Every adapter, each once"""
+        found = {id(adapter): adapter for adapter in self._by_host.values()}
+        for adapter in (self.feeds, self.default):
+            if adapter is not None:
+                found[id(adapter)] = adapter
+        return list(found.values())
+
+
+def default_registry() -> AdapterRegistry:
+    """Twitter, LinkedIn, Reddit and Hacker News by host; feeds and blogs for everything else"""
+    feeds = FeedAdapter()
+    return AdapterRegistry(
+        [TwitterAdapter(), LinkedInAdapter(), RedditAdapter(), HackerNewsAdapter()],
+        default=BlogAdapter(feeds=feeds),
+        feeds=feeds
+    )
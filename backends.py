@@ -0,0 +1,280 @@
+"""
+Registry of reusable backend clients for content generation
+"""
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+import config
+from llm_service import ContentRepurposer, summarize_usage
+from ollama_pool import parse_base_urls
+from slm_service import ContentRepurposerSLM, summarize_timings
+
+
+class _Health:
+    """Cached outcome of an Ollama health check"""
+
+    def __init__(self, error: Optional[Exception], checked_at: float):
+        self.error = error
+        self.checked_at = checked_at
+
+
+class Lease:
+    """A backend held by a request or job; the registry won't close it until released"""
+
+    def __init__(self, registry: 'BackendRegistry', key: Tuple, backend):
+        self.backend = backend
+        self._registry = registry
+        self._key = key
+        self.released = False
+
+    def release(self):
+        """Hand the backend back (safe to call more than once)"""
+        if not self.released:
+            self.released = True
+            self._registry._release(self._key)
+
+
+class BackendRegistry:
+    """
+    Creates backend clients lazily and reuses them across requests
+
+    Clients are keyed by (backend, credentials hash or base URL, model) and
+    closed after sitting idle for `idle_timeout` seconds. A client counts as
+    idle only while nobody holds a lease on it (see use() and lease()), so
+    a long batch or a queued job never loses its client mid-way. Ollama
+    health and model availability are checked once per `health_ttl` instead
+    of on every request.
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None,
+                 idle_timeout: float = config.BACKEND_IDLE_TIMEOUT,
+                 health_ttl: float = config.OLLAMA_HEALTH_TTL,
+                 health_failure_ttl: float = config.OLLAMA_HEALTH_FAILURE_TTL):
+        """
+        Initialize the registry
+
+        Args:
+            http_client: Shared client passed to Ollama backends
+            idle_timeout: Seconds before an unused client is closed
+            health_ttl: Seconds a successful health check is trusted
+            health_failure_ttl: Seconds a failed health check is remembered
+        """
+        self.http_client = http_client
+        self.idle_timeout = idle_timeout
+        self.health_ttl = health_ttl
+        self.health_failure_ttl = health_failure_ttl
+        self._backends: Dict[Tuple, object] = {}
+        self._last_used: Dict[Tuple, float] = {}
+        self._leases: Dict[Tuple, int] = {}
+        self._health: Dict[Tuple, _Health] = {}
+        self._health_locks: Dict[Tuple, asyncio.Lock] = {}
+        self.created = 0
+        self.reused = 0
+        self.health_checks = 0
+        # Claude token usage and Ollama timings per model, including backends already evicted
+        self._retired_usage: Dict[str, Dict[str, float]] = {}
+        self._retired_timings: Dict[str, Dict[str, float]] = {}
+
+    async def get(self, model_type: str, api_key: str = None, base_url: str = None, model: str = None):
+        """
+        Get the repurposer for the selected model type
+
+        Args:
+            model_type: "llm" (Claude) or "slm" (Ollama)
+            api_key: Anthropic API key, required for "llm"
+            base_url: Ollama base URL (or several, comma-separated), required for "slm"
+            model: Ollama model (default: config.OLLAMA_MODEL); ignored for "llm"
+
+        Returns:
+            A ready-to-use ContentRepurposer or ContentRepurposerSLM
+        """
+        if model_type == "llm":
+            if not api_key:
+                raise ValueError("API key is required for LLM")
+            return await self.get_llm(api_key)
+        # slm
+        if not base_url:
+            raise ValueError("Base URL is required for SLM")
+        return await self.get_slm(base_url, model or config.OLLAMA_MODEL)
+
+    async def lease(self, model_type: str, api_key: str = None, base_url: str = None,
+                    model: str = None) -> Lease:
+        """
+        Get the repurposer like get() and hold it until the lease is released
+
+        For work that outlives the request that started it, such as a queued
+        job; otherwise prefer use(). A lease that is never released pins the
+        backend, e.g. a preloaded model whose keep-warm must outlive quiet
+        periods.
+        """
+        backend = await self.get(model_type, api_key, base_url, model)
+        if model_type == "llm":
+            key = self._llm_key(api_key)
+        else:
+            key = self._slm_key(base_url, model or config.OLLAMA_MODEL)
+        # No await since get(): the backend can't have been evicted in between
+        self._leases[key] = self._leases.get(key, 0) + 1
+        return Lease(self, key, backend)
+
+    @asynccontextmanager
+    async def use(self, model_type: str, api_key: str = None, base_url: str = None,
+                  model: str = None) -> AsyncIterator[object]:
+        """Hold the repurposer for the duration of an `async with` block"""
+        lease = await self.lease(model_type, api_key, base_url, model)
+        try:
+            yield lease.backend
+        finally:
+            lease.release()
+
+    @staticmethod
+    def _llm_key(api_key: str, model: str = config.DEFAULT_MODEL) -> Tuple:
+        return ('llm', hashlib.sha256(api_key.encode()).hexdigest(), model)
+
+    @staticmethod
+    def _slm_key(base_url: str, model: str = config.OLLAMA_MODEL) -> Tuple:
+        return ('slm', tuple(parse_base_urls(base_url)), model)
+
+    async def get_llm(self, api_key: str, model: str = config.DEFAULT_MODEL) -> ContentRepurposer:
+        """Get the Claude backend for an API key"""
+        key = self._llm_key(api_key, model)
+        backend = self._lookup(key)
+        if backend is None:
+            backend = ContentRepurposer(api_key=api_key, model=model)
+            self._store(key, backend)
+        await self._evict_idle()
+        return backend
+
+    async def get_slm(self, base_url: str, model: str = config.OLLAMA_MODEL) -> ContentRepurposerSLM:
+        """Get the Ollama backend for one or more servers, checking health at most once per TTL"""
+        key = self._slm_key(base_url, model)
+        backend = self._lookup(key)
+        if backend is None:
+            backend = ContentRepurposerSLM(
+                model_name=model,
+                base_url=list(key[1]),
+                client=self.http_client,
+                check_connection=False
+            )
+            self._store(key, backend)
+        await self._ensure_healthy(key, backend)
+        await self._evict_idle()
+        return backend
+
+    async def _ensure_healthy(self, key: Tuple, backend: ContentRepurposerSLM):
+        health = self._health.get(key)
+        if health is None or not self._health_valid(health):
+            lock = self._health_locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                # Another request may have refreshed it while we waited
+                health = self._health.get(key)
+                if health is None or not self._health_valid(health):
+                    self.health_checks += 1
+                    try:
+                        await backend.check_health()
+                        health = _Health(None, time.monotonic())
+                    except Exception as e:
+                        health = _Health(e, time.monotonic())
+                    self._health[key] = health
+        if health.error is not None:
+            raise health.error
+
+    def _health_valid(self, health: _Health) -> bool:
+        ttl = self.health_failure_ttl if health.error is not None else self.health_ttl
+        return time.monotonic() - health.checked_at <= ttl
+
+    def _lookup(self, key: Tuple):
+        backend = self._backends.get(key)
+        if backend is not None:
+            self.reused += 1
+            self._last_used[key] = time.monotonic()
+        return backend
+
+    def _store(self, key: Tuple, backend):
+        self.created += 1
+        self._backends[key] = backend
+        self._last_used[key] = time.monotonic()
+
+    def _release(self, key: Tuple):
+        held = self._leases.get(key, 0) - 1
+        if held > 0:
+            self._leases[key] = held
+        else:
+            self._leases.pop(key, None)
+        # Idle time counts from the end of the last use, not its start
+        if key in self._backends:
+            self._last_used[key] = time.monotonic()
+
+    async def _evict_idle(self):
+        now = time.monotonic()
+        idle = [key for key, used in self._last_used.items()
+                if now - used > self.idle_timeout and not self._leases.get(key)]
+        for key in idle:
+            await self._close(key)
+
+    async def _close(self, key: Tuple):
+        backend = self._backends.pop(key, None)
+        self._last_used.pop(key, None)
+        self._health.pop(key, None)
+        self._health_locks.pop(key, None)
+        if isinstance(backend, ContentRepurposer):
+            self._add_usage(self._retired_usage, backend.model, backend.usage)
+        if isinstance(backend, ContentRepurposerSLM):
+            self._add_usage(self._retired_timings, backend.model_name, backend.timings)
+        if hasattr(backend, 'aclose'):
+            await backend.aclose()
+
+    @staticmethod
+    def _add_usage(totals: Dict[str, Dict[str, float]], model: str, counters: Dict[str, float]):
+        model_totals = totals.setdefault(model, {})
+        for name, value in counters.items():
+            if name.startswith('max_'):
+                model_totals[name] = max(model_totals.get(name, 0), value)
+            else:
+                model_totals[name] = model_totals.get(name, 0) + value
+
+    def llm_usage(self) -> Dict[str, Dict[str, float]]:
+        """Claude token usage and prompt cache effect, per model"""
+        totals = {model: dict(counters) for model, counters in self._retired_usage.items()}
+        for backend in self._backends.values():
+            if isinstance(backend, ContentRepurposer):
+                self._add_usage(totals, backend.model, backend.usage)
+        return {model: summarize_usage(counters) for model, counters in totals.items()}
+
+    def ollama_timings(self) -> Dict[str, Dict[str, float]]:
+        """Ollama model load and evaluation time, per model"""
+        totals = {model: dict(counters) for model, counters in self._retired_timings.items()}
+        for backend in self._backends.values():
+            if isinstance(backend, ContentRepurposerSLM):
+                self._add_usage(totals, backend.model_name, backend.timings)
+        return {model: summarize_timings(counters) for model, counters in totals.items()}
+
+    async def aclose(self):
+        """Close every backend client"""
+        for key in list(self._backends):
+            await self._close(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Registry counters"""
+        return {
+            'active': len(self._backends),
+            'leased': len(self._leases),
+            'created': self.created,
+            'reused': self.reused,
+            'health_checks': self.health_checks,
+            'llm_usage': self.llm_usage(),
+            'ollama_timings': self.ollama_timings(),
+            'ollama_servers': self.ollama_servers()
+        }
+    
+    def ollama_servers(self) -> Dict[str, Dict]:
+        """Routing state of every Ollama server in use"""
+        servers = {}
+        for backend in self._backends.values():
+            if isinstance(backend, ContentRepurposerSLM):
+                servers.update(backend.pool.stats())
+        return servers
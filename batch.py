@@ -0,0 +1,354 @@
+"""
+Batch repurposing of many URLs or texts, as an API helper and a CLI
+
+CLI usage:
+    python batch.py items.jsonl --model-type slm --base-url http://localhost:11434
+    cat urls.json | python batch.py - --model-type llm --api-key sk-ant-...
+    python batch.py items.jsonl --model-type llm --bulk   # overnight, via Message Batches
+
+Input is a JSON array (or {"items": [...]}) or JSON Lines. Each item is a
+URL string, a text string, or an object with `url` or `content` plus
+optional `platform`, `author` and `id`. Results are written as NDJSON, one
+line per item in completion order.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Union
+
+import config
+
+
+Item = Union[str, Dict]
+# Returns the posts, or a dict of result fields including 'posts'
+GenerateFn = Callable[[str, str, str], Awaitable[Union[List[str], Dict]]]
+
+
+def parse_items(text: str) -> List[Item]:
+    """
+    Parse batch input as JSON or JSON Lines
+
+    Args:
+        text: A JSON array, an object with an "items" array, or one JSON value per line
+
+    Returns:
+        List of raw items
+    """
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+    else:
+        if isinstance(data, dict) and 'items' in data:
+            data = data['items']
+        if isinstance(data, list):
+            return data
+
+    items = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError:
+            raise ValueError(f"Line {line_number} is not valid JSON")
+    return items
+
+
+def normalize_item(item: Item, default_platform: str = "other") -> Dict:
+    """
+    Turn a raw batch item into {id, url | content, platform, author}
+
+    Args:
+        item: URL string, text string or dict
+        default_platform: Platform for text items that don't name one
+
+    Returns:
+        Normalized item dictionary
+    """
+    if isinstance(item, str):
+        item = {'url': item} if item.strip().startswith(('http://', 'https://')) else {'content': item}
+    if not isinstance(item, dict):
+        raise ValueError("Item must be a string or an object")
+    if not item.get('url') and not item.get('content'):
+        raise ValueError("Item needs a 'url' or 'content'")
+    return {
+        'id': item.get('id'),
+        'url': item.get('url'),
+        'content': item.get('content'),
+        'platform': item.get('platform') or default_platform,
+        'author': item.get('author') or "Manual Input"
+    }
+
+
+async def _aiter(items: Union[Iterable[Item], AsyncIterable[Item]]) -> AsyncIterator[Item]:
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def run_batch(items: Union[Iterable[Item], AsyncIterable[Item]], scraper, generate: GenerateFn,
+                    scrape_concurrency: int = config.BATCH_SCRAPE_CONCURRENCY,
+                    generate_concurrency: int = config.BATCH_GENERATE_CONCURRENCY,
+                    default_platform: str = "other") -> AsyncIterator[Dict]:
+    """
+    Scrape and generate for every item, yielding results as they finish
+
+    Scraping and generation have separate concurrency limits, so slow model
+    calls don't hold back scrapes and vice versa. A failing item produces a
+    result with an `error` and does not affect the rest of the batch.
+
+    A fixed pool of scrape_concurrency + generate_concurrency workers takes
+    items from a bounded queue, so a large batch doesn't start a task per
+    item. Items may come from an async iterable (e.g. a feed being
+    downloaded); each starts as soon as it arrives and a worker is free. If
+    reading the items fails, the failure is reported as one more result with
+    an `error`.
+
+    Args:
+        items: Raw batch items, or an async iterable of them
+        scraper: ContentScraper used for URL items
+        generate: Coroutine function (content, platform, author) -> posts, or a
+            dict of result fields including 'posts' (e.g. structured output)
+        scrape_concurrency: Scrapes in flight at once
+        generate_concurrency: Generations in flight at once
+        default_platform: Platform for text items that don't name one
+
+    Yields:
+        One result dictionary per item, in completion order
+    """
+    scrape_slots = asyncio.Semaphore(scrape_concurrency)
+    generate_slots = asyncio.Semaphore(generate_concurrency)
+    worker_count = scrape_concurrency + generate_concurrency
+    pending: asyncio.Queue = asyncio.Queue(maxsize=worker_count)
+    results: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def process(index: int, raw: Item) -> Dict:
+        result = {'index': index}
+        try:
+            item = normalize_item(raw, default_platform)
+            result['id'] = item['id']
+            if item['url']:
+                result['url'] = item['url']
+                async with scrape_slots:
+                    scraped = await scraper.scrape(item['url'])
+                if scraped.get('error'):
+                    raise ValueError(scraped['content'])
+                content, platform, author = scraped['content'], scraped['platform'], scraped['author']
+            else:
+                content, platform, author = item['content'], item['platform'], item['author']
+
+            async with generate_slots:
+                generated = await generate(content, platform, author)
+            if not isinstance(generated, dict):
+                generated = {'posts': generated}
+
+            result.update({
+                'platform': platform,
+                'author': author,
+                **generated,
+                'error': None
+            })
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    async def work():
+        while True:
+            entry = await pending.get()
+            if entry is done:
+                await results.put(done)
+                return
+            await results.put(await process(*entry))
+
+    async def produce():
+        index = 0
+        try:
+            async for raw in _aiter(items):
+                await pending.put((index, raw))
+                index += 1
+        except Exception as e:
+            await results.put({'index': index, 'id': None, 'error': str(e)})
+        for _ in range(worker_count):
+            await pending.put(done)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(worker_count)]
+    try:
+        # Each worker puts a marker once the producer has told it no items are left
+        finished = 0
+        while finished < worker_count:
+            result = await results.get()
+            if result is done:
+                finished += 1
+                continue
+            yield result
+    finally:
+        # The consumer went away (e.g. client disconnected): stop the rest
+        for task in tasks:
+            task.cancel()
+
+
+async def _scrape_items(items: Iterable[Item], scraper, scrape_concurrency: int,
+                        default_platform: str) -> List[Dict]:
+    """Normalize and scrape every item with a fixed pool of workers, recording per-item errors"""
+    items = list(items)
+    results: List[Dict] = [None] * len(items)
+    remaining = iter(enumerate(items))
+
+    async def prepare(index: int, raw: Item) -> Dict:
+        result = {'index': index}
+        try:
+            item = normalize_item(raw, default_platform)
+            result['id'] = item['id']
+            if item['url']:
+                result['url'] = item['url']
+                scraped = await scraper.scrape(item['url'])
+                if scraped.get('error'):
+                    raise ValueError(scraped['content'])
+                item.update(content=scraped['content'], platform=scraped['platform'], author=scraped['author'])
+            result.update(content=item['content'], platform=item['platform'], author=item['author'], error=None)
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    async def work():
+        # Workers share one iterator, so each item is taken exactly once
+        for index, raw in remaining:
+            results[index] = await prepare(index, raw)
+
+    await asyncio.gather(*[work() for _ in range(min(scrape_concurrency, len(items)))])
+    return results
+
+
+async def run_bulk(items: Iterable[Item], scraper, repurposer,
+                   scrape_concurrency: int = config.BATCH_SCRAPE_CONCURRENCY,
+                   default_platform: str = "other",
+                   poll_interval: float = config.BULK_POLL_INTERVAL) -> AsyncIterator[Dict]:
+    """
+    Scrape every item, then generate all of them in one Message Batch
+
+    For overnight jobs where latency doesn't matter: the batch is billed at
+    the batch discount and stays out of interactive rate limits. Items that
+    fail to scrape are reported first; the rest follow once the batch ends.
+
+    Args:
+        items: Raw batch items
+        scraper: ContentScraper used for URL items
+        repurposer: ContentRepurposer (Claude) to submit the batch with
+        scrape_concurrency: Scrapes in flight at once
+        default_platform: Platform for text items that don't name one
+        poll_interval: Seconds between batch status checks
+
+    Yields:
+        One result dictionary per item
+    """
+    prepared = await _scrape_items(items, scraper, scrape_concurrency, default_platform)
+    ready = [item for item in prepared if item['error'] is None]
+
+    for item in prepared:
+        if item['error'] is not None:
+            yield item
+
+    generated = await repurposer.generate_bulk(
+        [
+            {'original_content': item['content'], 'platform': item['platform'], 'author': item['author']}
+            for item in ready
+        ],
+        poll_interval=poll_interval
+    )
+    for item, outcome in zip(ready, generated):
+        item.pop('content')
+        yield {**item, 'posts': outcome['posts'], 'error': outcome['error']}
+
+
+async def _run_cli(args) -> int:
+    from backends import BackendRegistry
+    from cache import ScrapeCache
+    from http_client import create_http_client
+    from scraper import ContentScraper
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    with source:
+        items = parse_items(source.read())
+
+    http_client = create_http_client()
+    backends = BackendRegistry(http_client=http_client)
+    scraper = ContentScraper(client=http_client, cache=ScrapeCache())
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    failed = 0
+    try:
+        if args.bulk:
+            from llm_service import ContentRepurposer
+
+            if args.model_type != 'llm':
+                raise ValueError("--bulk is only available with --model-type llm")
+            repurposer = ContentRepurposer(api_key=args.api_key, base_url=args.anthropic_base_url)
+            results = run_bulk(items, scraper, repurposer,
+                               scrape_concurrency=args.scrape_concurrency,
+                               default_platform=args.platform,
+                               poll_interval=args.poll_interval)
+        else:
+            repurposer = await backends.get(args.model_type, args.api_key, args.base_url)
+
+            async def generate(content, platform, author):
+                return await repurposer.generate_linkedin_posts(content, platform, author)
+
+            results = run_batch(items, scraper, generate,
+                                scrape_concurrency=args.scrape_concurrency,
+                                generate_concurrency=args.generate_concurrency,
+                                default_platform=args.platform)
+
+        async for result in results:
+            failed += result['error'] is not None
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await backends.aclose()
+        await http_client.aclose()
+
+    print(f"{len(items) - failed}/{len(items)} items succeeded", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main():
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="JSON / JSONL file with URLs or texts ('-' for stdin)")
+    parser.add_argument('--output', default='-', help="NDJSON output file (default: stdout)")
+    parser.add_argument('--model-type', choices=['llm', 'slm'], default='llm')
+    parser.add_argument('--api-key', default=os.getenv('ANTHROPIC_API_KEY'), help="Anthropic API key for llm")
+    parser.add_argument('--base-url', default=config.OLLAMA_BASE_URL, help="Ollama base URL for slm")
+    parser.add_argument('--platform', default='other', help="platform for text items without one")
+    parser.add_argument('--scrape-concurrency', type=int, default=config.BATCH_SCRAPE_CONCURRENCY)
+    parser.add_argument('--generate-concurrency', type=int, default=config.BATCH_GENERATE_CONCURRENCY)
+    parser.add_argument('--bulk', action='store_true',
+                        help="generate through the Anthropic Message Batches API (llm only)")
+    parser.add_argument('--anthropic-base-url', default=None,
+                        help="Anthropic API base URL, e.g. a local fake server")
+    parser.add_argument('--poll-interval', type=float, default=config.BULK_POLL_INTERVAL,
+                        help="seconds between batch status checks with --bulk")
+    args = parser.parse_args()
+
+    try:
+        sys.exit(asyncio.run(_run_cli(args)))
+    except (OSError, ValueError, ConnectionError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+Load tests and benchmarks for Content Repurposing Agent
+
+Run from the repository root, e.g. `python -m benchmarks.load_test`
+"""
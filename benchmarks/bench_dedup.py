@@ -0,0 +1,163 @@
+"""
+Near-duplicate detection: accuracy on edited posts and query time at scale
+
+Two parts:
+
+- accuracy: synthetic posts against copies with whitespace/emoji/link
+  changes, a few replaced words, the same words shuffled, and unrelated
+  posts. The share detected at the configured similarity is reported for
+  each kind of edit.
+- scale: an index of --items random signatures (1M by default). It reports
+  build time, memory per item, query latency for near and far signatures,
+  and save/load time and file size. Recall is checked on the near
+  signatures, which must all be found.
+
+Fails if the p99 query time is over --max-query-ms, a near signature is
+missed, or a shuffled or unrelated post is matched.
+
+Usage:
+    python -m benchmarks.bench_dedup [--items 1000000] [--queries 20000] [--similarity 0.95]
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+
+import config
+from dedup import SimHashIndex, distance, max_distance_for, simhash
+
+
+def _post(vocabulary, words: int) -> str:
+    return ' '.join(random.choice(vocabulary) for _ in range(words))
+
+
+def _replace_words(text: str, vocabulary, count: int) -> str:
+    words = text.split()
+    for _ in range(count):
+        words[random.randrange(len(words))] = random.choice(vocabulary)
+    return ' '.join(words)
+
+
+EDITS = {
+    'whitespace, emoji, link': lambda text, vocabulary: (
+        "  " + text.replace(' ', '  ', 5) + " 🚀🔥\n\nhttps://t.co/" + str(random.getrandbits(32))),
+    '1 word replaced': lambda text, vocabulary: _replace_words(text, vocabulary, 1),
+    '3 words replaced': lambda text, vocabulary: _replace_words(text, vocabulary, 3),
+    'words shuffled': lambda text, vocabulary: ' '.join(random.sample(text.split(), len(text.split()))),
+    'unrelated post': lambda text, vocabulary: _post(vocabulary, len(text.split()))
+}
+
+
+def accuracy(max_distance: int, posts: int, lengths) -> dict:
+    """Share of each kind of edit detected, per post length in words"""
+    vocabulary = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(random.randint(2, 9)))
+                  for _ in range(5000)]
+    results = {}
+    for words in lengths:
+        for name, edit in EDITS.items():
+            found = 0
+            for _ in range(posts):
+                text = _post(vocabulary, words)
+                found += distance(simhash(text), simhash(edit(text, vocabulary))) <= max_distance
+            results[(words, name)] = found / posts
+    return results
+
+
+def _flip(signature: int, bits: int) -> int:
+    for bit in random.sample(range(64), bits):
+        signature ^= 1 << bit
+    return signature
+
+
+def _rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _latencies(index: SimHashIndex, signatures, scope: int) -> tuple:
+    latencies, found = [], 0
+    for signature in signatures:
+        start = time.perf_counter()
+        match = index.query(signature, scope)
+        latencies.append(time.perf_counter() - start)
+        found += match is not None
+    latencies.sort()
+    return latencies, found
+
+
+def scale(max_distance: int, items: int, queries: int) -> dict:
+    scope, key = 1, bytes(32)
+    before = _rss_mib()
+    start = time.perf_counter()
+    index = SimHashIndex(max_distance, max_items=items + 1)
+    for _ in range(items):
+        index.add(random.getrandbits(64), scope, key)
+    results = {'build s': time.perf_counter() - start, 'bytes/item': (_rss_mib() - before) * 1024 * 1024 / items}
+
+    near = [_flip(index.signatures[random.randrange(items)], random.randint(0, max_distance)) for _ in range(queries)]
+    far = [random.getrandbits(64) for _ in range(queries)]
+    for name, signatures in (('near', near), ('far', far)):
+        latencies, found = _latencies(index, signatures, scope)
+        results[name] = {
+            'p50 us': statistics.median(latencies) * 1e6,
+            'p99 us': latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+            'found': found / queries
+        }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'dedup.idx')
+        start = time.perf_counter()
+        index.save(path)
+        results['save s'] = time.perf_counter() - start
+        results['file MiB'] = os.path.getsize(path) / 1024 / 1024
+        start = time.perf_counter()
+        loaded = SimHashIndex.load(path, max_items=items + 1)
+        results['load s'] = time.perf_counter() - start
+        results['load intact'] = (loaded.signatures == index.signatures
+                                  and loaded.query(near[0], scope) == index.query(near[0], scope))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1_000_000, help="signatures in the index")
+    parser.add_argument('--queries', type=int, default=20000, help="queries of each kind")
+    parser.add_argument('--similarity', type=float, default=config.DEDUP_SIMILARITY)
+    parser.add_argument('--posts', type=int, default=200, help="posts per edit kind in the accuracy test")
+    parser.add_argument('--max-query-ms', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    max_distance = max_distance_for(args.similarity)
+    print(f"similarity {args.similarity}: up to {max_distance} of 64 bits may differ\n")
+
+    lengths = (40, 150, 400)
+    detected = accuracy(max_distance, args.posts, lengths)
+    print(f"{'edit':<26}" + "".join(f"{f'{words} words':>11}" for words in lengths))
+    for name in EDITS:
+        print(f"{name:<26}" + "".join(f"{detected[(words, name)]:>11.0%}" for words in lengths))
+
+    results = scale(max_distance, args.items, args.queries)
+    print(f"\n{args.items:,} items: built in {results['build s']:.1f} s, "
+          f"~{results['bytes/item']:.0f} bytes/item resident")
+    print(f"{'query':<8}{'p50 us':>9}{'p99 us':>9}{'found':>8}")
+    for name in ('near', 'far'):
+        result = results[name]
+        print(f"{name:<8}{result['p50 us']:>9.1f}{result['p99 us']:>9.1f}{result['found']:>8.0%}")
+    print(f"save {results['save s']:.2f} s, load {results['load s']:.1f} s, file {results['file MiB']:.1f} MiB")
+
+    worst = max(results['near']['p99 us'], results['far']['p99 us']) / 1000
+    if worst > args.max_query_ms:
+        raise SystemExit(f"FAIL: p99 query time {worst:.3f} ms")
+    if results['near']['found'] < 1 or not results['load intact']:
+        raise SystemExit("FAIL: near signatures were missed or the saved index didn't load intact")
+    if any(detected[(words, name)] for words in lengths for name in ('words shuffled', 'unrelated post')):
+        raise SystemExit("FAIL: shuffled or unrelated posts were matched")
+    print(f"PASS: p99 query time {worst:.3f} ms at {args.items:,} items")
+
+
+if __name__ == "__main__":
+    main()
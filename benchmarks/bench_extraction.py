@@ -0,0 +1,173 @@
+"""
+Parse time and peak memory of the scraper's extraction paths
+
+Compares the streaming lxml extractor (extraction.TargetedExtractor, fed in
+network-sized chunks and stopped once its targets are found) against a full
+BeautifulSoup parse (extraction.extract_with_soup) on every page of a
+corpus. Page names decide the targets: files starting with "linkedin" use
+the og: meta tags, "twitter"/"nitter" ones the tweet text and author.
+
+Without --corpus a set of synthetic pages shaped like saved LinkedIn and
+nitter pages (large inline scripts, long timelines) is generated.
+
+Peak memory is measured in a fresh subprocess per page and path as the
+growth of the process's peak RSS, because libxml2 allocates outside the
+Python heap where tracemalloc can't see it.
+
+Usage:
+    python -m benchmarks.bench_extraction [--corpus DIR] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from extraction import LINKEDIN_TARGETS, TWITTER_TARGETS, TargetedExtractor, extract_with_soup
+
+
+CHUNK_SIZE = 16 * 1024
+
+
+def _linkedin_page(script_kb: int, body_items: int) -> str:
+    script = "var state = " + json.dumps({'k': 'x' * 1000}) + ";\n"
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        "<title>Post | LinkedIn</title>"
+        "<meta property=\"og:title\" content=\"Jane Doe on LinkedIn: Shipping small\">"
+        "<meta property=\"og:description\" content=\"Shipping small changes every day beats one big release a quarter. Here is what we learned.\">"
+        "<meta property=\"og:type\" content=\"article\">"
+        + "".join(f"<link rel=\"preload\" href=\"/static/{i}.js\" as=\"script\">" for i in range(40))
+        + f"<script>{script * script_kb}</script></head><body><main>"
+        + "".join(f"<div class=\"feed-item\"><span class=\"actor\">Person {i}</span><p>Comment {i} "
+                  f"with some text that goes on for a while.</p></div>" for i in range(body_items))
+        + "</main></body></html>"
+    )
+
+
+def _nitter_page(replies: int) -> str:
+    tweet = ("<div class=\"timeline-item\"><div class=\"tweet-header\"><a class=\"fullname\" href=\"/{user}\">"
+             "{user}</a><a class=\"username\">@{user}</a></div><div class=\"tweet-content media-body\" dir=\"auto\">"
+             "{text}</div><div class=\"tweet-stats\"><span>12</span><span>34</span></div></div>")
+    head = "<!DOCTYPE html><html><head><title>nitter</title>" + "<link rel=\"stylesheet\" href=\"/css/style.css\">" * 5
+    main = tweet.format(user="Alice", text="Shipping small changes every day beats one big release. <a href=\"#\">#devops</a>")
+    rest = "".join(tweet.format(user=f"user{i}", text=f"Reply {i} agreeing at length " * 3) for i in range(replies))
+    return f"{head}</head><body><div class=\"container\"><div class=\"main-tweet\">{main}</div>" \
+           f"<div class=\"replies\">{rest}</div></div></body></html>"
+
+
+def synthetic_corpus(directory: str):
+    """Write the generated pages into directory"""
+    pages = {
+        'linkedin-small.html': _linkedin_page(script_kb=20, body_items=50),
+        'linkedin-large.html': _linkedin_page(script_kb=400, body_items=3000),
+        'nitter-small.html': _nitter_page(replies=20),
+        'nitter-large.html': _nitter_page(replies=2000),
+    }
+    for name, html in pages.items():
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as page:
+            page.write(html)
+
+
+def targets_for(name: str):
+    return LINKEDIN_TARGETS if name.startswith('linkedin') else TWITTER_TARGETS
+
+
+def run_fast(html: bytes, targets):
+    extractor = TargetedExtractor(targets)
+    for start in range(0, len(html), CHUNK_SIZE):
+        if extractor.feed(html[start:start + CHUNK_SIZE]):
+            break
+    return extractor.results
+
+
+def run_soup(html: bytes, targets):
+    return extract_with_soup(html, targets)
+
+
+PATHS = {'lxml-stream': run_fast, 'bs4-full': run_soup}
+
+
+def _time(func, html: bytes, targets, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html, targets)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _peak_memory(path: str, page: str) -> float:
+    """Peak RSS growth in KiB from one extraction, measured in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_extraction', '--measure', path, page],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip())
+
+
+def _peak_rss() -> int:
+    """Peak resident set size in KiB"""
+    # ru_maxrss survives exec on Linux (a child starts at its parent's peak),
+    # VmHWM does not
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(path: str, page: str):
+    with open(page, 'rb') as source:
+        html = source.read()
+    targets = targets_for(os.path.basename(page))
+    before = _peak_rss()
+    PATHS[path](html, targets)
+    print(_peak_rss() - before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved HTML pages')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        _measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as generated:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = generated
+            synthetic_corpus(corpus)
+
+        print(f"{'page':<24}{'size':>9}  {'path':<12}{'parse ms':>10}{'peak KiB':>10}")
+        mismatches = []
+        for name in sorted(os.listdir(corpus)):
+            page = os.path.join(corpus, name)
+            with open(page, 'rb') as source:
+                html = source.read()
+            targets = targets_for(name)
+            if run_fast(html, targets) != run_soup(html, targets):
+                mismatches.append(name)
+            for path, func in PATHS.items():
+                elapsed = _time(func, html, targets, args.repeat)
+                peak = _peak_memory(path, page)
+                print(f"{name:<24}{len(html) // 1024:>7}KB  {path:<12}{elapsed * 1000:>10.2f}{peak:>10.0f}")
+
+    if mismatches:
+        raise SystemExit(f"FAIL: paths disagree on {', '.join(mismatches)}")
+    print("PASS: both paths extract the same values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Generation throughput across several Ollama servers
+
+Runs --requests generations (--concurrency at a time) through
+ContentRepurposerSLM against local fake Ollama servers. Each server
+generates --parallel requests at a time, like Ollama's OLLAMA_NUM_PARALLEL,
+so one server is a bottleneck under load.
+
+- fast:   model in memory, answers quickly
+- slow:   model in memory, 3x slower
+- cold:   model pulled but not in memory; the first request pays a load delay
+- broken: answers everything with 503
+
+It compares a single server with the pool under each routing strategy,
+printing how requests were spread, and checks that the broken server is
+ejected by its circuit breaker and rejoins once it recovers.
+
+Usage:
+    python -m benchmarks.bench_ollama_pool [--requests 80] [--concurrency 6] [--parallel 2] [--delay 0.05]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeOllama
+from ollama_pool import LATENCY_WEIGHTED, LEAST_OUTSTANDING, OllamaPool
+from slm_service import ContentRepurposerSLM
+
+
+MODEL = 'llama3.2'
+
+
+async def _generate(slm: ContentRepurposerSLM, requests: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(i: int):
+        nonlocal failed
+        async with slots:
+            try:
+                await slm._call_ollama(f"Post {i}")
+            except Exception:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    return {'elapsed': elapsed, 'failed': failed, 'per_second': (requests - failed) / elapsed}
+
+
+async def _run(servers: dict, strategy: str, args) -> dict:
+    async with httpx.AsyncClient() as client:
+        pool = OllamaPool([server.base_url for server in servers.values()], client=client,
+                          strategy=strategy, reset_timeout=0.5, health_interval=0.2)
+        slm = ContentRepurposerSLM(model_name=MODEL, client=client, check_connection=False, pool=pool)
+        await slm.check_health()
+        result = await _generate(slm, args.requests, args.concurrency)
+
+        # Bring the broken server back; health checks should return it to rotation
+        broken = servers.get('broken')
+        if broken is not None:
+            broken.failing = False
+            await asyncio.sleep(0.5)
+            before = broken.request_count
+            recovery = await _generate(slm, args.requests, args.concurrency)
+            result['recovered_requests'] = broken.request_count - before
+            result['recovery_failed'] = recovery['failed']
+            broken.failing = True
+
+        names = {server.base_url: name for name, server in servers.items()}
+        result['nodes'] = {names[url]: stats for url, stats in pool.stats().items()}
+        await slm.aclose()
+        return result
+
+
+def _servers(delay: float, parallel: int) -> dict:
+    servers = {
+        'fast': FakeOllama(delay=delay, parallel=parallel),
+        'slow': FakeOllama(delay=delay * 3, parallel=parallel),
+        'cold': FakeOllama(delay=delay, loaded=(), load_delay=delay * 10, parallel=parallel),
+        'broken': FakeOllama(delay=delay, parallel=parallel)
+    }
+    servers['broken'].failing = True
+    for server in servers.values():
+        server.start()
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=80)
+    parser.add_argument('--concurrency', type=int, default=6)
+    parser.add_argument('--parallel', type=int, default=2, help="requests each server generates at once")
+    parser.add_argument('--delay', type=float, default=0.05, help="seconds per request on the fast server")
+    args = parser.parse_args()
+
+    results = {}
+    with FakeOllama(delay=args.delay, parallel=args.parallel) as single:
+        results['single'] = asyncio.run(_run({'fast': single}, LEAST_OUTSTANDING, args))
+    for strategy in (LEAST_OUTSTANDING, LATENCY_WEIGHTED):
+        servers = _servers(args.delay, args.parallel)
+        try:
+            results[strategy] = asyncio.run(_run(servers, strategy, args))
+        finally:
+            for server in servers.values():
+                server.stop()
+
+    print(f"{'routing':<19}{'failed':>7}{'seconds':>9}{'req/s':>8}   requests per server")
+    for name, result in results.items():
+        spread = ', '.join(f"{node}={stats['requests']}" for node, stats in result['nodes'].items())
+        print(f"{name:<19}{result['failed']:>7}{result['elapsed']:>9.2f}{result['per_second']:>8.1f}   {spread}")
+
+    for strategy in (LEAST_OUTSTANDING, LATENCY_WEIGHTED):
+        result = results[strategy]
+        nodes = result['nodes']
+        print(f"{strategy}: broken server errors={nodes['broken']['errors']}, "
+              f"requests after recovery={result['recovered_requests']}")
+        if result['failed'] or result['recovery_failed']:
+            raise SystemExit(f"FAIL: {strategy} routing lost requests despite healthy servers")
+        if nodes['broken']['errors'] > 1 + result['elapsed'] / 0.5:
+            raise SystemExit(f"FAIL: {strategy} routing kept sending traffic to the broken server")
+        if not result['recovered_requests']:
+            raise SystemExit(f"FAIL: {strategy} routing never returned the recovered server to rotation")
+        if nodes['fast']['requests'] <= nodes['slow']['requests']:
+            raise SystemExit(f"FAIL: {strategy} routing did not favour the faster server")
+        if result['per_second'] <= results['single']['per_second']:
+            raise SystemExit(f"FAIL: {strategy} routing was no faster than a single server")
+    print("PASS: the pool outran one server, ejected the broken one and favoured fast, warm servers")
+
+
+if __name__ == "__main__":
+    main()
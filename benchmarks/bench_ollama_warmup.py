@@ -0,0 +1,93 @@
+"""
+Cold-start latency with and without Ollama keep-alive and warm-up
+
+Sends bursts of generations separated by idle gaps longer than the fake
+Ollama server's default keep-alive, so a model that isn't kept in memory
+is unloaded between bursts and the next request pays --load-delay again.
+Compares:
+
+- baseline:   no keep_alive on requests, no warm-up (the old behaviour)
+- keep-alive: OLLAMA_KEEP_ALIVE sent with each request, plus a startup warm-up
+- keep-warm:  a keep_alive shorter than the gaps, kept resident by
+              periodic keep-warm reloads instead
+
+Usage:
+    python -m benchmarks.bench_ollama_warmup [--bursts 4] [--burst-size 5] [--gap 1.2] [--load-delay 0.5]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import config
+from benchmarks.fakes import FakeOllama
+from slm_service import ContentRepurposerSLM
+
+
+async def _run(mode: str, args) -> dict:
+    fake = FakeOllama(delay=0.02, loaded=(), load_delay=args.load_delay, keep_alive=args.gap * 0.8).start()
+    try:
+        async with httpx.AsyncClient() as client:
+            slm = ContentRepurposerSLM(base_url=fake.base_url, client=client, check_connection=False)
+            if mode == 'baseline':
+                slm.keep_alive = None
+            elif mode == 'keep-alive':
+                slm.keep_alive = config.OLLAMA_KEEP_ALIVE
+                await slm.warm_up()
+            else:
+                slm.keep_alive = f"{args.gap * 0.5}s"
+                await slm.warm_up()
+                slm.start_keep_warm(args.gap * 0.2)
+
+            latencies = []
+
+            async def one(i: int):
+                start = time.perf_counter()
+                await slm._call_ollama(f"Post {i}")
+                latencies.append(time.perf_counter() - start)
+
+            for burst in range(args.bursts):
+                await asyncio.sleep(args.gap)
+                await asyncio.gather(*[one(burst * args.burst_size + i) for i in range(args.burst_size)])
+
+            await slm.aclose()
+            latencies.sort()
+            return {
+                'p50': statistics.median(latencies),
+                'p95': latencies[int(len(latencies) * 0.95) - 1],
+                'max': latencies[-1],
+                'loads': fake.loads,
+                'timings': slm.timing_stats()
+            }
+    finally:
+        fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bursts', type=int, default=4)
+    parser.add_argument('--burst-size', type=int, default=5)
+    parser.add_argument('--gap', type=float, default=1.2, help="idle seconds before each burst")
+    parser.add_argument('--load-delay', type=float, default=0.5, help="seconds the fake takes to load the model")
+    args = parser.parse_args()
+
+    results = {mode: asyncio.run(_run(mode, args)) for mode in ('baseline', 'keep-alive', 'keep-warm')}
+
+    print(f"{'mode':<12}{'p50 ms':>8}{'p95 ms':>8}{'max ms':>8}{'loads':>7}{'load s in requests':>20}{'warm-ups':>10}")
+    for mode, result in results.items():
+        timings = result['timings']
+        print(f"{mode:<12}{result['p50'] * 1000:>8.0f}{result['p95'] * 1000:>8.0f}{result['max'] * 1000:>8.0f}"
+              f"{result['loads']:>7}{timings['load_seconds']:>20.2f}{timings['warm_ups']:>10}")
+
+    for mode in ('keep-alive', 'keep-warm'):
+        if results[mode]['timings']['load_seconds'] >= config.OLLAMA_COLD_LOAD_SECONDS:
+            raise SystemExit(f"FAIL: {mode} requests still paid for model loads")
+        if results[mode]['max'] >= results['baseline']['max']:
+            raise SystemExit(f"FAIL: {mode} did not remove the cold-start spike")
+    print("PASS: warm-up and keep-alive kept model loads out of the request path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Single-call vs parallel per-variation generation, per backend
+
+Runs each backend against a local fake whose response time grows with the
+number of output tokens, so the single three-variation completion pays for
+every token in sequence while parallel mode pays roughly for one post.
+Reports wall time for all variations, time to the first variation and the
+tokens billed (input tokens grow in parallel mode: the source is sent once
+per style).
+
+Usage:
+    python -m benchmarks.bench_parallel [--delay 0.2] [--token-delay 0.02] [--runs 3]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeAnthropic, FakeOllama
+from llm_service import ContentRepurposer
+from slm_service import ContentRepurposerSLM
+
+
+CONTENT = "Shipping small changes every day beats one big release a quarter. " * 5
+
+
+async def _time_mode(repurposer, runs: int) -> dict:
+    single, parallel, first = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await repurposer.generate_linkedin_posts(CONTENT, 'twitter', 'bench')
+        single.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        posts = await repurposer.generate_linkedin_posts(CONTENT, 'twitter', 'bench', parallel=True)
+        parallel.append(time.perf_counter() - start)
+        assert len(posts) == 3 and all(posts), posts
+
+        start = time.perf_counter()
+        async for _number, _post in repurposer.variations_as_completed(CONTENT, 'twitter', 'bench'):
+            first.append(time.perf_counter() - start)
+            break
+    return {
+        'single': statistics.median(single),
+        'parallel': statistics.median(parallel),
+        'first': statistics.median(first)
+    }
+
+
+async def bench_ollama(delay: float, token_delay: float, runs: int) -> dict:
+    with FakeOllama(delay=delay, token_delay=token_delay) as ollama:
+        async with httpx.AsyncClient() as client:
+            repurposer = ContentRepurposerSLM(base_url=ollama.base_url, client=client, check_connection=False)
+            return await _time_mode(repurposer, runs)
+
+
+async def bench_claude(delay: float, token_delay: float, runs: int) -> dict:
+    with FakeAnthropic(delay=delay, token_delay=token_delay) as anthropic_api:
+        repurposer = ContentRepurposer(api_key='offline', base_url=anthropic_api.base_url)
+        try:
+            result = await _time_mode(repurposer, runs)
+        finally:
+            await repurposer.aclose()
+        result['usage'] = repurposer.usage_stats()
+        return result
+
+
+def _report(name: str, result: dict):
+    print(f"{name}:")
+    print(f"  single call:        {result['single']:.3f}s")
+    print(f"  parallel (all 3):   {result['parallel']:.3f}s  ({result['single'] / result['parallel']:.2f}x)")
+    print(f"  first variation:    {result['first']:.3f}s")
+    usage = result.get('usage')
+    if usage:
+        print(f"  tokens billed:      {usage['input_tokens']} in / {usage['output_tokens']} out "
+              f"over {usage['requests']} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=0.2, help='fake time to first token (seconds)')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='fake seconds per output token')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    ollama = asyncio.run(bench_ollama(args.delay, args.token_delay, args.runs))
+    claude = asyncio.run(bench_claude(args.delay, args.token_delay, args.runs))
+    _report("Ollama", ollama)
+    _report("Claude", claude)
+
+    if ollama['parallel'] >= ollama['single'] or claude['parallel'] >= claude['single']:
+        raise SystemExit("FAIL: parallel mode was not faster than a single call")
+    print("PASS: parallel mode finished all variations sooner than a single call")
+
+
+if __name__ == "__main__":
+    main()
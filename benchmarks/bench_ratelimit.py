@@ -0,0 +1,108 @@
+"""
+Scrape throughput against a rate-limiting server, with and without the limiter
+
+Scrapes distinct Reddit URLs through ContentScraper while a local fake
+Reddit allows only --server-rate requests per second and answers the rest
+with 429 + Retry-After. Compares:
+
+- unlimited: no client-side limiting; a 429 fails the scrape
+- config:    the reddit policy from config.PLATFORMS
+- adaptive:  a policy starting well above the server's limit, which has to
+             back off (AIMD) to the rate the server accepts
+
+Usage:
+    python -m benchmarks.bench_ratelimit [--items 60] [--server-rate 10] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import config
+from benchmarks.fakes import FakeReddit
+from ratelimit import RateLimiter
+from scraper import ContentScraper
+
+
+class _RedirectTransport(httpx.AsyncBaseTransport):
+    """Sends every request to the fake server, keeping the original host for the limiter"""
+
+    def __init__(self, base_url: str):
+        self._target = httpx.URL(base_url)
+        self._transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme=self._target.scheme, host=self._target.host,
+                                            port=self._target.port)
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _limiters(server_rate: float):
+    reddit = dict(config.PLATFORMS['reddit'])
+    aggressive = dict(reddit, rate_limit={
+        'rate': server_rate * 4, 'max_rate': server_rate * 4, 'burst': 10,
+        'concurrency': 16, 'max_concurrency': 16
+    })
+    return {
+        'unlimited': RateLimiter(platforms={}, default=None),
+        'config': RateLimiter(platforms={'reddit': reddit}),
+        'adaptive': RateLimiter(platforms={'reddit': aggressive})
+    }
+
+
+async def _run(name: str, limiter: RateLimiter, items: int, server_rate: float, concurrency: int) -> dict:
+    with FakeReddit(rate=server_rate, burst=int(server_rate), retry_after=1) as reddit:
+        client = httpx.AsyncClient(transport=_RedirectTransport(reddit.base_url))
+        scraper = ContentScraper(client=client, rate_limiter=limiter)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def scrape(i: int):
+            async with slots:
+                return await scraper.scrape(f"https://www.reddit.com/r/bench/comments/{name}{i}/post/")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[scrape(i) for i in range(items)])
+        elapsed = time.perf_counter() - start
+        await client.aclose()
+        succeeded = sum(not result['error'] for result in results)
+        return {
+            'succeeded': succeeded,
+            'failed': items - succeeded,
+            'requests': reddit.request_count,
+            'rejected': reddit.rejected,
+            'elapsed': elapsed,
+            'goodput': succeeded / elapsed,
+            'limits': limiter.stats().get('www.reddit.com')
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=60)
+    parser.add_argument('--server-rate', type=float, default=10.0, help='requests per second the fake accepts')
+    parser.add_argument('--concurrency', type=int, default=16, help='scrapes in flight (like a batch)')
+    args = parser.parse_args()
+
+    results = {}
+    for name, limiter in _limiters(args.server_rate).items():
+        results[name] = asyncio.run(_run(name, limiter, args.items, args.server_rate, args.concurrency))
+
+    print(f"{'mode':<11}{'ok':>5}{'failed':>8}{'requests':>10}{'429s':>7}{'seconds':>9}{'ok/s':>7}")
+    for name, result in results.items():
+        print(f"{name:<11}{result['succeeded']:>5}{result['failed']:>8}{result['requests']:>10}"
+              f"{result['rejected']:>7}{result['elapsed']:>9.2f}{result['goodput']:>7.2f}")
+        if result['limits']:
+            print(f"{'':<11}final limits: {result['limits']}")
+
+    adaptive = results['adaptive']
+    if adaptive['failed'] or adaptive['rejected'] >= results['unlimited']['rejected']:
+        raise SystemExit("FAIL: the adaptive limiter did not avoid the server's rate limit")
+    print("PASS: adaptive limiting completed every scrape with fewer 429s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Tracing overhead and trace integrity
+
+Two parts:
+
+- micro: nanoseconds per span() block with tracing off, against an empty
+  loop, and with tracing on but spans discarded (the cost of creating and
+  finishing a span, without any export)
+- end-to-end: generation requests through the app against a fake Ollama
+  server with tracing off, exporting to a file, and exporting to a fake
+  OTLP collector. The collector's spans are then checked: one trace per
+  request, every parent span present, the request id on every span and in
+  the response, and the trace carried to Ollama in a traceparent header.
+
+Fails if a disabled span costs more than --max-disabled-ns.
+
+Usage:
+    python -m benchmarks.bench_tracing [--spans 200000] [--requests 50] [--delay 0.02]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+import config
+import tracing
+from benchmarks.fakes import FakeCollector, FakeOllama
+
+
+class _Discard(tracing.Exporter):
+    def export(self, span):
+        pass
+
+
+def _per_iteration_ns(body, iterations: int) -> float:
+    start = time.perf_counter_ns()
+    body(iterations)
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def _empty(n: int):
+    for _ in range(n):
+        pass
+
+
+def _spans(n: int):
+    for _ in range(n):
+        with tracing.span('bench', key='value'):
+            pass
+
+
+@tracing.traced('bench')
+def _decorated():
+    pass
+
+
+def _calls(n: int):
+    for _ in range(n):
+        _decorated()
+
+
+def micro(iterations: int) -> dict:
+    tracing.configure(enabled=False)
+    results = {
+        'empty loop': _per_iteration_ns(_empty, iterations),
+        'span, off': _per_iteration_ns(_spans, iterations),
+        'traced(), off': _per_iteration_ns(_calls, iterations)
+    }
+    tracing._tracer = tracing.Tracer(_Discard())
+    results['span, on'] = _per_iteration_ns(_spans, iterations)
+    results['traced(), on'] = _per_iteration_ns(_calls, iterations)
+    tracing.configure(enabled=False)
+    return results
+
+
+def check_traces(spans: list, request_ids: set, traceparents: list) -> list:
+    """Problems found in the exported spans (empty if none)"""
+    problems = []
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span['traceId']].append(span)
+    if len(traces) != len(request_ids):
+        problems.append(f"{len(traces)} traces for {len(request_ids)} requests")
+    for trace_id, members in traces.items():
+        ids = {span['spanId'] for span in members}
+        roots = [span for span in members if 'parentSpanId' not in span]
+        if len(roots) != 1:
+            problems.append(f"trace {trace_id} has {len(roots)} root spans")
+        if any(span.get('parentSpanId', next(iter(ids))) not in ids for span in members):
+            problems.append(f"trace {trace_id} has spans whose parent was not exported")
+        request_id = {attribute['value']['stringValue'] for span in members
+                      for attribute in span['attributes'] if attribute['key'] == 'request.id'}
+        if len(request_id) != 1 or not request_id <= request_ids:
+            problems.append(f"trace {trace_id} has request ids {request_id}")
+        names = {span['name'] for span in members}
+        for name in ('prompt', 'model.call', 'parse'):
+            if name not in names:
+                problems.append(f"trace {trace_id} has no {name} span")
+    sent = {value.split('-')[1] for value in traceparents}
+    if sent != set(traces):
+        problems.append("traceparent headers sent to Ollama don't match the exported traces")
+    return problems
+
+
+async def _requests(client: httpx.AsyncClient, form: dict, count: int) -> tuple:
+    latencies, request_ids = [], set()
+
+    async def one():
+        start = time.perf_counter()
+        response = await client.post('/api/scrape-and-generate', data=form)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        request_ids.add(response.headers['x-request-id'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(count)])
+    return time.perf_counter() - start, sorted(latencies), request_ids
+
+
+async def end_to_end(args) -> dict:
+    config.OLLAMA_PRELOAD_MODELS = []
+    import main
+
+    results = {}
+    with FakeOllama(delay=args.delay) as ollama, FakeCollector() as collector, \
+            tempfile.TemporaryDirectory() as tmp:
+        form = {
+            'manual_content': 'Just learned that 80% of bugs come from 20% of code.',
+            'platform': 'twitter',
+            'model_type': 'slm',
+            'base_url': ollama.base_url,
+            'fresh': 'true'
+        }
+        path = os.path.join(tmp, 'traces.jsonl')
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app), \
+                httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+            await _requests(client, form, 5)  # warm-up
+            for mode in ('off', 'file', 'collector'):
+                tracing.configure(enabled=mode != 'off', exporter=mode, path=path, endpoint=collector.endpoint)
+                ollama.traceparents.clear()
+                wall, latencies, request_ids = await _requests(client, form, args.requests)
+                await tracing.shutdown()
+                results[mode] = {
+                    'wall': wall,
+                    'p50': statistics.median(latencies),
+                    'p95': latencies[int(len(latencies) * 0.95) - 1],
+                    'request_ids': request_ids,
+                    'traceparents': list(ollama.traceparents)
+                }
+        with open(path, encoding='utf-8') as f:
+            results['file']['exported'] = sum(1 for _ in f)
+        results['collector']['exported'] = len(collector.spans)
+        results['collector']['problems'] = check_traces(
+            collector.spans, results['collector']['request_ids'], results['collector']['traceparents'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--spans', type=int, default=200000, help="iterations of the microbenchmark")
+    parser.add_argument('--requests', type=int, default=50, help="requests per end-to-end mode")
+    parser.add_argument('--delay', type=float, default=0.02, help="seconds the fake model takes per generation")
+    parser.add_argument('--max-disabled-ns', type=float, default=1000)
+    args = parser.parse_args()
+
+    timings = micro(args.spans)
+    print(f"{'block':<16}{'ns':>8}")
+    for name, ns in timings.items():
+        print(f"{name:<16}{ns:>8.0f}")
+
+    results = asyncio.run(end_to_end(args))
+    print(f"\n{'tracing':<12}{'wall s':>8}{'p50 ms':>8}{'p95 ms':>8}{'spans':>7}")
+    for mode, result in results.items():
+        print(f"{mode:<12}{result['wall']:>8.2f}{result['p50'] * 1000:>8.1f}{result['p95'] * 1000:>8.1f}"
+              f"{result.get('exported', 0):>7}")
+
+    disabled = timings['span, off'] - timings['empty loop']
+    if disabled > args.max_disabled_ns:
+        raise SystemExit(f"FAIL: a disabled span costs {disabled:.0f} ns")
+    if results['off']['traceparents']:
+        raise SystemExit("FAIL: traceparent headers were sent with tracing off")
+    problems = results['collector']['problems']
+    if problems:
+        raise SystemExit("FAIL: " + "; ".join(problems[:5]))
+    print(f"PASS: a disabled span costs {disabled:.0f} ns, and every request exported one complete trace")
+
+
+if __name__ == "__main__":
+    main()
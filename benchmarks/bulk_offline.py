@@ -0,0 +1,68 @@
+"""
+Offline end-to-end check of the Message Batches bulk mode
+
+Runs batch.run_bulk() against a local fake Anthropic server: items are
+submitted as one batch, polled until it ends, and results are mapped back
+to their inputs by custom id.
+
+Usage:
+    python -m benchmarks.bulk_offline [--items 50]
+"""
+import argparse
+import asyncio
+import time
+
+from batch import run_bulk
+from benchmarks.fakes import FakeAnthropic
+from llm_service import ContentRepurposer
+from scraper import ContentScraper
+
+
+async def run_bulk_offline(num_items: int) -> dict:
+    items = [{'id': f"post-{i}", 'content': f"Post number {i} about shipping software"} for i in range(num_items)]
+    # One item with an injected upstream failure and one that fails to scrape
+    items.append({'id': 'bad', 'content': 'FAIL this one'})
+    items.append({'id': 'unsupported', 'url': 'ftp://example.com/not-a-social-post'})  # no adapter, so no lookup
+
+    with FakeAnthropic(batch_delay=0.5) as anthropic_api:
+        repurposer = ContentRepurposer(api_key='offline', base_url=anthropic_api.base_url)
+        scraper = ContentScraper()
+        start = time.perf_counter()
+        results = [result async for result in run_bulk(items, scraper, repurposer, poll_interval=0.1)]
+        elapsed = time.perf_counter() - start
+        await scraper.aclose()
+        await repurposer.aclose()
+        upstream_calls = anthropic_api.request_count
+
+    by_id = {result['id']: result for result in results}
+    mapped = all(
+        by_id[item['id']]['posts'] and by_id[item['id']]['index'] == index
+        for index, item in enumerate(items[:num_items])
+    )
+    return {
+        'items': len(items),
+        'results': len(results),
+        'mapped': mapped,
+        'errors': {result['id']: result['error'] for result in results if result['error']},
+        'upstream_calls': upstream_calls,
+        'elapsed': elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50, help='number of good items to submit')
+    args = parser.parse_args()
+
+    result = asyncio.run(run_bulk_offline(args.items))
+    print(f"Items:          {result['items']} -> {result['results']} results in {result['elapsed']:.2f}s")
+    print(f"Upstream calls: {result['upstream_calls']} (create + polls + results)")
+    print(f"Errors:         {result['errors']}")
+
+    if result['results'] != result['items'] or not result['mapped'] or set(result['errors']) != {'bad', 'unsupported'}:
+        raise SystemExit("FAIL: results were not mapped back to their inputs")
+    print("PASS: every result mapped back to its input")
+
+
+if __name__ == "__main__":
+    main()
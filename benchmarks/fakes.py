@@ -0,0 +1,667 @@
+"""
+Local stand-ins for upstream services used by the benchmarks
+"""
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+import httpx
+
+import config
+
+
+SAMPLE_COMPLETION = "\n\n".join(
+    f"VARIATION {i}:\nSample LinkedIn post number {i}.\n\nWhat do you think?\n\n#Benchmark #Testing"
+    for i in range(1, 4)
+)
+
+# What a single-style request (parallel mode) gets back
+SAMPLE_POST = "Sample LinkedIn post.\n\nWhat do you think?\n\n#Benchmark #Testing"
+
+
+# Fields of a structured post, long enough to pass validation
+SAMPLE_FIELDS = {
+    'hook': "Sample LinkedIn post.",
+    'body': " ".join(["Sample body text for a structured LinkedIn post."] * 10) + "\n\nWhat do you think?",
+    'hashtags': ["#Benchmark", "#Testing"]
+}
+
+
+def structured_for(schema: Dict) -> Dict:
+    """An object following a structured-output schema: every variation, or the requested post fields"""
+    properties = schema.get('properties', {})
+    if 'variations' in properties:
+        styles = properties['variations']['items']['properties']['style']['enum']
+        return {'variations': [dict(SAMPLE_FIELDS, style=style) for style in styles]}
+    return {name: SAMPLE_FIELDS[name] for name in properties if name in SAMPLE_FIELDS}
+
+
+def completion_for(payload: Dict) -> str:
+    """Answer all three variations only when the request asked for the VARIATION format"""
+    if isinstance(payload.get('format'), dict):
+        return json.dumps(structured_for(payload['format']))
+    return SAMPLE_COMPLETION if 'VARIATION 1:' in json.dumps(payload) else SAMPLE_POST
+
+
+def tokenize(text: str):
+    """Split text into word-sized tokens, keeping the whitespace"""
+    return re.findall(r'\S+\s*', text)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Ignores clients that hang up mid-response"""
+    
+    daemon_threads = True
+    request_queue_size = 128  # the default of 5 drops connects under load
+    
+    def handle_error(self, request, client_address):
+        pass
+
+
+class FakeServer:
+    """
+    Threaded HTTP server running in the background on a free local port
+    
+    Set `failure_rate` to answer that share of requests with an injected
+    server error (which one depends on the fake).
+    """
+    
+    handler_class = BaseHTTPRequestHandler
+    
+    def __init__(self, delay: float = 0.0):
+        """
+        Args:
+            delay: Seconds to sleep before answering each request
+        """
+        self.delay = delay
+        self.request_count = 0
+        self.failure_rate = 0.0
+        self.injected_failures = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def _make_handler(self):
+        fake = self
+        
+        class Handler(self.handler_class):
+            server_fake = fake
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+    
+    def should_fail(self) -> bool:
+        """Whether to inject a failure into this request"""
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            if self._random.random() >= self.failure_rate:
+                return False
+            self.injected_failures += 1
+            return True
+    
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """Request handler with small JSON helpers"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+    
+    def send_json(self, payload, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _OllamaHandler(_JSONHandler):
+    
+    def do_GET(self):
+        fake = self.server_fake
+        if fake.failing:
+            self.send_json({'error': 'server unavailable'}, status=503)
+        elif self.path == '/api/tags':
+            self.send_json({'models': [{'name': name} for name in fake.models]})
+        elif self.path == '/api/ps':
+            self.send_json({'models': [{'name': name} for name in fake.in_memory()]})
+        else:
+            self.send_json({'error': 'not found'}, status=404)
+    
+    def do_POST(self):
+        fake = self.server_fake
+        fake.count_request()
+        payload = self.read_json()
+        if self.headers.get('traceparent'):
+            fake.traceparents.append(self.headers['traceparent'])
+        if fake.failing:
+            self.send_json({'error': 'server unavailable'}, status=503)
+            return
+        if fake.should_fail():
+            self.send_json({'error': 'injected failure'}, status=500)
+            return
+        model = payload.get('model', '')
+        keep_alive = payload.get('keep_alive')
+        
+        if not payload.get('prompt'):
+            # Load-only request
+            load = fake.load(model, keep_alive)
+            time.sleep(load)
+            self.send_json({'model': model, 'response': '', 'done': True, 'done_reason': 'load',
+                            'load_duration': int(load * 1e9)})
+            return
+        
+        completion = completion_for(payload)
+        tokens = len(tokenize(completion))
+        
+        if not payload.get('stream', True):
+            with fake.slot():
+                load = fake.load(model, keep_alive)
+                time.sleep(fake.delay + load)
+                # Decoding time still scales with output length
+                time.sleep(fake.token_delay * tokens)
+            self.send_json(dict(fake.durations(payload, load, tokens), model=model, response=completion))
+            return
+        load = fake.load(model, keep_alive)
+        time.sleep(fake.delay + load)
+        
+        # Newline-delimited JSON, one token per line, until the connection closes
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for token in tokenize(completion):
+            line = json.dumps({'model': payload.get('model'), 'response': token, 'done': False})
+            self.wfile.write(line.encode() + b'\n')
+            self.wfile.flush()
+            time.sleep(fake.token_delay)
+        final = dict(fake.durations(payload, load, tokens), model=model, response='')
+        self.wfile.write(json.dumps(final).encode() + b'\n')
+        self.close_connection = True
+
+
+class FakeOllama(FakeServer):
+    """Ollama stand-in that answers /api/generate after a fixed delay"""
+    
+    handler_class = _OllamaHandler
+    
+    def __init__(self, delay: float = 0.0, token_delay: float = 0.0,
+                 models=('llama3.2:latest',), loaded=('llama3.2:latest',), load_delay: float = 0.0,
+                 parallel: Optional[int] = None, keep_alive: float = 300.0):
+        """
+        Args:
+            delay: Seconds before the first token
+            token_delay: Seconds per generated token
+            models: Models pulled (listed by /api/tags)
+            loaded: Models already in memory (listed by /api/ps)
+            load_delay: Extra seconds for the first request to a model not in memory
+            parallel: Non-streaming requests generated at once (like OLLAMA_NUM_PARALLEL); unlimited if None
+            keep_alive: Seconds a model stays in memory after a request that doesn't set keep_alive
+        """
+        super().__init__(delay=delay)
+        self.token_delay = token_delay
+        self.models = list(models)
+        self.keep_alive = keep_alive
+        self.loaded = {self._name(model): float('inf') for model in loaded}  # model -> unload time
+        self.load_delay = load_delay
+        self.loads = 0
+        self.failing = False  # answer everything with 503
+        self.traceparents = []  # traceparent headers received, in order
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+    
+    def slot(self):
+        """Wait for a generation slot"""
+        return self._slots if self._slots is not None else contextlib.nullcontext()
+    
+    @staticmethod
+    def _name(model: str) -> str:
+        return model if ':' in model else f"{model}:latest"
+    
+    @staticmethod
+    def _seconds(keep_alive) -> float:
+        """Ollama keep_alive: seconds, or a duration such as "30s", "5m" or "1h"; negative means forever"""
+        if isinstance(keep_alive, str):
+            units = {'s': 1, 'm': 60, 'h': 3600}
+            seconds = float(keep_alive[:-1]) * units[keep_alive[-1]] if keep_alive[-1] in units else float(keep_alive)
+        else:
+            seconds = float(keep_alive)
+        return float('inf') if seconds < 0 else seconds
+    
+    def in_memory(self):
+        now = time.monotonic()
+        with self._lock:
+            return sorted(name for name, until in self.loaded.items() if until > now)
+    
+    def load(self, model: str, keep_alive=None) -> float:
+        """
+        Seconds to load a model into memory (0 if it already is), restarting its keep-alive timer
+        """
+        name = self._name(model)
+        keep = self.keep_alive if keep_alive is None else self._seconds(keep_alive)
+        now = time.monotonic()
+        with self._lock:
+            cold = self.loaded.get(name, 0.0) <= now
+            self.loaded[name] = now + keep
+            if cold:
+                self.loads += 1
+            return self.load_delay if cold else 0.0
+    
+    def durations(self, payload: Dict, load: float, tokens: int) -> Dict:
+        """The timing fields of a final /api/generate response, in nanoseconds"""
+        return {
+            'done': True,
+            'load_duration': int(load * 1e9),
+            'prompt_eval_count': len(tokenize(payload.get('prompt', ''))),
+            'prompt_eval_duration': int(self.delay * 1e9),
+            'eval_count': tokens,
+            'eval_duration': int(self.token_delay * tokens * 1e9)
+        }
+
+
+class _RedditHandler(_JSONHandler):
+    
+    def do_GET(self):
+        fake = self.server_fake
+        fake.count_request()
+        time.sleep(fake.delay)
+        if fake.should_fail():
+            self.send_json({'message': 'Service Unavailable', 'error': 503}, status=503)
+            return
+        if not fake.take_token():
+            fake.rejected += 1
+            self.send_json({'message': 'Too Many Requests', 'error': 429}, status=429,
+                           headers={'Retry-After': str(fake.retry_after)})
+            return
+        post_id = self.path.split('?')[0].rstrip('/').split('/')[-2] if '/comments/' in self.path else 'post'
+        self.send_json([
+            {'kind': 'Listing', 'data': {'children': [{'kind': 't3', 'data': {
+                'title': f"Post {post_id}", 'selftext': 'Body text', 'author': 'someone'}}]}},
+            {'kind': 'Listing', 'data': {'children': []}}
+        ])
+
+
+class FakeReddit(FakeServer):
+    """
+    Reddit JSON stand-in enforcing a server-side rate limit
+    
+    Requests beyond `rate` per second (with bursts of `burst`) get a 429
+    with a Retry-After header, like Reddit's own limiter.
+    """
+    
+    handler_class = _RedditHandler
+    
+    def __init__(self, rate: float = 10.0, burst: int = 10, retry_after: int = 1, delay: float = 0.0):
+        super().__init__(delay=delay)
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+    
+    def take_token(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _fake_message(model: str, text: str) -> Dict:
+    return {
+        'id': f"msg_{uuid.uuid4().hex[:24]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': model,
+        'content': [{'type': 'text', 'text': text}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 400, 'output_tokens': len(text.split())}
+    }
+
+
+class _AnthropicHandler(_JSONHandler):
+    
+    def do_POST(self):
+        fake = self.server_fake
+        fake.count_request()
+        payload = self.read_json()
+        
+        if self.path == '/v1/messages':
+            if fake.should_fail():
+                self.send_json({'type': 'error', 'error': {'type': 'api_error', 'message': 'Injected failure'}},
+                               status=500)
+                return
+            completion = completion_for(payload)
+            if payload.get('stream'):
+                self.stream_message(payload, completion)
+                return
+            time.sleep(fake.delay + fake.token_delay * len(tokenize(completion)))
+            message = _fake_message(payload.get('model'), completion)
+            if payload.get('tools'):
+                # Structured output: answer with a call to the first tool
+                tool = payload['tools'][0]
+                message['content'] = [{'type': 'tool_use', 'id': f"toolu_{uuid.uuid4().hex[:24]}",
+                                       'name': tool['name'], 'input': structured_for(tool['input_schema'])}]
+                message['stop_reason'] = 'tool_use'
+            message['usage'].update(fake.prompt_cache_usage(payload))
+            self.send_json(message)
+        elif self.path == '/v1/messages/batches':
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+            fake.batches[batch_id] = {'created': time.time(), 'requests': payload['requests'], 'canceled': False}
+            self.send_json(fake.batch_status(batch_id, self.base_url()))
+        elif self.path.endswith('/cancel'):
+            batch_id = self.path.split('/')[-2]
+            fake.batches[batch_id]['canceled'] = True
+            self.send_json(fake.batch_status(batch_id, self.base_url()))
+        else:
+            self.send_json({'type': 'error', 'error': {'type': 'not_found_error', 'message': 'not found'}}, status=404)
+    
+    def stream_message(self, payload: Dict, completion: str):
+        """Server-sent events for a streamed message, one token per text delta"""
+        fake = self.server_fake
+        time.sleep(fake.delay)
+        message = _fake_message(payload.get('model'), '')
+        message['usage'].update(fake.prompt_cache_usage(payload), output_tokens=1)
+        message['content'] = []
+        message['stop_reason'] = None
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        
+        def event(kind: str, data: Dict):
+            self.wfile.write(f"event: {kind}\ndata: {json.dumps(dict(data, type=kind))}\n\n".encode())
+            self.wfile.flush()
+        
+        event('message_start', {'message': message})
+        event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        tokens = tokenize(completion)
+        for token in tokens:
+            event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': token}})
+            time.sleep(fake.token_delay)
+        event('content_block_stop', {'index': 0})
+        event('message_delta', {'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                'usage': {'output_tokens': len(tokens)}})
+        event('message_stop', {})
+        self.close_connection = True
+    
+    def do_GET(self):
+        fake = self.server_fake
+        fake.count_request()
+        parts = self.path.strip('/').split('/')
+        batch_id = parts[3] if len(parts) >= 4 else None
+        if batch_id not in fake.batches:
+            self.send_json({'type': 'error', 'error': {'type': 'not_found_error', 'message': 'not found'}}, status=404)
+        elif parts[-1] == 'results':
+            body = "".join(json.dumps(line) + "\n" for line in fake.batch_results(batch_id)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/binary')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(fake.batch_status(batch_id, self.base_url()))
+    
+    def base_url(self) -> str:
+        return self.server_fake.base_url
+
+
+class FakeAnthropic(FakeServer):
+    """
+    Anthropic API stand-in: Messages (plain and streamed) and Message Batches
+    
+    Batches report "ended" once `batch_delay` seconds have passed. Requests
+    whose prompt contains FAIL come back as errored results.
+    """
+    
+    handler_class = _AnthropicHandler
+    
+    def __init__(self, delay: float = 0.0, batch_delay: float = 0.5, token_delay: float = 0.0):
+        super().__init__(delay=delay)
+        self.batch_delay = batch_delay
+        self.token_delay = token_delay
+        self.batches: Dict[str, Dict] = {}
+        self.cached_prefixes = set()
+    
+    def prompt_cache_usage(self, payload: Dict) -> Dict[str, int]:
+        """
+        Mimic prompt caching: the prefix (tools, then system blocks) up to
+        each block marked with cache_control is cached once it reaches
+        config.PROMPT_CACHE_MIN_TOKENS; the longest one already cached is
+        read and the rest of the longest eligible one is written
+        """
+        system = payload.get('system')
+        if not isinstance(system, list):
+            return {}
+        prefixes = []
+        for index, block in enumerate(system):
+            if 'cache_control' in block:
+                prefix = {'tools': payload.get('tools'), 'system': system[:index + 1]}
+                # Roughly four characters per token
+                tokens = len(json.dumps(payload.get('tools') or [])) // 4 + sum(
+                    len(part.get('text', '')) // 4 for part in system[:index + 1]
+                )
+                if tokens >= config.PROMPT_CACHE_MIN_TOKENS:
+                    prefixes.append((json.dumps(prefix, sort_keys=True), tokens))
+        if not prefixes:
+            return {}
+        with self._lock:
+            read = max((tokens for key, tokens in prefixes if key in self.cached_prefixes), default=0)
+            self.cached_prefixes.update(key for key, _ in prefixes)
+        return {'cache_read_input_tokens': read, 'cache_creation_input_tokens': prefixes[-1][1] - read}
+    
+    def batch_status(self, batch_id: str, base_url: str) -> Dict:
+        batch = self.batches[batch_id]
+        ended = batch['canceled'] or time.time() - batch['created'] >= self.batch_delay
+        count = len(batch['requests'])
+        failures = sum('FAIL' in json.dumps(request['params']['messages']) for request in batch['requests'])
+        created = datetime.fromtimestamp(batch['created'], timezone.utc)
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else count,
+                'succeeded': count - failures if ended and not batch['canceled'] else 0,
+                'errored': failures if ended and not batch['canceled'] else 0,
+                'canceled': count if batch['canceled'] else 0,
+                'expired': 0
+            },
+            'created_at': created.isoformat(),
+            'expires_at': (created + timedelta(days=1)).isoformat(),
+            'ended_at': datetime.now(timezone.utc).isoformat() if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+    
+    def batch_results(self, batch_id: str):
+        batch = self.batches[batch_id]
+        for request in batch['requests']:
+            if batch['canceled']:
+                result = {'type': 'canceled'}
+            elif 'FAIL' in json.dumps(request['params']['messages']):
+                result = {
+                    'type': 'errored',
+                    'error': {'type': 'error', 'error': {'type': 'invalid_request_error', 'message': 'Injected failure'}}
+                }
+            else:
+                result = {'type': 'succeeded', 'message': _fake_message(request['params']['model'], SAMPLE_COMPLETION)}
+            yield {'custom_id': request['custom_id'], 'result': result}
+
+
+class _CollectorHandler(_JSONHandler):
+    
+    def do_POST(self):
+        fake = self.server_fake
+        fake.count_request()
+        payload = self.read_json()
+        time.sleep(fake.delay)
+        if self.path != '/v1/traces':
+            self.send_json({'error': 'not found'}, status=404)
+            return
+        with fake._lock:
+            for resource in payload.get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    fake.spans.extend(scope.get('spans', []))
+        self.send_json({'partialSuccess': {}})
+
+
+class FakeCollector(FakeServer):
+    """OTLP/HTTP JSON trace collector stand-in that keeps the spans it receives"""
+    
+    handler_class = _CollectorHandler
+    
+    def __init__(self, delay: float = 0.0):
+        super().__init__(delay=delay)
+        self.spans = []
+    
+    @property
+    def endpoint(self) -> str:
+        return f"{self.base_url}/v1/traces"
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        fake = self.server_fake
+        fake.count_request()
+        time.sleep(fake.delay)
+        if fake.should_fail():
+            status, body = 503, b'<html><body>Service Unavailable</body></html>'
+        else:
+            status, body = 200, fake.page(self.path).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakePages(FakeServer):
+    """HTML post pages; subclasses lay out the parts the scraper extracts"""
+    
+    handler_class = _PageHandler
+    
+    def __init__(self, delay: float = 0.0, padding: int = 50_000):
+        """
+        Args:
+            delay: Seconds before answering each request
+            padding: Bytes of markup after the post, like the rest of a real page
+        """
+        super().__init__(delay=delay)
+        self.padding = padding
+    
+    def filler(self) -> str:
+        return '<div class="timeline-item"><p>Another post in the feed.</p></div>' * (self.padding // 64)
+    
+    def page(self, path: str) -> str:
+        raise NotImplementedError
+
+
+class FakeNitter(FakePages):
+    """nitter.net tweet pages"""
+    
+    def page(self, path: str) -> str:
+        post_id = path.rstrip('/').split('/')[-1]
+        return (
+            f'<html><head><title>Tweet {post_id}</title></head><body>'
+            f'<div class="tweet-header"><a class="fullname" href="/someone">Some One</a></div>'
+            f'<div class="tweet-content media-body">Tweet {post_id}: shipping beats perfect. '
+            f'Most of what we planned changed once real users showed up.</div>'
+            f'{self.filler()}</body></html>'
+        )
+
+
+class FakeLinkedIn(FakePages):
+    """LinkedIn post pages, with the post in the Open Graph tags"""
+    
+    def page(self, path: str) -> str:
+        post_id = path.rstrip('/').split('/')[-1]
+        return (
+            f'<html><head><title>LinkedIn</title>'
+            f'<meta property="og:title" content="Some One on LinkedIn">'
+            f'<meta property="og:description" content="Post {post_id}: three lessons from a year of '
+            f'running a small platform team.">'
+            f'</head><body>{self.filler()}</body></html>'
+        )
+
+
+class RoutingTransport(httpx.AsyncBaseTransport):
+    """
+    Sends requests for the given hosts to local fakes
+    
+    The request keeps its Host header, so per-host pools, limits and stats
+    see the original host. Other requests go out unchanged.
+    """
+    
+    def __init__(self, routes: Dict[str, str], **transport_options):
+        """
+        Args:
+            routes: Host (or a parent domain of it) -> fake base URL
+            **transport_options: Passed to httpx.AsyncHTTPTransport
+        """
+        self.routes = {host: httpx.URL(base_url) for host, base_url in routes.items()}
+        self._transport = httpx.AsyncHTTPTransport(**transport_options)
+    
+    def _target(self, host: str) -> Optional[httpx.URL]:
+        while host:
+            if host in self.routes:
+                return self.routes[host]
+            host = host.partition('.')[2]
+        return None
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        target = self._target(request.url.host)
+        if target is not None:
+            request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+        return await self._transport.handle_async_request(request)
+    
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,99 @@
+"""
+Load test: concurrent /api/scrape-and-generate requests should overlap
+
+Fires N requests at the app against a fake Ollama server that takes
+DELAY seconds per generation. With a non-blocking request path the batch
+finishes in roughly one DELAY; a blocking path takes about N * DELAY.
+
+Usage:
+    python -m benchmarks.load_test [--requests 10] [--delay 1.0]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeOllama
+
+
+async def _timed_post(client: httpx.AsyncClient, path: str, data: dict):
+    start = time.perf_counter()
+    response = await client.post(path, data=data)
+    return start, time.perf_counter(), response.status_code
+
+
+async def run_load_test(num_requests: int, delay: float) -> dict:
+    """
+    Run the load test and return timing results
+    
+    Args:
+        num_requests: Number of concurrent generation requests
+        delay: Seconds the fake model takes per generation
+        
+    Returns:
+        Dictionary with wall time, serial time estimate and overlap factor
+    """
+    import main
+    
+    with FakeOllama(delay=delay) as ollama:
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app), \
+                httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+            form = {
+                'manual_content': 'Just learned that 80% of bugs come from 20% of code.',
+                'platform': 'twitter',
+                'model_type': 'slm',
+                'base_url': ollama.base_url,
+                'fresh': 'true'  # measure the model path, not the generation cache
+            }
+            
+            start = time.perf_counter()
+            results = await asyncio.gather(*[
+                _timed_post(client, '/api/scrape-and-generate', form)
+                for _ in range(num_requests)
+            ])
+            wall_time = time.perf_counter() - start
+            pool = (await client.get('/api/stats')).json()['http_pool']
+    
+    statuses = [status for _, _, status in results]
+    latencies = sorted(end - begin for begin, end, _ in results)
+    serial_time = num_requests * delay
+    
+    return {
+        'requests': num_requests,
+        'ok': statuses.count(200),
+        'wall_time': wall_time,
+        'serial_time': serial_time,
+        'overlap': serial_time / wall_time if wall_time else 0.0,
+        'max_latency': latencies[-1] if latencies else 0.0,
+        'upstream_calls': ollama.request_count,
+        'pool': pool
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=10, help='concurrent requests to send')
+    parser.add_argument('--delay', type=float, default=1.0, help='fake generation time in seconds')
+    args = parser.parse_args()
+    
+    result = asyncio.run(run_load_test(args.requests, args.delay))
+    
+    print(f"Requests:        {result['requests']} ({result['ok']} OK)")
+    print(f"Upstream calls:  {result['upstream_calls']}")
+    print(f"Wall time:       {result['wall_time']:.2f}s")
+    print(f"Serial estimate: {result['serial_time']:.2f}s")
+    print(f"Overlap factor:  {result['overlap']:.1f}x")
+    print(f"Connections:     {result['pool']['new_connections']} opened for "
+          f"{result['pool']['requests']} pooled requests ({result['pool']['reuse_ratio']:.0%} reused)")
+    
+    if result['ok'] != result['requests']:
+        raise SystemExit("FAIL: some requests did not succeed")
+    if result['wall_time'] > result['serial_time'] / 2:
+        raise SystemExit("FAIL: requests ran one after another")
+    print("PASS: requests overlapped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+End-to-end benchmark suite against local fakes of every upstream
+
+Starts fake Reddit, nitter, LinkedIn, Anthropic and Ollama servers, routes
+the app's outbound traffic to them, serves main.app with uvicorn on a local
+port, and drives it through a set of scenarios at a fixed concurrency:
+
+    generate-slm    manual content, Ollama
+    generate-llm    manual content, Claude
+    parallel-llm    manual content, Claude, one request per style
+    cached          the same content every time (generation cache hits)
+    reddit-slm      scrape a Reddit post (JSON), then Ollama
+    twitter-llm     scrape a tweet (nitter HTML), then Claude
+    linkedin-slm    scrape a LinkedIn post (HTML), then Ollama
+    stream-slm      /api/scrape-and-generate/stream, Ollama
+    stream-llm      /api/scrape-and-generate/stream, Claude
+    job-slm         POST /api/jobs, then long-poll the job
+    flaky-slm       reddit-slm with --flaky-rate of upstream requests failing
+
+Each scenario reports throughput, p50/p95/p99 latency, p50 time to the
+first response byte, error rate and process memory (RSS after the
+scenario, and the peak so far). Upstream latency is fixed by the fakes, so
+changes in these numbers come from the app's own request path.
+
+Results can be saved as a baseline (--save-baseline) and later runs
+compared against it; a run fails if a scenario's p50 or p95 got slower, or
+it lost throughput, failed more or used more memory than the tolerance
+allows. p99 is reported but not compared: at a hundred requests it is one
+sample. --repeat runs each scenario several times and keeps the median of
+each figure, which steadies a baseline. Baselines are only comparable on
+the same machine and settings.
+
+Scrape rate limits are lifted unless --real-rate-limits is given, since
+they would otherwise set the pace of the scrape scenarios.
+
+Usage:
+    python -m benchmarks.suite [--requests 100] [--concurrency 16] [--scenarios generate-slm,cached]
+    python -m benchmarks.suite --save-baseline
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+import config
+from benchmarks.fakes import FakeAnthropic, FakeLinkedIn, FakeNitter, FakeOllama, FakeReddit, RoutingTransport
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+CONTENT = 'Just learned that 80% of bugs come from 20% of code. Here is what we changed.'
+
+# Settings a baseline depends on; runs with other values aren't compared
+COMPARED_SETTINGS = ('requests', 'concurrency', 'latency', 'token_rate', 'scrape_latency', 'page_bytes',
+                     'failure_rate', 'flaky_rate', 'real_rate_limits')
+
+UNLIMITED = {'rate': 10000.0, 'max_rate': 10000.0, 'burst': 10000, 'concurrency': 256, 'max_concurrency': 256}
+
+
+class Scenario:
+    """A kind of request, repeated with a different item number each time"""
+
+    def __init__(self, name: str, form: Callable[[int], Dict[str, str]],
+                 path: str = '/api/scrape-and-generate', kind: str = 'json', flaky: bool = False,
+                 warm: bool = False):
+        """
+        Args:
+            name: Scenario name
+            form: Form fields for request number i
+            path: Endpoint
+            kind: "json", "stream" (SSE) or "job" (submit, then long-poll)
+            flaky: Inject --flaky-rate failures into the upstreams while it runs
+            warm: Send one request before measuring, e.g. to fill a cache
+        """
+        self.name = name
+        self.form = form
+        self.path = path
+        self.kind = kind
+        self.flaky = flaky
+        self.warm = warm
+
+
+def _manual(model_type: str, **extra) -> Callable[[int], Dict[str, str]]:
+    return lambda i: dict({'manual_content': f"{CONTENT} (#{i})", 'platform': 'twitter',
+                           'model_type': model_type, 'fresh': 'true'}, **extra)
+
+
+def _url(template: str, platform: str, model_type: str, prefix: str) -> Callable[[int], Dict[str, str]]:
+    # Distinct URLs per scenario and request, so each scrape misses the cache
+    return lambda i: {'url': template.format(f"{prefix}{i}"), 'platform': platform,
+                      'model_type': model_type, 'fresh': 'true'}
+
+
+REDDIT = 'https://www.reddit.com/r/programming/comments/{}/a_post/'
+TWEET = 'https://twitter.com/someone/status/{}'
+LINKEDIN = 'https://www.linkedin.com/posts/someone_{}'
+
+SCENARIOS = [
+    Scenario('generate-slm', _manual('slm')),
+    Scenario('generate-llm', _manual('llm')),
+    Scenario('parallel-llm', _manual('llm', parallel='true')),
+    Scenario('cached', lambda i: {'manual_content': CONTENT, 'platform': 'twitter', 'model_type': 'slm'},
+             warm=True),
+    Scenario('reddit-slm', _url(REDDIT, 'reddit', 'slm', 'r')),
+    Scenario('twitter-llm', _url(TWEET, 'twitter', 'llm', 't')),
+    Scenario('linkedin-slm', _url(LINKEDIN, 'linkedin', 'slm', 'l')),
+    Scenario('stream-slm', _manual('slm'), path='/api/scrape-and-generate/stream', kind='stream'),
+    Scenario('stream-llm', _manual('llm'), path='/api/scrape-and-generate/stream', kind='stream'),
+    Scenario('job-slm', _manual('slm'), path='/api/jobs', kind='job'),
+    Scenario('flaky-slm', _url(REDDIT, 'reddit', 'slm', 'f'), flaky=True),
+]
+
+
+def _memory() -> Dict[str, float]:
+    """Current and peak resident set size in MiB"""
+    found = {}
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    found[line[:5]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return {'rss_mb': found.get('VmRSS', 0.0), 'peak_mb': found.get('VmHWM', peak)}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(int(len(values) * q + 0.5) - 1, 0)]
+
+
+async def _one(client: httpx.AsyncClient, scenario: Scenario, i: int, extra: Dict[str, str]) -> tuple:
+    """Returns (seconds, seconds to the first byte, ok)"""
+    form = dict(scenario.form(i), **extra)
+    start = time.perf_counter()
+    first_byte = None
+    body = b''
+    async with client.stream('POST', scenario.path, data=form) as response:
+        async for chunk in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            body += chunk
+    status = response.status_code
+
+    if scenario.kind == 'job':
+        if status != 202:
+            return time.perf_counter() - start, first_byte or 0.0, False
+        job_id = json.loads(body)['job_id']
+        while True:
+            job = (await client.get(f"/api/jobs/{job_id}", params={'wait': config.JOB_WAIT_MAX})).json()
+            if job['status'] in ('succeeded', 'failed'):
+                break
+        return time.perf_counter() - start, first_byte, job['status'] == 'succeeded'
+
+    elapsed = time.perf_counter() - start
+    if status != 200:
+        return elapsed, first_byte or elapsed, False
+    if scenario.kind == 'stream':
+        return elapsed, first_byte, b'event: done' in body and b'event: error' not in body
+    return elapsed, first_byte, bool(json.loads(body).get('success'))
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, args, extra: Dict[str, str],
+                       first: int = 0) -> Dict:
+    """Send --requests requests, numbered from `first`, with --concurrency in flight and summarize them"""
+    samples = []
+    next_item = iter(range(first, first + args.requests))
+
+    async def worker():
+        for i in next_item:
+            samples.append(await _one(client, scenario, i, extra))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    wall = time.perf_counter() - start
+
+    latencies = sorted(sample[0] for sample in samples)
+    first_bytes = sorted(sample[1] for sample in samples)
+    return {
+        'requests': len(samples),
+        'throughput': len(samples) / wall,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'ttfb_p50_ms': statistics.median(first_bytes) * 1000,
+        'error_rate': sum(1 for sample in samples if not sample[2]) / len(samples),
+        **_memory()
+    }
+
+
+async def run_suite(scenarios: List[Scenario], args) -> Dict[str, Dict]:
+    token_delay = 1 / args.token_rate if args.token_rate else 0.0
+    fakes = {
+        'ollama': FakeOllama(delay=args.latency, token_delay=token_delay),
+        'anthropic': FakeAnthropic(delay=args.latency, token_delay=token_delay),
+        'reddit': FakeReddit(rate=1e6, burst=1000000, delay=args.scrape_latency),
+        'nitter': FakeNitter(delay=args.scrape_latency, padding=args.page_bytes),
+        'linkedin': FakeLinkedIn(delay=args.scrape_latency, padding=args.page_bytes)
+    }
+    for fake in fakes.values():
+        fake.failure_rate = args.failure_rate
+        fake.start()
+
+    # Before main is imported: settings read when the app starts
+    config.OLLAMA_PRELOAD_MODELS = []
+    config.GENERATION_CACHE_DB = None
+    config.JOB_STORE_DB = None
+    config.JOB_QUEUE_MAX_DEPTH = max(config.JOB_QUEUE_MAX_DEPTH, args.requests)
+    if not args.real_rate_limits:
+        for platform in config.PLATFORMS.values():
+            platform['rate_limit'] = dict(UNLIMITED)
+    os.environ['ANTHROPIC_BASE_URL'] = fakes['anthropic'].base_url
+    import http_client
+    import main
+
+    routes = {'reddit.com': fakes['reddit'].base_url, 'nitter.net': fakes['nitter'].base_url,
+              'linkedin.com': fakes['linkedin'].base_url}
+    main.create_http_client = functools.partial(
+        http_client.create_http_client,
+        transport=RoutingTransport(routes, limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+        ))
+    )
+    extra = {'api_key': 'benchmark', 'base_url': fakes['ollama'].base_url}
+
+    results = {}
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=0, log_level='warning'))
+    serving = asyncio.ensure_future(server.serve())
+    try:
+        while not server.started:
+            if serving.done():
+                serving.result()
+                raise RuntimeError("uvicorn exited before starting")
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            # Warm up: imports, connections, backend clients
+            await run_scenario(client, SCENARIOS[0], argparse.Namespace(requests=args.concurrency,
+                                                                        concurrency=args.concurrency), extra)
+            for scenario in scenarios:
+                if scenario.warm:
+                    await _one(client, scenario, -1, extra)
+                if scenario.flaky:
+                    for fake in fakes.values():
+                        fake.failure_rate = args.flaky_rate
+                runs = [await run_scenario(client, scenario, args, extra, first=repeat * args.requests)
+                        for repeat in range(args.repeat)]
+                results[scenario.name] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                if scenario.flaky:
+                    for fake in fakes.values():
+                        fake.failure_rate = args.failure_rate
+    finally:
+        server.should_exit = True
+        await serving
+        for fake in fakes.values():
+            fake.stop()
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float,
+            slack_ms: float, memory_slack_mb: float) -> List[str]:
+    """Regressions of `results` against `baseline` (empty if none)"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            limit = base[key] * (1 + tolerance) + slack_ms
+            if result[key] > limit:
+                regressions.append(f"{name}: {key} {result[key]:.1f} > {limit:.1f}")
+        if result['throughput'] < base['throughput'] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f}/s < "
+                               f"{base['throughput'] / (1 + tolerance):.1f}/s")
+        if result['error_rate'] > base['error_rate'] + 0.05:
+            regressions.append(f"{name}: error rate {result['error_rate']:.0%} (was {base['error_rate']:.0%})")
+        limit = base['rss_mb'] * (1 + tolerance) + memory_slack_mb
+        if result['rss_mb'] > limit:
+            regressions.append(f"{name}: RSS {result['rss_mb']:.0f} MiB > {limit:.0f} MiB")
+    return regressions
+
+
+def _settings(args) -> Dict:
+    return {key: getattr(args, key) for key in COMPARED_SETTINGS}
+
+
+def _load_baseline(path: str) -> Optional[Dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=16, help="requests in flight")
+    parser.add_argument('--scenarios', help="comma-separated scenario names (default: all)")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per scenario; the median of each figure is kept")
+    parser.add_argument('--latency', type=float, default=0.05, help="model seconds before the first token")
+    parser.add_argument('--token-rate', type=float, default=2000, help="model tokens per second (0: instant)")
+    parser.add_argument('--scrape-latency', type=float, default=0.02, help="seconds per scraped page")
+    parser.add_argument('--page-bytes', type=int, default=50_000, help="size of the nitter/LinkedIn pages")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of upstream requests that fail")
+    parser.add_argument('--flaky-rate', type=float, default=0.1, help="failure rate in the flaky scenario")
+    parser.add_argument('--real-rate-limits', action='store_true', help="keep the scrape rate limits")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed relative regression")
+    parser.add_argument('--slack-ms', type=float, default=20.0, help="allowed absolute latency regression")
+    parser.add_argument('--memory-slack-mb', type=float, default=32.0, help="allowed absolute RSS growth")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        wanted = args.scenarios.split(',')
+        unknown = set(wanted) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in wanted]
+
+    results = asyncio.run(run_suite(scenarios, args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scenario':<14}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttfb ms':>9}"
+              f"{'errors':>8}{'RSS MiB':>9}{'peak MiB':>10}")
+        for name, result in results.items():
+            print(f"{name:<14}{result['throughput']:>8.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                  f"{result['p99_ms']:>9.1f}{result['ttfb_p50_ms']:>9.1f}{result['error_rate']:>8.0%}"
+                  f"{result['rss_mb']:>9.0f}{result['peak_mb']:>10.0f}")
+
+    baseline = _load_baseline(args.baseline)
+    if args.save_baseline:
+        scenarios_saved = dict(baseline['scenarios']) if baseline and baseline['settings'] == _settings(args) else {}
+        scenarios_saved.update({name: {key: round(value, 3) for key, value in result.items()}
+                                for name, result in results.items()})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'settings': _settings(args), 'scenarios': scenarios_saved}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+        return
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to store one")
+        return
+    if baseline['settings'] != _settings(args):
+        print("Baseline was recorded with other settings; not compared")
+        return
+
+    regressions = compare(results, baseline['scenarios'], args.tolerance, args.slack_ms, args.memory_slack_mb)
+    if regressions:
+        raise SystemExit("FAIL: regressions against the baseline:\n  " + "\n  ".join(regressions))
+    print("PASS: no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
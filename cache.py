@@ -0,0 +1,308 @@
+"""
+Caches for scraped content and generated LinkedIn posts
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import config
+from concurrency import run_blocking
+
+
+def _normalize(text: str) -> str:
+    """Normalize unicode and collapse whitespace so trivial edits share a key"""
+    text = unicodedata.normalize('NFC', text or '')
+    return ' '.join(text.split())
+
+
+def generation_key(content: str, platform: str, author: str = None, **params) -> str:
+    """
+    Build the cache key for a generation request
+
+    Args:
+        content: Source content to repurpose
+        platform: Source platform
+        author: Original author name
+        **params: Model name and sampling parameters (anything that changes the output)
+
+    Returns:
+        Hex SHA-256 digest identifying the request
+    """
+    payload = {
+        'content': _normalize(content),
+        'platform': (platform or '').strip().lower(),
+        'author': _normalize(author) if author else None,
+        'params': params
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed second tier, accessed from worker threads"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "key TEXT PRIMARY KEY, posts TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS generations_created ON generations (created_at)")
+        self._conn.commit()
+
+    def get(self, key: str, ttl: float) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT posts, created_at FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > ttl:
+                self._conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return json.loads(row[0])
+
+    def set(self, key: str, posts: List[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, posts, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(posts), time.time())
+            )
+            # Keep only the newest max_entries rows
+            self._conn.execute(
+                "DELETE FROM generations WHERE key IN ("
+                "SELECT key FROM generations ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class GenerationCache:
+    """
+    Two-tier cache of generated posts
+
+    An in-process LRU tier answers repeated requests without touching disk;
+    an optional SQLite tier survives restarts and is shared by workers on
+    the same host. Entries expire after `ttl` seconds in both tiers.
+    """
+
+    def __init__(self, max_entries: int = config.GENERATION_CACHE_MAX_ENTRIES,
+                 ttl: float = config.GENERATION_CACHE_TTL,
+                 db_path: Optional[str] = config.GENERATION_CACHE_DB,
+                 db_max_entries: int = config.GENERATION_CACHE_DB_MAX_ENTRIES):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of entries kept in memory
+            ttl: Seconds before an entry expires
+            db_path: SQLite file for the on-disk tier (disabled if None)
+            db_max_entries: Maximum number of rows kept on disk
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk = _DiskTier(db_path, db_max_entries) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """
+        Look up generated posts
+
+        Args:
+            key: Key from generation_key()
+
+        Returns:
+            Cached posts, or None on a miss
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            posts, stored_at = entry
+            if time.time() - stored_at <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(posts)
+            del self._memory[key]
+
+        if self._disk is not None:
+            posts = await run_blocking(self._disk.get, key, self.ttl)
+            if posts is not None:
+                self._remember(key, posts)
+                self.hits += 1
+                self.disk_hits += 1
+                return list(posts)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, posts: List[str]):
+        """
+        Store generated posts
+
+        Args:
+            key: Key from generation_key()
+            posts: Posts to cache
+        """
+        self._remember(key, posts)
+        if self._disk is not None:
+            await run_blocking(self._disk.set, key, list(posts))
+
+    def _remember(self, key: str, posts: List[str]):
+        self._memory[key] = (tuple(posts), time.time())
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'disk_entries': len(self._disk) if self._disk is not None else 0
+        }
+
+    def close(self):
+        """Close the on-disk tier"""
+        if self._disk is not None:
+            self._disk.close()
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """A source's scrape cache lifetimes in seconds (None: the cache's own setting)"""
+    fresh_for: Optional[float] = None
+    max_age: Optional[float] = None
+    negative_ttl: Optional[float] = None
+
+
+@dataclass
+class ScrapeEntry:
+    """A scraped result plus the validators needed to revalidate it"""
+    result: Dict
+    validators: Dict[str, str] = field(default_factory=dict)
+    stored_at: float = field(default_factory=time.time)
+    policy: CachePolicy = field(default_factory=CachePolicy)
+
+    @property
+    def is_error(self) -> bool:
+        return bool(self.result.get('error'))
+
+
+class ScrapeCache:
+    """
+    URL-keyed cache of scrape results
+
+    Successful results are served directly for `fresh_for` seconds, then
+    revalidated with If-None-Match / If-Modified-Since so an unchanged post
+    costs a 304 instead of a download and parse. Failed scrapes are
+    remembered for `negative_ttl` seconds so retries don't hammer a source
+    that is blocking us. A source can override these lifetimes with a
+    CachePolicy when its result is stored.
+    """
+
+    def __init__(self, max_entries: int = config.SCRAPE_CACHE_MAX_ENTRIES,
+                 fresh_for: float = config.SCRAPE_CACHE_FRESH_FOR,
+                 max_age: float = config.SCRAPE_CACHE_MAX_AGE,
+                 negative_ttl: float = config.SCRAPE_CACHE_NEGATIVE_TTL):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of URLs kept
+            fresh_for: Seconds a result is served without contacting the source
+            max_age: Seconds a result is kept around for revalidation
+            negative_ttl: Seconds a failed scrape is served from cache
+        """
+        self.max_entries = max_entries
+        self.fresh_for = fresh_for
+        self.max_age = max_age
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, ScrapeEntry]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def lookup(self, url: str) -> Optional[ScrapeEntry]:
+        """
+        Get the entry for a URL, dropping it if it has expired
+
+        Args:
+            url: URL as passed to the scraper
+
+        Returns:
+            The entry, or None if there is nothing usable
+        """
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        limit = self._limit(entry, 'negative_ttl' if entry.is_error else 'max_age')
+        if time.time() - entry.stored_at > limit:
+            del self._entries[url]
+            return None
+        self._entries.move_to_end(url)
+        return entry
+
+    def is_fresh(self, entry: ScrapeEntry) -> bool:
+        """True if the entry can be served without contacting the source"""
+        limit = self._limit(entry, 'negative_ttl' if entry.is_error else 'fresh_for')
+        return time.time() - entry.stored_at <= limit
+
+    def _limit(self, entry: ScrapeEntry, name: str) -> float:
+        value = getattr(entry.policy, name)
+        return value if value is not None else getattr(self, name)
+
+    def store(self, url: str, result: Dict, validators: Optional[Dict[str, str]] = None,
+              policy: Optional[CachePolicy] = None):
+        """
+        Store a freshly scraped result
+
+        Args:
+            url: URL as passed to the scraper
+            result: Scraper output
+            validators: ETag / Last-Modified values from the response
+            policy: The source's lifetimes, if it sets its own
+        """
+        validators = {} if result.get('error') else dict(validators or {})
+        self._entries[url] = ScrapeEntry(dict(result), validators, policy=policy or CachePolicy())
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def refresh(self, entry: ScrapeEntry):
+        """Mark an entry as fresh again after a 304 Not Modified"""
+        entry.stored_at = time.time()
+        self.revalidated += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size"""
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+            'entries': len(self._entries)
+        }
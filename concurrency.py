@@ -0,0 +1,38 @@
+"""
+Bounded executor for work that has to stay synchronous
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import config
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.BLOCKING_EXECUTOR_WORKERS,
+    thread_name_prefix="blocking"
+)
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a synchronous callable on the bounded thread pool
+
+    Keeps CPU-bound parsing and blocking client calls off the event loop
+    without letting them spawn an unbounded number of threads.
+
+    Args:
+        func: Synchronous callable to run
+        *args, **kwargs: Arguments passed to the callable
+
+    Returns:
+        Whatever the callable returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown():
+    """Stop accepting new work and let running jobs finish in the background"""
+    _executor.shutdown(wait=False)
@@ -6,34 +6,182 @@ Configuration settings for Content Repurposing Agent
 DEFAULT_MODEL = "claude-sonnet-4-20250514"
 MAX_TOKENS = 2000
 TEMPERATURE = 0.7
+PROMPT_CACHE_MIN_TOKENS = 1024  # shortest prefix Anthropic will cache for DEFAULT_MODEL; shorter ones are sent uncached
+
+# Message Batches Settings (bulk offline jobs, billed at the batch discount)
+BULK_POLL_INTERVAL = 30  # seconds between batch status checks
+BULK_TIMEOUT = 24 * 3600  # seconds to wait for a batch before giving up
 
 # Post Generation Settings
 MIN_POST_LENGTH = 150  # words
 MAX_POST_LENGTH = 300  # words
 NUM_VARIATIONS = 3
+VARIATION_MAX_TOKENS = 800  # per-style request in parallel mode
 HASHTAG_COUNT_RANGE = (2, 5)
 
+# Structured Output Settings (posts as JSON via tool use / Ollama's format option)
+STRUCTURED_OUTPUT = False  # opt-in; the default asks for VARIATION-delimited text
+STRUCTURED_FIELD_RETRIES = 2  # follow-up calls for the fields of a post that fail validation
+STRUCTURED_HOOK_MAX_CHARS = 150
+STRUCTURED_MIN_BODY_WORDS = 60
+
 # Scraping Settings
 REQUEST_TIMEOUT = 10  # seconds
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+SCRAPE_MAX_RESPONSE_BYTES = 2 * 1024 * 1024  # downloads are aborted past this size
+SCRAPE_ALLOW_PRIVATE_ADDRESSES = False  # scrape loopback, private, link-local and reserved addresses too
+REDDIT_COMMENT_LIMIT = 1  # comments Reddit includes with a post (only the post is used)
+REDDIT_COMMENT_DEPTH = 1  # reply levels Reddit includes
+REDDIT_LISTING_LIMIT = 25  # posts per subreddit listing request
+RATE_LIMIT_RETRIES = 2  # times a 429/503 scrape is retried after backing off
+RATE_LIMIT_MAX_WAIT = 30  # seconds; a longer Retry-After fails the scrape instead
+FEED_MAX_RESPONSE_BYTES = 20 * 1024 * 1024  # feeds are parsed as they download, so larger ones are allowed
+HN_API_URL = 'https://hacker-news.firebaseio.com/v0'  # item JSON for news.ycombinator.com links
+
+# HTTP Connection Pool Settings (shared by the scrapers and the Ollama client)
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 30  # seconds an idle connection stays open
+HTTP_MAX_CONNECTIONS_PER_HOST = 10
+HTTP2_ENABLED = True  # only takes effect when the h2 package is installed
+HTTP_RETRIES = 2  # connection errors, and 502/503/504 on GET
+HTTP_RETRY_BACKOFF = 0.5  # seconds, doubled on each retry
+
+# Ollama Settings
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_MODEL = "llama3.2"
+OLLAMA_TIMEOUT = 120  # seconds, local models can be slow
+OLLAMA_CONNECT_TIMEOUT = 5  # seconds
+OLLAMA_MAX_CONNECTIONS_PER_HOST = 32  # concurrent requests per Ollama server, instead of HTTP_MAX_CONNECTIONS_PER_HOST
+OLLAMA_ROUTING = "least_outstanding"  # or "latency" (EWMA latency x requests in flight)
+OLLAMA_BREAKER_FAILURES = 3  # consecutive failures before a server is taken out of rotation
+OLLAMA_BREAKER_RESET = 30  # seconds before a failed server gets a trial request
+OLLAMA_HEALTH_INTERVAL = 15  # seconds between background checks of every server
+OLLAMA_LATENCY_EWMA_ALPHA = 0.3  # weight of the newest latency sample
+OLLAMA_KEEP_ALIVE = "30m"  # how long Ollama keeps the model in memory after a request (None for the server default)
+OLLAMA_PRELOAD_MODELS = [OLLAMA_MODEL]  # loaded on OLLAMA_BASE_URL at startup ([] to skip)
+OLLAMA_KEEP_WARM_INTERVAL = 300  # seconds between reloads of idle servers, well under OLLAMA_KEEP_ALIVE (0 to disable)
+OLLAMA_COLD_LOAD_SECONDS = 0.5  # a load_duration above this counts as a cold start
+
+# Scrape Cache Settings
+SCRAPE_CACHE_MAX_ENTRIES = 1024
+SCRAPE_CACHE_FRESH_FOR = 300  # seconds before revalidating with the source
+SCRAPE_CACHE_MAX_AGE = 24 * 3600  # seconds an entry is kept for revalidation
+SCRAPE_CACHE_NEGATIVE_TTL = 30  # seconds a failed scrape is remembered
+
+# Generation Cache Settings
+GENERATION_CACHE_MAX_ENTRIES = 512  # in-memory LRU tier
+GENERATION_CACHE_TTL = 7 * 24 * 3600  # seconds
+GENERATION_CACHE_DB = None  # SQLite file for the on-disk tier, e.g. "generation_cache.db"
+GENERATION_CACHE_DB_MAX_ENTRIES = 10000
+
+# Near-Duplicate Settings (reposts and cross-posts with small edits)
+DEDUP_ENABLED = True
+DEDUP_SIMILARITY = 0.95  # share of equal SimHash bits; 0.95 allows 3 of 64 to differ
+DEDUP_ACTION = "flag"  # "flag": generate anyway and report the match; "reuse": answer with the earlier variations
+DEDUP_MIN_WORDS = 8  # shorter content is never matched
+DEDUP_INDEX_FILE = None  # file the index is loaded from at startup and saved to on shutdown, e.g. "dedup.idx"
+DEDUP_MAX_ITEMS = 1_000_000  # the oldest half is dropped past this; about 125 MB resident when full, half as much again while trimming
+
+# Backend Registry Settings
+BACKEND_IDLE_TIMEOUT = 600  # seconds before an unused backend client is closed
+OLLAMA_HEALTH_TTL = 60  # seconds a successful Ollama health check is trusted
+OLLAMA_HEALTH_FAILURE_TTL = 5  # seconds a failed health check is remembered
+
+# Batch Settings
+BATCH_SCRAPE_CONCURRENCY = 8  # scrapes in flight per batch
+BATCH_GENERATE_CONCURRENCY = 3  # generations in flight per batch
+BATCH_MAX_ITEMS = 500  # per /api/batch request
 
-# Platform-specific settings
+# Watcher Settings (watcher.py)
+WATCH_INTERVAL = 300  # seconds between polls of the watched sources
+WATCH_STATE_DB = "watch_state.db"  # SQLite file with each source's high-water mark and unfinished items
+WATCH_SEEN_IDS = 1000  # item ids remembered per source
+WATCH_MAX_ITEMS = 50  # new items taken from a source per poll
+WATCH_BACKFILL = 0  # items generated from a source's first poll; the rest only set the high-water mark
+WATCH_GENERATE_CONCURRENCY = 3  # generations in flight
+WATCH_MAX_ATTEMPTS = 3  # polls an item is retried on before it is given up
+
+# Tracing Settings
+TRACING_ENABLED = False
+TRACING_EXPORTER = "file"  # "file", "collector" (OTLP/HTTP JSON) or "opentelemetry" (the installed SDK)
+TRACING_FILE = "traces.jsonl"  # for the file exporter
+TRACING_ENDPOINT = "http://localhost:4318/v1/traces"  # for the collector exporter
+TRACING_SERVICE_NAME = "content-repurposing-agent"
+TRACING_MAX_PENDING_SPANS = 10000  # spans buffered for the exporter before new ones are dropped
+TRACING_EXPORT_TIMEOUT = 5  # seconds
+
+# Job Queue Settings (POST /api/jobs)
+JOB_WORKERS = 4  # jobs run concurrently
+JOB_QUEUE_MAX_DEPTH = 100  # waiting jobs before submissions get a 429
+JOB_RESULT_TTL = 3600  # seconds finished jobs are kept
+JOB_STORE_DB = None  # SQLite file for job records, e.g. "jobs.db" (in memory if None)
+JOB_POLL_INTERVAL = 1.0  # seconds between store reads while watching a job
+JOB_HEARTBEAT_INTERVAL = 10  # seconds between a server's liveness updates in the job store
+JOB_ORPHAN_TIMEOUT = 60  # seconds without a heartbeat before a server's unfinished jobs are failed
+JOB_WAIT_MAX = 30  # longest ?wait= accepted by GET /api/jobs/{id}
+JOB_RETRY_AFTER = 5  # seconds suggested to clients when the queue is full
+
+# Concurrency Settings
+BLOCKING_EXECUTOR_WORKERS = 8  # threads for work that has to stay synchronous
+
+# Platform-specific settings, one entry per scraper adapter (adapters.py)
+# `domains` are the hosts the scraper requests for a platform; `hosts` (if
+# different) are the URL hosts sent to its adapter. `rate_limit` is the
+# per-host starting point for ratelimit.HostLimiter, which adapts the rate
+# and concurrency to 429/503 responses; for platforms without domains it
+# applies to whatever host the adapter fetches. `cache` overrides the
+# SCRAPE_CACHE_* lifetimes for the platform's results.
 PLATFORMS = {
     'twitter': {
         'name': 'Twitter/X',
         'fallback_domain': 'nitter.net',
-        'requires_auth': True
+        'requires_auth': True,
+        'domains': ['nitter.net', 'twitter.com', 'x.com'],
+        'rate_limit': {'rate': 1.0, 'max_rate': 2.0, 'burst': 3, 'concurrency': 2, 'max_concurrency': 4},
+        'cache': {'fresh_for': 300}
     },
     'linkedin': {
         'name': 'LinkedIn',
-        'requires_auth': True
+        'requires_auth': True,
+        'domains': ['linkedin.com'],
+        'rate_limit': {'rate': 1.0, 'max_rate': 2.0, 'burst': 3, 'concurrency': 2, 'max_concurrency': 4},
+        'cache': {'fresh_for': 300}
     },
     'reddit': {
         'name': 'Reddit',
-        'requires_auth': False
+        'requires_auth': False,
+        'domains': ['reddit.com'],
+        'rate_limit': {'rate': 2.0, 'max_rate': 5.0, 'burst': 5, 'concurrency': 4, 'max_concurrency': 8},
+        'cache': {'fresh_for': 300}
+    },
+    'hackernews': {
+        'name': 'Hacker News',
+        'requires_auth': False,
+        'domains': ['news.ycombinator.com', 'hacker-news.firebaseio.com'],
+        'hosts': ['news.ycombinator.com'],
+        'rate_limit': {'rate': 5.0, 'max_rate': 10.0, 'burst': 10, 'concurrency': 8, 'max_concurrency': 16},
+        'cache': {'fresh_for': 120}  # text edits settle within minutes
+    },
+    'rss': {
+        'name': 'RSS/Atom feed',
+        'requires_auth': False,
+        'domains': [],  # any host; picked by the URL path or the response's content type
+        'rate_limit': {'rate': 1.0, 'max_rate': 2.0, 'burst': 2, 'concurrency': 1, 'max_concurrency': 2},
+        'cache': {'fresh_for': 60, 'max_age': 3600}  # feeds change often; revalidate with ETags
+    },
+    'blog': {
+        'name': 'Blog/article',
+        'requires_auth': False,
+        'domains': [],  # any host no other platform claims
+        'rate_limit': {'rate': 2.0, 'max_rate': 5.0, 'burst': 5, 'concurrency': 4, 'max_concurrency': 8},
+        'cache': {'fresh_for': 3600}  # published articles rarely change
     }
 }
 
+# Rate limit for hosts outside PLATFORMS (None leaves them unlimited)
+DEFAULT_RATE_LIMIT = {'rate': 2.0, 'max_rate': 5.0, 'burst': 5, 'concurrency': 4, 'max_concurrency': 8}
+
 # Variation Styles
 VARIATION_STYLES = {
     1: {
@@ -0,0 +1,380 @@
+"""
+Near-duplicate detection for source content
+
+Reposts and cross-posts rarely match byte for byte: whitespace, emoji,
+tracking links or a reworded sentence change the exact generation-cache
+key. Each text gets a 64-bit SimHash over its word shingles (URLs, emoji
+and punctuation dropped), so texts that share most shingles get
+signatures a few bits apart. Shingles are word pairs: single words would
+make the signature ignore word order, so reordered or negated text ("is
+faster... everyone should" against "is slower... nobody should") could
+land within the threshold. Longer shingles also catch fewer real edits,
+since one changed word touches SHINGLE_WORDS features.
+
+SimHashIndex finds stored signatures within `max_distance` bits using the
+pigeonhole principle. The 64 bits are split into max_distance + 1 bands,
+and any signature within the distance matches at least one band exactly.
+Each band is a dict from band value to an array of item numbers, so a
+query looks at a handful of candidates, not the whole index. Signatures,
+scopes and keys live in flat arrays (48 bytes per item), and save()
+writes them straight to disk. In memory the band buckets
+come on top of that: about 125 bytes per item at 1M items, and more per
+item in smaller indexes, where most buckets hold only a few items.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import config
+from concurrency import run_blocking
+
+
+_URL = re.compile(r'https?://\S+|www\.\S+', re.I)
+_WORD = re.compile(r'[^\W_]+')  # letters and digits; emoji, punctuation and symbols drop out
+SHINGLE_WORDS = 2  # pairs keep word order; longer shingles move more bits per edited word
+_MAGIC = b'SIMHASH2'
+# Indexes written with an earlier signature or scope scheme; they can't be reused
+_OLD_MAGICS = (b'SIMHASH1',)
+
+
+def words(text: str) -> List[str]:
+    """Lowercased words of a text, without URLs"""
+    return _WORD.findall(_URL.sub(' ', text.lower()))
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text's word shingles
+
+    Args:
+        text: Source content
+
+    Returns:
+        Signature; similar texts differ in few bits
+    """
+    tokens = words(text)
+    if len(tokens) > SHINGLE_WORDS:
+        shingles = Counter(' '.join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1))
+    else:
+        shingles = Counter([' '.join(tokens)])
+
+    totals = [0] * 64
+    for shingle, weight in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(64):
+            if value >> bit & 1:
+                totals[bit] += weight
+            else:
+                totals[bit] -= weight
+
+    signature = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def distance(a: int, b: int) -> int:
+    """Number of differing bits"""
+    return bin(a ^ b).count('1')
+
+
+def scope_of(platform: str, author: Optional[str] = None, **params) -> int:
+    """
+    64-bit id of what a generation depends on besides the content
+
+    Only items with the same scope (source platform, author, model,
+    sampling parameters) count as duplicates of each other, so reused posts
+    never credit a different author.
+    """
+    payload = json.dumps({
+        'platform': (platform or '').strip().lower(),
+        'author': ' '.join((author or '').split()).lower(),
+        'params': params
+    }, sort_keys=True)
+    return int.from_bytes(hashlib.sha256(payload.encode('utf-8')).digest()[:8], 'little')
+
+
+def max_distance_for(similarity: float) -> int:
+    """Differing bits allowed for a similarity (share of equal bits) between 0 and 1"""
+    if not 0 < similarity <= 1:
+        raise ValueError("Similarity must be between 0 and 1")
+    return int((1 - similarity) * 64 + 1e-9)
+
+
+class SimHashIndex:
+    """
+    Signatures with a scope and a 32-byte key each, searchable by Hamming distance
+
+    Items are numbered in insertion order. When `max_items` is reached the
+    oldest half is dropped.
+    """
+
+    def __init__(self, max_distance: int = 3, max_items: int = config.DEDUP_MAX_ITEMS):
+        """
+        Args:
+            max_distance: Largest number of differing bits that still matches.
+                Each extra bit adds a band and narrows them, so queries on a
+                large index slow down quickly past 3 or 4.
+            max_items: Items kept before the oldest half is dropped
+        """
+        if not 0 <= max_distance < 32:
+            raise ValueError("max_distance must be between 0 and 31")
+        self.max_distance = max_distance
+        self.max_items = max_items
+        bands = max_distance + 1
+        width, extra = divmod(64, bands)
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for band in range(bands):
+            bits = width + (1 if band < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+        self.signatures = array('Q')
+        self.scopes = array('Q')
+        self.keys = bytearray()
+        self._buckets: List[Dict[int, array]] = [{} for _ in self._bands]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def add(self, signature: int, scope: int, key: bytes) -> int:
+        """
+        Store an item
+
+        Args:
+            signature: SimHash of the content
+            scope: scope_of() the generation
+            key: 32-byte key (e.g. the generation cache key's digest)
+
+        Returns:
+            The item's number
+        """
+        if len(key) != 32:
+            raise ValueError("Keys are 32 bytes")
+        if len(self.signatures) >= self.max_items:
+            self._drop_oldest(len(self.signatures) // 2)
+        number = len(self.signatures)
+        self.signatures.append(signature)
+        self.scopes.append(scope)
+        self.keys += key
+        self._index(number, signature)
+        return number
+
+    def query(self, signature: int, scope: int) -> Optional[Tuple[int, int]]:
+        """
+        The closest stored item within max_distance and with the same scope
+
+        Returns:
+            Tuple of (item number, distance), or None; the newest item wins ties
+        """
+        best = None
+        checked = set()
+        signatures, scopes = self.signatures, self.scopes
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            bucket = buckets.get(signature >> shift & mask)
+            if bucket is None:
+                continue
+            for number in bucket:
+                if number in checked:
+                    continue
+                checked.add(number)
+                if scopes[number] != scope:
+                    continue
+                bits = bin(signatures[number] ^ signature).count('1')
+                if bits <= self.max_distance and (best is None or bits < best[1]
+                                                  or (bits == best[1] and number > best[0])):
+                    best = (number, bits)
+        return best
+
+    def key(self, number: int) -> bytes:
+        return bytes(self.keys[number * 32:(number + 1) * 32])
+
+    def _index(self, number: int, signature: int):
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            band = signature >> shift & mask
+            bucket = buckets.get(band)
+            if bucket is None:
+                buckets[band] = array('I', [number])
+            else:
+                bucket.append(number)
+
+    def _rebuild(self):
+        self._buckets = []
+        for shift, mask in self._bands:
+            buckets: Dict[int, array] = {}
+            for number, signature in enumerate(self.signatures):
+                band = signature >> shift & mask
+                bucket = buckets.get(band)
+                if bucket is None:
+                    buckets[band] = array('I', [number])
+                else:
+                    bucket.append(number)
+            self._buckets.append(buckets)
+
+    def _drop_oldest(self, count: int):
+        self.signatures = self.signatures[count:]
+        self.scopes = self.scopes[count:]
+        del self.keys[:count * 32]
+        self._rebuild()
+
+    @property
+    def full(self) -> bool:
+        """True once the next add() drops the oldest half"""
+        return len(self.signatures) >= self.max_items
+
+    def without_oldest(self, count: int) -> 'SimHashIndex':
+        """
+        A new index without the `count` oldest items, leaving this one as it is
+
+        Building it takes seconds for a large index, but this one can keep
+        answering queries meanwhile (e.g. from another thread).
+        """
+        index = SimHashIndex(self.max_distance, self.max_items)
+        index.signatures = self.signatures[count:]
+        index.scopes = self.scopes[count:]
+        index.keys = self.keys[count * 32:]
+        index._rebuild()
+        return index
+
+    def save(self, path: str):
+        """Write the index to a file (replaced atomically)"""
+        signatures, scopes = self.signatures, self.scopes
+        if sys.byteorder != 'little':
+            signatures, scopes = array('Q', signatures), array('Q', scopes)
+            signatures.byteswap()
+            scopes.byteswap()
+        header = json.dumps({'max_distance': self.max_distance, 'items': len(signatures)}).encode('utf-8')
+        temporary = f"{path}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(_MAGIC + len(header).to_bytes(4, 'little') + header)
+            signatures.tofile(f)
+            scopes.tofile(f)
+            f.write(self.keys)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str, max_distance: Optional[int] = None,
+             max_items: int = config.DEDUP_MAX_ITEMS) -> 'SimHashIndex':
+        """
+        Read an index written by save()
+
+        Args:
+            path: Index file
+            max_distance: Rebuild the bands for a different distance (default: the saved one)
+            max_items: Items kept before the oldest half is dropped
+
+        Raises:
+            ValueError: Not an index file, or one written by an earlier version
+        """
+        with open(path, 'rb') as f:
+            magic = f.read(len(_MAGIC))
+            if magic in _OLD_MAGICS:
+                raise ValueError(f"{path} is a near-duplicate index in an outdated format")
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a near-duplicate index")
+            header = json.loads(f.read(int.from_bytes(f.read(4), 'little')))
+            index = cls(header['max_distance'] if max_distance is None else max_distance, max_items)
+            count = header['items']
+            index.signatures.fromfile(f, count)
+            index.scopes.fromfile(f, count)
+            index.keys = bytearray(f.read(count * 32))
+        if sys.byteorder != 'little':
+            index.signatures.byteswap()
+            index.scopes.byteswap()
+        if len(index.keys) != count * 32:
+            raise ValueError(f"{path} is truncated")
+        index._rebuild()
+        return index
+
+
+def _is_outdated(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(_MAGIC)) in _OLD_MAGICS
+
+
+class NearDuplicates:
+    """
+    Near-duplicate lookups for generation requests
+
+    Maps each generated content's SimHash to its generation cache key, so a
+    near-duplicate request can be answered with the stored variations.
+    """
+
+    def __init__(self, path: Optional[str] = config.DEDUP_INDEX_FILE,
+                 similarity: float = config.DEDUP_SIMILARITY, min_words: int = config.DEDUP_MIN_WORDS):
+        """
+        Args:
+            path: File the index is loaded from and saved to (in memory only if None)
+            similarity: Share of equal SimHash bits (0-1) that counts as a duplicate
+            min_words: Shorter texts are never matched; a few words say too little
+        """
+        self.path = path
+        self.min_words = min_words
+        max_distance = max_distance_for(similarity)
+        if path and os.path.exists(path) and not _is_outdated(path):
+            self.index = SimHashIndex.load(path, max_distance)
+        else:
+            # An outdated index is started over and replaced on the next save
+            self.index = SimHashIndex(max_distance)
+        # Held by add() while the oldest half is dropped, so no item lands in the index being replaced
+        self._lock = asyncio.Lock()
+        self.matches = 0
+        self.lookups = 0
+
+    def _signature(self, content: str) -> Optional[int]:
+        if len(words(content)) < self.min_words:
+            return None
+        return simhash(content)
+
+    async def find(self, content: str, scope: int) -> Optional[Dict]:
+        """
+        The closest earlier content in the same scope
+
+        Returns:
+            {'key': generation cache key, 'distance': differing bits,
+            'similarity': share of equal bits}, or None
+        """
+        # Hashing every shingle is CPU-bound, keep it off the event loop
+        signature = await run_blocking(self._signature, content)
+        if signature is None:
+            return None
+        self.lookups += 1
+        found = self.index.query(signature, scope)
+        if found is None:
+            return None
+        self.matches += 1
+        number, bits = found
+        return {'key': self.index.key(number).hex(), 'distance': bits, 'similarity': round(1 - bits / 64, 3)}
+
+    async def add(self, content: str, scope: int, key: str):
+        """Remember generated content under its generation cache key (hex SHA-256)"""
+        signature = await run_blocking(self._signature, content)
+        if signature is None:
+            return
+        async with self._lock:
+            if self.index.full:
+                # Rebuilding the bands takes seconds at DEDUP_MAX_ITEMS: do it off the
+                # event loop, while lookups keep using the current index
+                self.index = await run_blocking(self.index.without_oldest, len(self.index) // 2)
+            self.index.add(signature, scope, bytes.fromhex(key))
+
+    def save(self):
+        """Write the index to its file, if it has one"""
+        if self.path:
+            self.index.save(self.path)
+
+    def stats(self) -> Dict:
+        return {
+            'items': len(self.index),
+            'max_distance': self.index.max_distance,
+            'lookups': self.lookups,
+            'matches': self.matches,
+            'match_rate': self.matches / self.lookups if self.lookups else 0.0
+        }
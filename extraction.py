@@ -0,0 +1,485 @@
+"""
+Targeted extraction for the scrapers
+
+The scrapers only need one or two nodes per page (the og: meta tags on
+LinkedIn, the tweet text and author name on nitter). TargetedExtractor feeds
+the response body into lxml's pull parser chunk by chunk as it downloads,
+drops finished subtrees it doesn't need, and reports when every target has
+been found so the rest of the download can be skipped. If lxml is not
+installed, or the fast path misses the page's main content, the whole body
+goes through BeautifulSoup as before.
+
+FirstItemDecoder does the same for JSON: Reddit answers with the post
+listing followed by the comment listing, and only the first is needed.
+
+FeedParser reads RSS/Atom incrementally and hands back each entry as soon
+as it closes. extract_article finds the main text of an arbitrary article
+page, readability-style, by scoring the blocks that hold its paragraphs.
+"""
+import codecs
+import html
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from xml.etree import ElementTree
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class Target:
+    """
+    A node to extract
+
+    Matches the first `tag` whose `attribute` equals `value` (for `class`,
+    contains it as one of its classes, like BeautifulSoup's class_). The
+    extracted value is the attribute named by `read`, or the element's
+    stripped text when `read` is None.
+    """
+    tag: str
+    attribute: str
+    value: str
+    read: Optional[str] = None
+
+    def matches(self, tag: str, attributes) -> bool:
+        if tag != self.tag:
+            return False
+        found = attributes.get(self.attribute)
+        if found is None:
+            return False
+        if self.attribute == 'class':
+            return self.value in found.split()
+        return found == self.value
+
+
+# Every target set has a 'content' entry; a page without it falls back to BeautifulSoup
+LINKEDIN_TARGETS = {
+    'content': Target('meta', 'property', 'og:description', read='content'),
+    'author': Target('meta', 'property', 'og:title', read='content')
+}
+
+TWITTER_TARGETS = {
+    'content': Target('div', 'class', 'tweet-content'),
+    'author': Target('a', 'class', 'fullname')
+}
+
+
+def _element_text(element) -> str:
+    """Same result as BeautifulSoup's get_text(strip=True)"""
+    return "".join(part.strip() for part in element.itertext())
+
+
+class TargetedExtractor:
+    """
+    Incremental extractor over lxml's HTMLPullParser
+
+    Feed it the body in chunks; feed() returns True once all targets are
+    found. When every target is a meta tag, the end of <head> (or the start
+    of <body>) also finishes extraction, since those tags can't appear later.
+    """
+
+    def __init__(self, targets: Dict[str, Target], encoding: Optional[str] = None):
+        """
+        Args:
+            targets: Name -> Target to extract
+            encoding: Body encoding from the Content-Type header (UTF-8 if unknown)
+        """
+        self.targets = targets
+        self.results: Dict[str, Optional[str]] = {name: None for name in targets}
+        self.done = False
+        self._head_only = all(target.tag == 'meta' for target in targets.values())
+        self._claimed = {}
+        self._open_targets = 0
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding or 'utf-8')
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Parse the next piece of the body
+
+        Args:
+            chunk: Raw response bytes
+
+        Returns:
+            True once nothing more needs to be read
+        """
+        if self.done:
+            return True
+        self._parser.feed(chunk)
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._start(element)
+            else:
+                self._end(element)
+            if self.done:
+                break
+        return self.done
+
+    def _start(self, element):
+        tag = element.tag
+        if self._head_only and tag == 'body':
+            self.done = True
+            return
+        for name, target in self.targets.items():
+            if name not in self._claimed and target.matches(tag, element.attrib):
+                if target.read is not None:
+                    self.results[name] = element.get(target.read)
+                    self._claimed[name] = None
+                else:
+                    # Text is only complete at the end tag
+                    self._claimed[name] = element
+                    self._open_targets += 1
+        self._check_done()
+
+    def _end(self, element):
+        for name, claimed in self._claimed.items():
+            if claimed is element:
+                self.results[name] = _element_text(element)
+                self._claimed[name] = None
+                self._open_targets -= 1
+        if self._head_only and element.tag == 'head':
+            self.done = True
+        elif self._open_targets == 0:
+            # Nothing above this node is being extracted, so it and its
+            # finished siblings can go
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+        self._check_done()
+
+    def _check_done(self):
+        if len(self._claimed) == len(self.targets) and self._open_targets == 0:
+            self.done = True
+
+
+def extract_with_soup(html: bytes, targets: Dict[str, Target]) -> Dict[str, Optional[str]]:
+    """
+    Fallback path: parse the whole document with BeautifulSoup
+
+    Args:
+        html: Full response body
+        targets: Name -> Target to extract
+
+    Returns:
+        Name -> extracted value (None if the node is missing)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    results = {}
+    for name, target in targets.items():
+        if target.attribute == 'class':
+            element = soup.find(target.tag, class_=target.value)
+        else:
+            element = soup.find(target.tag, attrs={target.attribute: target.value})
+        if element is None:
+            results[name] = None
+        elif target.read is not None:
+            results[name] = element.get(target.read)
+        else:
+            results[name] = element.get_text(strip=True)
+    return results
+
+
+class FirstItemDecoder:
+    """
+    Incremental decoder for the first element of a top-level JSON array
+
+    Feed it the body in chunks; feed() returns True as soon as the first
+    element is complete, so the rest of the array never has to be
+    downloaded or parsed.
+    """
+
+    def __init__(self, encoding: Optional[str] = None):
+        """
+        Args:
+            encoding: Body encoding (UTF-8 if unknown)
+        """
+        self.item = None
+        self.done = False
+        self._bytes = codecs.getincrementaldecoder(encoding or 'utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._text = ""
+        self._is_array: Optional[bool] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Decode the next piece of the body
+
+        Args:
+            chunk: Raw response bytes
+
+        Returns:
+            True once the first element has been decoded
+        """
+        if self.done:
+            return True
+        self._text += self._bytes.decode(chunk)
+        if self._is_array is None:
+            stripped = self._text.lstrip()
+            if not stripped:
+                return False
+            self._is_array = stripped.startswith('[')
+            if self._is_array:
+                self._text = stripped[1:]
+        if not self._is_array:
+            return False
+
+        start = len(self._text) - len(self._text.lstrip())
+        try:
+            self.item, _ = self._decoder.raw_decode(self._text, start)
+        except json.JSONDecodeError:
+            # Not complete yet
+            return False
+        self.done = True
+        self._text = ""
+        return True
+
+    def close(self):
+        """
+        Finish after the whole body was fed without completing an element
+
+        Returns:
+            The first element
+
+        Raises:
+            ValueError: The body is not a non-empty JSON array
+        """
+        if self.done:
+            return self.item
+        self._text += self._bytes.decode(b"", final=True)
+        if not self._is_array:
+            raise ValueError("Expected a JSON array")
+        document = json.loads("[" + self._text)
+        if not document:
+            raise ValueError("Expected a non-empty JSON array")
+        self.item = document[0]
+        self.done = True
+        return self.item
+
+
+# Elements that never hold an article's text
+_NOISE_TAGS = ['script', 'style', 'noscript', 'template', 'nav', 'header', 'footer', 'aside', 'form',
+               'iframe', 'svg', 'button', 'select']
+_TEXT_TAGS = ['p', 'pre', 'blockquote', 'h2', 'h3', 'li']
+_BLOCK_TAGS = ['p', 'div', 'section', 'article', 'blockquote', 'pre', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+               'ul', 'ol', 'tr', 'table', 'figure', 'figcaption']
+_NEGATIVE = re.compile(r'comment|sidebar|footer|foot|share|social|related|promo|advert|sponsor|\bads?\b|'
+                       r'newsletter|subscribe|cookie|popup|modal|menu|breadcrumb|widget|author-bio', re.I)
+_POSITIVE = re.compile(r'article|content|entry|post|story|text|body|main|prose', re.I)
+_MIN_PARAGRAPH = 25
+
+
+def html_to_text(fragment: str) -> str:
+    """
+    Plain text of an HTML fragment, keeping paragraph breaks
+
+    Args:
+        fragment: HTML (or plain text, returned unescaped)
+
+    Returns:
+        Text with blocks separated by blank lines
+    """
+    if '<' not in fragment:
+        return html.unescape(fragment).strip()
+    soup = BeautifulSoup(fragment, 'html.parser')
+    for tag in soup(_NOISE_TAGS):
+        tag.decompose()
+    for br in soup.find_all('br'):
+        br.replace_with('\n')
+    for block in soup.find_all(_BLOCK_TAGS):
+        block.insert_before('\n\n')
+        block.insert_after('\n\n')
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in soup.get_text().split('\n'))
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def _meta(soup, key: str) -> Optional[str]:
+    element = soup.find('meta', attrs={'property': key}) or soup.find('meta', attrs={'name': key})
+    content = element.get('content') if element is not None else None
+    return content.strip() if content and content.strip() else None
+
+
+def _class_weight(element) -> float:
+    names = ' '.join(element.get('class') or []) + ' ' + (element.get('id') or '')
+    weight = 0.0
+    if _NEGATIVE.search(names):
+        weight -= 25
+    if _POSITIVE.search(names):
+        weight += 25
+    return weight
+
+
+def _link_density(element) -> float:
+    text = len(element.get_text(strip=True)) or 1
+    return sum(len(link.get_text(strip=True)) for link in element.find_all('a')) / text
+
+
+def extract_article(page: bytes, encoding: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """
+    Main text, title and author of an article page
+
+    Every paragraph of reasonable length scores its parent (fully) and
+    grandparent (half): more for longer, comma-rich text, more or less by
+    the container's class and id, and less the more of its text is links.
+    The best container's paragraphs are the article. Pages without one
+    fall back to their og:description.
+
+    Args:
+        page: Full response body
+        encoding: Body encoding from the Content-Type header, if known
+
+    Returns:
+        {'title', 'author', 'content'}; content is None if nothing was found
+    """
+    soup = BeautifulSoup(page, 'lxml' if LXML_AVAILABLE else 'html.parser', from_encoding=encoding)
+    title = _meta(soup, 'og:title') or (soup.title.get_text(strip=True) if soup.title else None)
+    author = _meta(soup, 'author') or _meta(soup, 'article:author') or _meta(soup, 'og:site_name')
+    description = _meta(soup, 'og:description') or _meta(soup, 'description')
+
+    for tag in soup(_NOISE_TAGS):
+        tag.decompose()
+
+    candidates = {}
+    for paragraph in soup.find_all(['p', 'pre', 'blockquote']):
+        text = paragraph.get_text(' ', strip=True)
+        if len(text) < _MIN_PARAGRAPH:
+            continue
+        score = 1 + text.count(',') + min(len(text) // 100, 3)
+        for container, share in ((paragraph.parent, 1.0), (paragraph.parent and paragraph.parent.parent, 0.5)):
+            if container is None or container.name in (None, '[document]', 'html'):
+                continue
+            if id(container) not in candidates:
+                candidates[id(container)] = [container, _class_weight(container)]
+            candidates[id(container)][1] += score * share
+
+    best, best_score = None, 0.0
+    for container, score in candidates.values():
+        score *= 1 - _link_density(container)
+        if score > best_score:
+            best, best_score = container, score
+
+    content = None
+    if best is not None:
+        parts, taken = [], set()
+        for element in best.find_all(_TEXT_TAGS):
+            # Skip text already taken with an enclosing element (a <p> inside a <blockquote>)
+            if any(id(parent) in taken for parent in element.parents):
+                continue
+            text = element.get_text(' ', strip=True)
+            if element.name == 'li' and _link_density(element) > 0.5:
+                continue
+            if text:
+                parts.append(text)
+                taken.add(id(element))
+        content = '\n\n'.join(parts) or best.get_text(' ', strip=True) or None
+    return {'title': title, 'author': author, 'content': content or description}
+
+
+def _local_name(tag) -> str:
+    """Tag without its namespace, e.g. 'entry' for '{http://www.w3.org/2005/Atom}entry'"""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def _inner_text(element) -> str:
+    """Text of an element: its (HTML) text, or the text of its children for inline XHTML"""
+    if len(element):
+        return ''.join(element.itertext()).strip()
+    return (element.text or '').strip()
+
+
+class FeedParser:
+    """
+    Incremental RSS 2.0 / RSS 1.0 / Atom parser
+
+    Feed it the body in chunks; feed() returns the entries completed so
+    far, so items can be used while the rest of the feed downloads. Each
+    finished entry is cleared from the tree to keep memory flat. Uses lxml
+    when installed (with entity resolution and network access off), else
+    the standard library parser.
+    """
+
+    FORMATS = ('rss', 'feed', 'RDF')
+
+    def __init__(self):
+        if LXML_AVAILABLE:
+            self._parser = etree.XMLPullParser(events=('start', 'end'), resolve_entities=False, no_network=True)
+        else:
+            self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self.format: Optional[str] = None
+        self.title: Optional[str] = None
+        self._entry_depth = 0
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Optional[str]]]:
+        """
+        Parse the next piece of the body
+
+        Args:
+            chunk: Raw response bytes
+
+        Returns:
+            Entries completed by this chunk
+
+        Raises:
+            ValueError: The document is not a feed
+        """
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> List[Dict[str, Optional[str]]]:
+        """Finish the document and return any last entries"""
+        self._parser.close()
+        entries = self._drain()
+        if self.format is None:
+            raise ValueError("Not an RSS or Atom feed (empty document)")
+        return entries
+
+    def _drain(self) -> List[Dict[str, Optional[str]]]:
+        entries = []
+        for event, element in self._parser.read_events():
+            name = _local_name(element.tag)
+            if event == 'start':
+                if self.format is None:
+                    if name not in self.FORMATS:
+                        raise ValueError(f"Not an RSS or Atom feed (root element <{name}>)")
+                    self.format = name
+                if name in ('item', 'entry'):
+                    self._entry_depth += 1
+            elif name in ('item', 'entry'):
+                self._entry_depth -= 1
+                entries.append(self._entry(element))
+                element.clear()
+            elif name == 'title' and self._entry_depth == 0 and self.title is None:
+                self.title = _inner_text(element) or None
+        return entries
+
+    @staticmethod
+    def _entry(element) -> Dict[str, Optional[str]]:
+        entry = dict.fromkeys(('title', 'link', 'id', 'summary', 'content', 'author', 'published'))
+        for child in element:
+            name = _local_name(child.tag)
+            if name == 'title':
+                entry['title'] = _inner_text(child)
+            elif name == 'link':
+                href = child.get('href')
+                if href is None:
+                    entry['link'] = entry['link'] or (child.text or '').strip() or None
+                elif child.get('rel', 'alternate') == 'alternate' and entry['link'] is None:
+                    entry['link'] = href
+            elif name in ('guid', 'id'):
+                entry['id'] = (child.text or '').strip() or None
+            elif name in ('description', 'summary'):
+                entry['summary'] = _inner_text(child)
+            elif name in ('encoded', 'content'):
+                entry['content'] = _inner_text(child)
+            elif name in ('author', 'creator') and entry['author'] is None:
+                names = [_inner_text(part) for part in child if _local_name(part.tag) == 'name']
+                entry['author'] = (names[0] if names else _inner_text(child)) or None
+            elif name in ('pubDate', 'published', 'updated', 'date') and entry['published'] is None:
+                entry['published'] = (child.text or '').strip() or None
+        return entry
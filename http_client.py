@@ -0,0 +1,325 @@
+"""
+Shared, pooled HTTP client for the scrapers and the Ollama backend
+"""
+import asyncio
+import ipaddress
+import random
+import socket
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import config
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# Status codes worth retrying for idempotent requests
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# Request extension marking requests that may only reach public addresses
+# (scrapes of user-supplied URLs); httpx carries it over to every redirect
+PUBLIC_ONLY = 'public_only'
+
+# Request extension overriding the per-host concurrency limit (the Ollama
+# client sets OLLAMA_MAX_CONNECTIONS_PER_HOST, so a handful of long streams
+# don't block its generations); requests carrying different limits for the
+# same host get separate slots
+HOST_LIMIT = 'host_limit'
+
+
+class BlockedAddress(httpx.RequestError):
+    """The request's host resolves to an address that isn't publicly routable"""
+
+
+def is_public_address(address: str) -> bool:
+    """False for loopback, private, link-local, reserved, multicast and unspecified addresses"""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class ConnectionStats:
+    """Counts requests and newly opened connections, overall and per host"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.connections: Dict[str, int] = defaultdict(int)
+        self.retries: Dict[str, int] = defaultdict(int)
+
+    def snapshot(self) -> Dict:
+        """
+        Summarize the counters
+
+        Returns:
+            Totals plus per-host figures; `reuse_ratio` is the share of
+            requests served on an already-open connection
+        """
+        def summarize(requests: int, connections: int, retries: int) -> Dict:
+            return {
+                'requests': requests,
+                'new_connections': connections,
+                'reused': max(requests - connections, 0),
+                'reuse_ratio': (requests - connections) / requests if requests else 0.0,
+                'retries': retries
+            }
+
+        hosts = {
+            host: summarize(count, self.connections[host], self.retries[host])
+            for host, count in self.requests.items()
+        }
+        total = summarize(
+            sum(self.requests.values()),
+            sum(self.connections.values()),
+            sum(self.retries.values())
+        )
+        return {**total, 'http2': HTTP2_AVAILABLE and config.HTTP2_ENABLED, 'hosts': hosts}
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees the per-host slot once the body is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class PublicOnlyTransport(httpx.AsyncBaseTransport):
+    """
+    Refuses PUBLIC_ONLY requests whose host resolves to a non-public address
+
+    Each request is checked on its own, so every redirect hop is resolved
+    and checked before it is sent. The request is then sent to the address
+    that was checked, with the original Host header and TLS server name, so
+    a DNS answer that changes between the check and the connect (DNS
+    rebinding) can't send it anywhere else. Keeps user-supplied URLs from
+    reaching localhost, the internal network or cloud metadata endpoints
+    (169.254.169.254). Requests without the extension (e.g. to Ollama) pass
+    through.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.extensions.get(PUBLIC_ONLY):
+            return await self._transport.handle_async_request(request)
+
+        addresses = await self._check(request)
+        for index, address in enumerate(addresses):
+            try:
+                return await self._transport.handle_async_request(self._pinned(request, address))
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Nothing was sent; try the host's next address
+                if index == len(addresses) - 1:
+                    raise
+
+    def _pinned(self, request: httpx.Request, address: str) -> httpx.Request:
+        """Copy of the request addressed to `address`, with its Host header and TLS server name kept"""
+        host = request.url.host
+        if address == host:
+            return request
+        extensions = dict(request.extensions)
+        if request.url.scheme == 'https':
+            extensions.setdefault('sni_hostname', host)
+        # The headers already carry Host: it was set when the request was built
+        return httpx.Request(request.method, request.url.copy_with(host=address), headers=request.headers,
+                             stream=request.stream, extensions=extensions)
+
+    async def _check(self, request: httpx.Request) -> List[str]:
+        """Resolve the request's host; its addresses, all of them public"""
+        host = request.url.host
+        try:
+            addresses = [ipaddress.ip_address(host).compressed]
+        except ValueError:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(
+                    host, request.url.port or (443 if request.url.scheme == 'https' else 80),
+                    type=socket.SOCK_STREAM
+                )
+            except socket.gaierror as e:
+                raise httpx.ConnectError(f"Cannot resolve {host}: {e}", request=request)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        blocked = [address for address in addresses if not is_public_address(address)]
+        if blocked:
+            raise BlockedAddress(f"Refusing to fetch {host}: it resolves to a non-public address ({blocked[0]})",
+                                 request=request)
+        return addresses
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """
+    Transport adding per-host concurrency limits, retries and reuse stats
+
+    httpx only limits connections for the pool as a whole; the per-host
+    semaphore keeps a single slow upstream from taking every connection.
+    A request is counted as using a new connection when httpcore reports a
+    TCP connect for it. Waiting for a slot counts against the request's pool
+    timeout, like waiting for a connection from httpx's own pool.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport,
+                 max_per_host: int = config.HTTP_MAX_CONNECTIONS_PER_HOST,
+                 retries: int = config.HTTP_RETRIES,
+                 backoff: float = config.HTTP_RETRY_BACKOFF):
+        self._transport = transport
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = ConnectionStats()
+        self._host_slots: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+
+    def _slot(self, host: str, limit: int) -> asyncio.Semaphore:
+        slot = self._host_slots.get((host, limit))
+        if slot is None:
+            slot = self._host_slots[(host, limit)] = asyncio.Semaphore(limit)
+        return slot
+
+    async def _acquire(self, slot: asyncio.Semaphore, request: httpx.Request):
+        timeout = request.extensions.get('timeout', {}).get('pool')
+        try:
+            await asyncio.wait_for(slot.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(
+                f"Timed out waiting for one of the {request.url.host} connection slots", request=request
+            )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slot = self._slot(host, request.extensions.get(HOST_LIMIT) or self.max_per_host)
+        attempt = 0
+
+        while True:
+            await self._acquire(slot, request)
+            released = False
+
+            def release():
+                nonlocal released
+                if not released:
+                    released = True
+                    slot.release()
+
+            request.extensions = {**request.extensions, 'trace': self._tracer(host, request.extensions.get('trace'))}
+            self.stats.requests[host] += 1
+            try:
+                response = await self._transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                release()
+                # Safe to retry for any method: the request never reached the server
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.stats.retries[host] += 1
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            except BaseException:
+                release()
+                raise
+
+            # A Retry-After is the server asking us to back off; leave that
+            # to the caller's rate limiter instead of retrying right away
+            if (response.status_code in RETRY_STATUSES and request.method in IDEMPOTENT_METHODS
+                    and attempt < self.retries and 'retry-after' not in response.headers):
+                await response.aclose()
+                release()
+                attempt += 1
+                self.stats.retries[host] += 1
+                await asyncio.sleep(self._delay(attempt))
+                continue
+
+            response.stream = _ReleasingStream(response.stream, release)
+            return response
+
+    def _delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+
+    def _tracer(self, host: str, inner):
+        async def trace(event_name: str, info: dict):
+            if event_name == 'connection.connect_tcp.complete':
+                self.stats.connections[host] += 1
+            if inner is not None:
+                await inner(event_name, info)
+        return trace
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def create_http_client(max_connections: int = config.HTTP_MAX_CONNECTIONS,
+                       max_keepalive: int = config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                       keepalive_expiry: float = config.HTTP_KEEPALIVE_EXPIRY,
+                       max_per_host: int = config.HTTP_MAX_CONNECTIONS_PER_HOST,
+                       retries: int = config.HTTP_RETRIES,
+                       http2: Optional[bool] = None,
+                       transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Create the shared keep-alive client
+
+    Args:
+        max_connections: Connection limit for the whole pool
+        max_keepalive: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept
+        max_per_host: Concurrent requests allowed per host (see HOST_LIMIT)
+        retries: Retries for connection failures and 502/503/504 on idempotent requests
+        http2: Negotiate HTTP/2 (defaults to config.HTTP2_ENABLED when h2 is installed)
+        transport: Transport to pool instead of a new httpx.AsyncHTTPTransport
+            (the benchmarks use one that routes upstream hosts to local fakes);
+            the connection limits and http2 then come from it, and PUBLIC_ONLY
+            requests are not checked
+
+    Returns:
+        httpx.AsyncClient; its transport's `stats` holds the reuse counters
+    """
+    if http2 is None:
+        http2 = config.HTTP2_ENABLED
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry
+    )
+    transport = PooledTransport(
+        transport or public_only_transport(httpx.AsyncHTTPTransport(limits=limits, http2=http2 and HTTP2_AVAILABLE)),
+        max_per_host=max_per_host,
+        retries=retries
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=config.REQUEST_TIMEOUT,
+        follow_redirects=True
+    )
+
+
+def public_only_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """Wrap a transport in the PUBLIC_ONLY check, unless SCRAPE_ALLOW_PRIVATE_ADDRESSES is set"""
+    if config.SCRAPE_ALLOW_PRIVATE_ADDRESSES:
+        return transport
+    return PublicOnlyTransport(transport)
+
+
+def connection_stats(client: httpx.AsyncClient) -> Optional[Dict]:
+    """Reuse counters for a client built by create_http_client()"""
+    transport = getattr(client, '_transport', None)
+    if isinstance(transport, PooledTransport):
+        return transport.stats.snapshot()
+    return None
@@ -0,0 +1,549 @@
+"""
+Background job queue for long-running scrape-and-generate requests
+
+Submitting returns a job id immediately; a fixed pool of worker tasks runs
+the jobs and clients poll or subscribe for the result. Job records live in
+a pluggable JobStore, and jobs waiting for a worker in a pluggable
+PendingQueue: in memory by default, or SQLiteJobStore with
+SQLitePendingQueue so that every server process on the host can answer
+status requests, take queued work and share one depth limit, and queued
+jobs and finished results survive a restart.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import config
+import metrics
+from concurrency import run_blocking
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = {SUCCEEDED, FAILED}
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue depth limit is reached"""
+
+
+@dataclass
+class Job:
+    """A submitted job and its outcome"""
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobStore:
+    """Where job records are kept; subclasses implement the storage"""
+
+    async def save(self, job: Job):
+        """Insert or update a job"""
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id"""
+        raise NotImplementedError
+
+    async def prune(self, finished_before: float):
+        """Drop finished jobs older than a timestamp"""
+        raise NotImplementedError
+
+    async def heartbeat(self):
+        """Called every JOB_HEARTBEAT_INTERVAL seconds while the queue runs"""
+
+    def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """Job records in a dict, visible to this process only"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    async def save(self, job: Job):
+        self._jobs[job.id] = Job(**job.to_dict())
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return Job(**job.to_dict()) if job is not None else None
+
+    async def prune(self, finished_before: float):
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < finished_before]:
+            del self._jobs[job_id]
+
+
+_JOB_COLUMNS = "id, status, params, result, error, created_at, started_at, finished_at"
+
+
+def _job_from_row(row) -> Job:
+    return Job(
+        id=row[0], status=row[1], params=json.loads(row[2]),
+        result=json.loads(row[3]) if row[3] is not None else None,
+        error=row[4], created_at=row[5], started_at=row[6], finished_at=row[7]
+    )
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job records in a SQLite file, shared by every process on the host
+
+    Each store gets a run id when it opens; jobs record the run id of the
+    process running them, and every run writes a heartbeat to the file.
+    Running jobs whose run has stopped sending heartbeats for
+    `orphan_timeout` seconds are marked failed, when the file is opened and
+    on every heartbeat, as are queued jobs only that run could start (see
+    SQLitePendingQueue). Process ids would not do: in a container the
+    server is PID 1 again after every restart.
+    """
+
+    def __init__(self, path: str, orphan_timeout: float = config.JOB_ORPHAN_TIMEOUT):
+        """
+        Open the store
+
+        Args:
+            path: SQLite file
+            orphan_timeout: Seconds without a heartbeat before a run's unfinished jobs are failed
+        """
+        self.run_id = uuid.uuid4().hex
+        self.orphan_timeout = orphan_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, run_id TEXT)"
+        )
+        # Files written before run ids have a process id `owner` column instead
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'run_id' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN run_id TEXT")
+        if 'portable' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN portable INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+        self._heartbeat()
+
+    def _heartbeat(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?)", (self.run_id, now))
+            self._conn.execute("DELETE FROM runs WHERE heartbeat < ?", (now - self.orphan_timeout,))
+            # Jobs of runs gone from the table (or from before run ids) have no one left to
+            # finish them; queued portable jobs wait for any other server instead
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE (status = ? OR (status = ? AND portable = 0)) "
+                "AND (run_id IS NULL OR run_id NOT IN (SELECT id FROM runs))",
+                (FAILED, "Interrupted by a server restart; please submit again", now, RUNNING, QUEUED)
+            )
+            self._conn.commit()
+
+    def _save(self, job: Job):
+        with self._lock:
+            # An upsert, not a replace: that would reset `portable`
+            self._conn.execute(
+                "INSERT INTO jobs "
+                "(id, status, params, result, error, created_at, started_at, finished_at, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = excluded.status, result = excluded.result, "
+                "error = excluded.error, started_at = excluded.started_at, "
+                "finished_at = excluded.finished_at, run_id = excluded.run_id",
+                (job.id, job.status, json.dumps(job.params),
+                 json.dumps(job.result) if job.result is not None else None,
+                 job.error, job.created_at, job.started_at, job.finished_at, self.run_id)
+            )
+            self._conn.commit()
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def _prune(self, finished_before: float):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (SUCCEEDED, FAILED, finished_before)
+            )
+            self._conn.commit()
+
+    async def save(self, job: Job):
+        await run_blocking(self._save, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await run_blocking(self._get, job_id)
+
+    async def prune(self, finished_before: float):
+        await run_blocking(self._prune, finished_before)
+
+    async def heartbeat(self):
+        await run_blocking(self._heartbeat)
+
+    def close(self):
+        with self._lock:
+            # Stopping cleanly finishes every job of this run first
+            self._conn.execute("DELETE FROM runs WHERE id = ?", (self.run_id,))
+            self._conn.commit()
+            self._conn.close()
+
+
+class PendingQueue:
+    """Jobs waiting for a worker; subclasses implement the storage"""
+
+    async def put(self, job: Job, portable: bool):
+        """
+        Queue a job already saved to the store
+
+        Args:
+            job: The job
+            portable: Any process sharing the queue may run it (False: only this one,
+                e.g. because its context lives in this process's memory)
+        """
+        raise NotImplementedError
+
+    async def claim(self) -> Job:
+        """Wait for the next job this process may run and take it"""
+        raise NotImplementedError
+
+    async def depth(self) -> int:
+        """Jobs waiting for a worker"""
+        raise NotImplementedError
+
+    async def abandon(self) -> List[Job]:
+        """On shutdown: take the waiting jobs no other process can run"""
+        raise NotImplementedError
+
+
+class MemoryPendingQueue(PendingQueue):
+    """Waiting jobs in an asyncio.Queue, run by this process only"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def put(self, job: Job, portable: bool):
+        # The worker updates its own copy
+        self._queue.put_nowait(Job(**job.to_dict()))
+
+    async def claim(self) -> Job:
+        return await self._queue.get()
+
+    async def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def abandon(self) -> List[Job]:
+        jobs = []
+        while not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+        return jobs
+
+
+class SQLitePendingQueue(PendingQueue):
+    """
+    Waiting jobs in a SQLiteJobStore's file, shared by every process using it
+
+    A worker claims a job by switching its row from queued to running, so
+    any server can start a job submitted to another, the depth limit
+    covers the whole file, and queued jobs outlive the server that took
+    them. Jobs that aren't portable can only be claimed by the run that
+    submitted them. Workers look for jobs when one is queued here and
+    every `poll_interval` seconds otherwise.
+    """
+
+    def __init__(self, store: SQLiteJobStore, poll_interval: float = config.JOB_POLL_INTERVAL):
+        """
+        Args:
+            store: Store whose file holds the jobs
+            poll_interval: Seconds between looks for jobs queued by other processes
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self._queued = asyncio.Event()
+
+    def _set_portable(self, job_id: str):
+        with self.store._lock:
+            self.store._conn.execute("UPDATE jobs SET portable = 1 WHERE id = ?", (job_id,))
+            self.store._conn.commit()
+
+    def _claim(self) -> Optional[Job]:
+        store = self.store
+        with store._lock:
+            while True:
+                row = store._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND (portable = 1 OR run_id = ?) "
+                    "ORDER BY created_at LIMIT 1", (QUEUED, store.run_id)
+                ).fetchone()
+                if row is None:
+                    return None
+                # Only one process's update finds the row still queued
+                claimed = store._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, run_id = ? WHERE id = ? AND status = ?",
+                    (RUNNING, time.time(), store.run_id, row[0], QUEUED)
+                ).rowcount
+                store._conn.commit()
+                if claimed:
+                    return _job_from_row(store._conn.execute(
+                        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (row[0],)
+                    ).fetchone())
+
+    def _depth(self) -> int:
+        with self.store._lock:
+            return self.store._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def _abandon(self) -> List[Job]:
+        with self.store._lock:
+            rows = self.store._conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? AND portable = 0 AND run_id = ?",
+                (QUEUED, self.store.run_id)
+            ).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    async def put(self, job: Job, portable: bool):
+        if portable:
+            await run_blocking(self._set_portable, job.id)
+        self._queued.set()
+
+    async def claim(self) -> Job:
+        while True:
+            # Cleared before looking, so a job queued meanwhile wakes the wait below
+            self._queued.clear()
+            job = await run_blocking(self._claim)
+            if job is not None:
+                return job
+            try:
+                await asyncio.wait_for(self._queued.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def depth(self) -> int:
+        return await run_blocking(self._depth)
+
+    async def abandon(self) -> List[Job]:
+        return await run_blocking(self._abandon)
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs run by a fixed pool of worker tasks
+
+    `handler(params, context)` does the work and returns the job's result.
+    `context` is whatever was passed to submit() (e.g. a lease on the backend);
+    it stays in memory and is never written to the store, so secrets such
+    as API keys don't belong in `params`. A job with a context can only
+    run in the process that submitted it; one without may be claimed by
+    any process sharing the pending queue, and its handler gets None.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], Any], Awaitable[Dict[str, Any]]],
+                 store: Optional[JobStore] = None,
+                 pending: Optional[PendingQueue] = None,
+                 workers: int = config.JOB_WORKERS,
+                 max_depth: int = config.JOB_QUEUE_MAX_DEPTH,
+                 result_ttl: float = config.JOB_RESULT_TTL):
+        """
+        Initialize the queue
+
+        Args:
+            handler: Coroutine function running one job
+            store: Job record storage (in memory if not provided)
+            pending: Where jobs wait for a worker (in memory if not provided)
+            workers: Jobs run concurrently
+            max_depth: Jobs waiting to start before submit() raises QueueFull
+            result_ttl: Seconds finished jobs are kept
+        """
+        self.handler = handler
+        self.store = store or MemoryJobStore()
+        self.pending = pending or MemoryPendingQueue()
+        self.workers = workers
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self._depth = 0
+        self._contexts: Dict[str, Any] = {}
+        self._tasks = []
+        self._updated = asyncio.Condition()
+        self._version = 0
+        self.running = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start the worker tasks and the store's heartbeat"""
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._heartbeat()))
+
+    async def stop(self):
+        """Cancel the workers; unfinished jobs are marked failed"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in await self.pending.abandon():
+            await self._finish(job, error="Server shut down before the job started")
+        self.store.close()
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for a worker, as of the last submit, claim or heartbeat"""
+        return self._depth
+
+    async def submit(self, params: Dict[str, Any], context: Any = None) -> Job:
+        """
+        Queue a job
+
+        Args:
+            params: JSON-serializable job parameters (stored with the job)
+            context: In-memory value passed to the handler (not stored); ties the job to this process
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFull: max_depth jobs are already waiting
+        """
+        self._depth = await self.pending.depth()
+        if self._depth >= self.max_depth:
+            self.rejected += 1
+            raise QueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+        job = Job(params=params)
+        await self.store.save(job)
+        if context is not None:
+            self._contexts[job.id] = context
+        await self.pending.put(job, portable=context is None)
+        self._depth += 1
+        self.submitted += 1
+        await self.store.prune(time.time() - self.result_ttl)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Current state of a job"""
+        return await self.store.get(job_id)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Job]:
+        """
+        Yield the job each time its status changes, ending once it finishes
+
+        Jobs run by another process sharing the store are picked up by
+        re-reading the store every JOB_POLL_INTERVAL seconds.
+        """
+        last_status = None
+        while True:
+            # Read the version first so a save racing the store read isn't missed
+            seen = self._version
+            job = await self.store.get(job_id)
+            if job is None:
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield job
+            if job.finished:
+                return
+            async with self._updated:
+                try:
+                    await asyncio.wait_for(
+                        self._updated.wait_for(lambda: self._version != seen),
+                        timeout=config.JOB_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Wait up to `timeout` seconds for a job to finish and return its latest state"""
+        job = None
+
+        async def follow():
+            nonlocal job
+            async for job in self.watch(job_id):
+                pass
+
+        try:
+            await asyncio.wait_for(follow(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await self.store.get(job_id) if job is None or not job.finished else job
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(config.JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self.store.heartbeat()
+                self._depth = await self.pending.depth()
+            except Exception as e:
+                # A busy or briefly unavailable store: try again next time
+                metrics.record_error('jobs', e)
+
+    async def _work(self):
+        while True:
+            job = await self.pending.claim()
+            self._depth = max(self._depth - 1, 0)
+            context = self._contexts.pop(job.id, None)
+            job.status = RUNNING
+            job.started_at = time.time()
+            metrics.JOB_QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at)
+            self.running += 1
+            try:
+                await self._save(job)
+                result = await self.handler(dict(job.params), context)
+            except asyncio.CancelledError:
+                await asyncio.shield(self._finish(job, error="Server shut down while the job was running"))
+                raise
+            except Exception as e:
+                await self._finish(job, error=str(e))
+            else:
+                await self._finish(job, result=result)
+            finally:
+                self.running -= 1
+
+    async def _finish(self, job: Job, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self._contexts.pop(job.id, None)
+        job.status = FAILED if error is not None else SUCCEEDED
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if error is not None:
+            self.failed += 1
+        else:
+            self.succeeded += 1
+        await self._save(job)
+
+    async def _save(self, job: Job):
+        await self.store.save(job)
+        async with self._updated:
+            self._version += 1
+            self._updated.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and job counters"""
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'running': self.running,
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'rejected': self.rejected
+        }
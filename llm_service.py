@@ -2,31 +2,172 @@
 LLM service for content repurposing using Anthropic's Claude API
 """
 import anthropic
-from typing import List, Dict
+import asyncio
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import os
+import config
+import metrics
+import structured
+import tracing
+import variations
+from streaming import parse_variations
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+# Instructions shared by every Claude request, sent first as a system block
+# marked for prompt caching; the task for the request (all three variations,
+# one style, or structured fields) follows in a second, uncached block, and
+# only the source content goes in the user turn. Anthropic only caches a
+# prefix of at least PROMPT_CACHE_MIN_TOKENS (1024 for Sonnet) and silently
+# ignores the marker below that, so the guide is kept above it: see
+# test_cacheable_prefix().
+STYLE_GUIDE = f"""You are an expert content strategist specializing in LinkedIn content creation. You turn posts written for other platforms (Twitter/X threads, Reddit posts and comments, Hacker News discussions, blog posts and existing LinkedIn posts) into LinkedIn posts that keep what made the original worth sharing while reading as if they were written for LinkedIn from the start.
+
+This guide applies to every request. The instructions after it say what to write for the current request and in which format; where they are more specific, follow them.
+
+## Audience
+
+LinkedIn readers are professionals scrolling a feed between meetings. They reward posts that teach them something, show a real experience, or give them a useful way to think about their work. They scroll past posts that read like advertisements, press releases or generic motivational quotes. Write for a smart reader who is not necessarily an expert in the topic of the original.
+
+## Repurposing the source
+
+- Keep the core message and insights of the original. Do not invent facts, numbers, quotes, companies or personal experiences that the source does not contain. If the source states a figure, keep it exact; if it gives none, do not make one up.
+- The original author's opinions stay theirs. When the post relays someone else's idea, make that clear ("A thread I read this week argued that...") rather than presenting it as your own first-hand experience, unless the source is clearly the user's own writing.
+- Drop platform-specific artefacts: thread numbering such as "1/7", @mentions, subreddit names, "edit:" notes, upvote talk, link-only lines and replies to other commenters.
+- Expand abbreviations and in-jokes that only make sense on the source platform. Keep technical terms the audience will know.
+- A very short source (a single tweet) needs context and a takeaway to become a full post; a very long source (a long Reddit post or thread) needs its best two or three points, not a summary of everything.
+
+## Structure and formatting
+
+- The first line is the hook. It is all most readers see before "...see more", so it must make them want to read on: a surprising claim, a concrete result, a tension or a question. Keep it under about 150 characters and do not start with the hashtags, an emoji or "I'm excited to share".
+- Use short paragraphs of one to three sentences, separated by blank lines, so the post is easy to scan on a phone.
+- Lists are welcome for steps, lessons or comparisons; keep each item to one line where possible.
+- Posts are between {config.MIN_POST_LENGTH} and {config.MAX_POST_LENGTH} words. Plain text only: LinkedIn does not render Markdown, so no headings, bold markers, tables or links in Markdown syntax.
+- Use emoji sparingly, if at all, and never more than one per paragraph.
+
+## Tone
+
+Professional yet engaging: confident, specific and human. Prefer concrete details to adjectives, active voice to passive, and plain words to jargon. Avoid clickbait, exaggerated superlatives, humble-brags and filler phrases such as "In today's fast-paced world", "Let that sink in" or "Game-changer".
+
+## Ending and hashtags
+
+- End with a clear call-to-action or a thought-provoking question that invites comments from the reader's own experience, for example "What is the one metric your team would never give up?". Avoid asking for likes or shares.
+- Add {config.HASHTAG_COUNT_RANGE[0]}-{config.HASHTAG_COUNT_RANGE[1]} relevant hashtags after the last line, written in CamelCase (#SoftwareEngineering, not #softwareengineering). Mix one broad tag with more specific ones; never use hashtags inside sentences.
+
+## Styles
+
+Each post is written in one of these styles. When several posts are requested for the same source, each must read clearly differently, not as the same post with different openings.
+
+- Storytelling: personal, narrative-driven. Open in the middle of a moment or a problem, walk through what happened and what changed, and land on the lesson. Use first person only for experiences the source actually describes; otherwise tell the story of the people or team in the source.
+- Analytical: data-driven, insights-focused. Lead with the key finding or number, explain why it matters, and break the reasoning into a few clear points or a short list. Separate what the source shows from what it suggests, and name trade-offs and limits.
+- Conversational: casual, question-driven. Write the way you would talk to a colleague over coffee: direct address, shorter sentences, an honest opinion, and questions to the reader throughout, not only at the end.
+
+## Before answering
+
+Check that the post keeps the source's meaning, has a hook in its first line, stays within the length, ends with a call-to-action or question followed by the hashtags, and contains nothing about these instructions, the source platform's mechanics or the fact that it was repurposed."""
+
+
+# The task for a single-call request; sent after STYLE_GUIDE
+SYSTEM_PROMPT = """Create 3 different variations of the user's post, optimized for LinkedIn and following the guide above. Make each variation distinct in style:
+- **Variation 1**: Storytelling approach (personal, narrative-driven)
+- **Variation 2**: Analytical approach (data-driven, insights-focused)
+- **Variation 3**: Conversational approach (casual, question-driven)
+
+Format your response EXACTLY as follows:
+
+VARIATION 1:
+[Your first LinkedIn post here]
+
+VARIATION 2:
+[Your second LinkedIn post here]
+
+VARIATION 3:
+[Your third LinkedIn post here]
+
+Do not include any additional text outside of these three variations."""
+
+
+def system_blocks(instructions: str) -> List[Dict[str, object]]:
+    """
+    System blocks for one request: STYLE_GUIDE, then the request's own instructions
+
+    Both blocks are marked for caching. The first breakpoint lets every kind
+    of request share the cached guide; the second caches the guide together
+    with the instructions, which are fixed for each kind of request.
+    """
+    return [
+        {
+            "type": "text",
+            "text": STYLE_GUIDE,
+            "cache_control": {"type": "ephemeral"}
+        },
+        {
+            "type": "text",
+            "text": instructions,
+            "cache_control": {"type": "ephemeral"}
+        }
+    ]
+
+
+def summarize_usage(counters: Dict[str, float]) -> Dict[str, float]:
+    """Add per-request averages to raw usage counters"""
+    usage = dict(counters)
+    requests = usage["requests"]
+    hits = usage["cache_hit_requests"]
+    misses = requests - hits
+    uncached_input = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+    usage.update({
+        "avg_input_tokens": uncached_input / requests if requests else 0.0,
+        "avg_cache_read_input_tokens": usage["cache_read_input_tokens"] / requests if requests else 0.0,
+        "avg_latency_cache_hit": usage["cache_hit_seconds"] / hits if hits else None,
+        "avg_latency_cache_miss": usage["cache_miss_seconds"] / misses if misses else None
+    })
+    return usage
+
+
 class ContentRepurposer:
     """Uses Claude API to repurpose content for LinkedIn"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, model: str = config.DEFAULT_MODEL, base_url: Optional[str] = None,
+                 structured_output: Optional[bool] = None):
         """
         Initialize the content repurposer
         
         Args:
             api_key: Anthropic API key (if not provided, reads from environment)
+            model: Claude model to use
+            base_url: Anthropic API base URL (e.g. a local fake server for offline testing)
+            structured_output: Ask for posts through a forced tool call (default: config.STRUCTURED_OUTPUT)
         """
         self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
         if not self.api_key:
             raise ValueError("Anthropic API key not found. Set ANTHROPIC_API_KEY environment variable.")
         
-        self.client = anthropic.Anthropic(api_key=self.api_key)
-        self.model = "claude-sonnet-4-20250514"
+        self.client = anthropic.AsyncAnthropic(api_key=self.api_key, base_url=base_url)
+        self.model = model
+        self.temperature = config.TEMPERATURE
+        self.max_tokens = config.MAX_TOKENS
+        self.structured_output = config.STRUCTURED_OUTPUT if structured_output is None else structured_output
+        self.usage = {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_hit_requests": 0,
+            "cache_hit_seconds": 0.0,
+            "cache_miss_seconds": 0.0
+        }
     
-    def generate_linkedin_posts(self, original_content: str, platform: str, author: str = None) -> List[str]:
+    async def aclose(self):
+        """Close the underlying Anthropic client and its connection pool"""
+        await self.client.close()
+    
+    async def generate_linkedin_posts(self, original_content: str, platform: str, author: str = None,
+                                      parallel: bool = False) -> List[str]:
         """
         Generate 3 variations of LinkedIn posts from the original content
         
@@ -34,110 +175,342 @@ class ContentRepurposer:
             original_content: The scraped content from social media
             platform: Source platform (twitter, linkedin, reddit)
             author: Original author name
+            parallel: Request each style separately and concurrently instead of in one completion
             
         Returns:
             List of 3 repurposed LinkedIn posts
         """
         
+        if parallel:
+            return await variations.generate_parallel(
+                lambda number: self.generate_variation(original_content, platform, author, number)
+            )
+        
+        if self.structured_output:
+            return structured.render(await self.generate_structured_posts(original_content, platform, author))
+        
         prompt = self._create_prompt(original_content, platform, author)
         
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            start = time.perf_counter()
+            with tracing.span('model.call', backend='llm', model=self.model) as span:
+                response = await self.client.messages.create(**self._request_params(prompt))
+                self._record_usage(response.usage, time.perf_counter() - start, span)
             
             # Extract the response text
             response_text = response.content[0].text
             
             # Parse the three variations
-            posts = self._parse_response(response_text)
+            with metrics.stage('parse'):
+                outcome = parse_variations(response_text)
+            
+            # Write any variation the completion lacks on its own
+            return await variations.fill_missing(
+                outcome,
+                lambda number: self.generate_variation(original_content, platform, author, number),
+                'llm'
+            )
+            
+        except Exception as e:
+            metrics.record_error('generate', e)
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    async def generate_variation(self, original_content: str, platform: str, author: str = None,
+                                 number: int = 1) -> str:
+        """
+        Generate a single variation in one style
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            number: Style number from config.VARIATION_STYLES
+            
+        Returns:
+            The LinkedIn post
+        """
+        
+        if self.structured_output:
+            post = await self.generate_structured_variation(original_content, platform, author, number)
+            return structured.render([post])[0]
+        
+        prompt = self._create_prompt(original_content, platform, author)
+        params = self._request_params(prompt)
+        params["max_tokens"] = config.VARIATION_MAX_TOKENS
+        params["system"] = system_blocks(variations.create_variation_instructions(number))
+        
+        try:
+            start = time.perf_counter()
+            with tracing.span('model.call', backend='llm', model=self.model, variation=number) as span:
+                response = await self.client.messages.create(**params)
+                self._record_usage(response.usage, time.perf_counter() - start, span)
+            return variations.clean_variation(response.content[0].text)
+            
+        except Exception as e:
+            metrics.record_error('generate', e)
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    async def generate_structured_posts(self, original_content: str, platform: str, author: str = None,
+                                        parallel: bool = False) -> List[Optional[structured.StructuredPost]]:
+        """
+        Generate every variation as typed fields through a forced tool call
+        
+        Fields that fail validation are requested again on their own; see
+        structured.complete_post.
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            parallel: Request each style separately and concurrently instead of in one call
+            
+        Returns:
+            Posts in style order; None where a post could not be completed
+        """
+        if parallel:
+            return await variations.generate_parallel(
+                lambda number: self.generate_structured_variation(original_content, platform, author, number)
+            )
+        return await structured.generate_posts(
+            self._call_structured, self._create_prompt(original_content, platform, author), 'llm', self.max_tokens
+        )
+    
+    async def generate_structured_variation(self, original_content: str, platform: str, author: str = None,
+                                            number: int = 1) -> Optional[structured.StructuredPost]:
+        """
+        Generate a single variation in one style as typed fields
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            number: Style number from config.VARIATION_STYLES
             
-            return posts
+        Returns:
+            The post, or None if it could not be completed
+        """
+        return await structured.generate_post(
+            self._call_structured, self._create_prompt(original_content, platform, author), number, 'llm'
+        )
+    
+    async def _call_structured(self, instructions: str, prompt: str, schema: Dict, max_tokens: int) -> Dict:
+        """
+        One Messages API call that must answer with the structured tool
+        
+        Returns:
+            The tool call's input ({} if the model didn't make one)
+        """
+        params = self._request_params(prompt)
+        params["max_tokens"] = max_tokens
+        params["system"] = system_blocks(instructions)
+        params["tools"] = [
+            {
+                "name": structured.TOOL_NAME,
+                "description": "Submit the LinkedIn posts",
+                "input_schema": schema
+            }
+        ]
+        params["tool_choice"] = {"type": "tool", "name": structured.TOOL_NAME}
+        
+        try:
+            start = time.perf_counter()
+            with tracing.span('model.call', backend='llm', model=self.model, output='structured') as span:
+                response = await self.client.messages.create(**params)
+                self._record_usage(response.usage, time.perf_counter() - start, span)
             
         except Exception as e:
+            metrics.record_error('generate', e)
             raise Exception(f"Error generating content: {str(e)}")
+        
+        for block in response.content:
+            if block.type == "tool_use" and block.name == structured.TOOL_NAME:
+                return block.input
+        return {}
+    
+    def variations_as_completed(self, original_content: str, platform: str,
+                                author: str = None) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Generate each style concurrently, yielding (style number, post) as each finishes
+        
+        Stop iterating early to cancel the variations still in flight. Styles
+        that fail are skipped; the error is raised only if all of them fail.
+        """
+        return variations.variations_as_completed(
+            lambda number: self.generate_variation(original_content, platform, author, number), 'llm'
+        )
+    
+    async def stream_linkedin_posts(self, original_content: str, platform: str, author: str = None) -> AsyncIterator[str]:
+        """
+        Stream the generated posts token by token
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            
+        Yields:
+            Text chunks as Claude produces them
+        """
+        
+        prompt = self._create_prompt(original_content, platform, author)
+        
+        try:
+            start = time.perf_counter()
+            first = True
+            # Not activated: this generator runs in the consumer's context
+            with tracing.span('model.stream', activate=False, backend='llm', model=self.model) as span:
+                async with self.client.messages.stream(**self._request_params(prompt)) as stream:
+                    async for text in stream.text_stream:
+                        if first:
+                            metrics.observe_ttft('llm', self.model, time.perf_counter() - start)
+                            span.set_attribute('ttft_ms', round((time.perf_counter() - start) * 1000, 1))
+                            first = False
+                        yield text
+                    message = await stream.get_final_message()
+                    self._record_usage(message.usage, time.perf_counter() - start, span)
+                    
+        except Exception as e:
+            metrics.record_error('generate', e)
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    def _request_params(self, prompt: str) -> Dict[str, object]:
+        """Messages API parameters: cacheable system blocks plus the per-source user turn"""
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "system": system_blocks(SYSTEM_PROMPT),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+    
+    def _record_usage(self, usage, elapsed: float, span=None):
+        """Accumulate token counts, including prompt cache reads and writes, and tag the call's span"""
+        cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_creation = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        self.usage["requests"] += 1
+        self.usage["input_tokens"] += usage.input_tokens
+        self.usage["output_tokens"] += usage.output_tokens
+        self.usage["cache_creation_input_tokens"] += cache_creation
+        self.usage["cache_read_input_tokens"] += cache_read
+        metrics.observe_generation('llm', self.model, elapsed,
+                                   usage.input_tokens + cache_creation + cache_read, usage.output_tokens)
+        if span is not None:
+            span.set_attribute('tokens.input', usage.input_tokens)
+            span.set_attribute('tokens.output', usage.output_tokens)
+            span.set_attribute('tokens.cache_read', cache_read)
+        if cache_read:
+            self.usage["cache_hit_requests"] += 1
+            self.usage["cache_hit_seconds"] += elapsed
+        else:
+            self.usage["cache_miss_seconds"] += elapsed
+    
+    def usage_stats(self) -> Dict[str, float]:
+        """
+        Token usage and prompt cache effect
+        
+        Returns:
+            Raw counters plus per-request averages and the mean latency of
+            requests that did and didn't read from the prompt cache
+        """
+        return summarize_usage(self.usage)
+    
+    def generation_params(self) -> Dict[str, object]:
+        """Model and sampling parameters that determine the output (used for cache keys)"""
+        params = {
+            "backend": "llm",
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        if self.structured_output:
+            params["output"] = "structured"
+        return params
+    
+    async def generate_bulk(self, items: List[Dict], poll_interval: float = config.BULK_POLL_INTERVAL,
+                            timeout: float = config.BULK_TIMEOUT) -> List[Dict]:
+        """
+        Generate posts for many items through the Message Batches API
+        
+        Batches are processed asynchronously by Anthropic at a discount and
+        don't count against interactive rate limits, which suits overnight
+        bulk runs. This call waits until the batch has ended.
+        
+        Args:
+            items: Dicts with original_content, platform and optional author
+            poll_interval: Seconds between status checks
+            timeout: Seconds to wait before giving up on the batch
+            
+        Returns:
+            One dict per input item, in input order, with `posts` and `error`
+        """
+        if not items:
+            return []
+        
+        requests = [
+            {
+                "custom_id": f"item-{index}",
+                "params": self._request_params(
+                    self._create_prompt(item['original_content'], item['platform'], item.get('author'))
+                )
+            }
+            for index, item in enumerate(items)
+        ]
+        
+        try:
+            batch = await self.client.messages.batches.create(requests=requests)
+            deadline = time.monotonic() + timeout
+            while batch.processing_status != "ended":
+                if time.monotonic() > deadline:
+                    await self.client.messages.batches.cancel(batch.id)
+                    raise TimeoutError(f"Message batch {batch.id} did not finish within {timeout} seconds")
+                await asyncio.sleep(poll_interval)
+                batch = await self.client.messages.batches.retrieve(batch.id)
+            
+            results: List[Dict] = [
+                {"posts": None, "error": "No result returned for this item"} for _ in items
+            ]
+            async for entry in await self.client.messages.batches.results(batch.id):
+                index = int(entry.custom_id.split('-', 1)[1])
+                if entry.result.type == "succeeded":
+                    results[index] = {
+                        "posts": parse_variations(entry.result.message.content[0].text).posts(),
+                        "error": None
+                    }
+                elif entry.result.type == "errored":
+                    results[index] = {"posts": None, "error": entry.result.error.error.message}
+                else:  # canceled or expired
+                    results[index] = {"posts": None, "error": f"Request {entry.result.type}"}
+            return results
+            
+        except Exception as e:
+            metrics.record_error('generate', e)
+            raise Exception(f"Error generating content in bulk: {str(e)}")
     
+    @tracing.traced('prompt')
     def _create_prompt(self, content: str, platform: str, author: str = None) -> str:
-        """Create the prompt for Claude"""
+        """Create the user turn for Claude (the fixed instructions are in STYLE_GUIDE and SYSTEM_PROMPT)"""
         
         author_info = f" by {author}" if author else ""
         
-        prompt = f"""You are an expert content strategist specializing in LinkedIn content creation. 
-
-I have a post from {platform.upper()}{author_info} that I want to repurpose for LinkedIn.
+        prompt = f"""I have a post from {platform.upper()}{author_info} that I want to repurpose for LinkedIn.
 
 Original content:
 ---
 {content}
----
-
-Please create 3 different variations of this content optimized for LinkedIn. Each variation should:
-
-1. Be professional yet engaging
-2. Maintain the core message and insights from the original
-3. Use LinkedIn-appropriate formatting (short paragraphs, line breaks for readability)
-4. Include relevant hashtags (2-5 hashtags)
-5. Have a strong hook in the first line
-6. Be between 150-300 words
-7. Have a clear call-to-action or thought-provoking question at the end
-
-Make each variation distinct in style:
-- **Variation 1**: Storytelling approach (personal, narrative-driven)
-- **Variation 2**: Analytical approach (data-driven, insights-focused)
-- **Variation 3**: Conversational approach (casual, question-driven)
+---"""
 
-Format your response EXACTLY as follows:
-
-VARIATION 1:
-[Your first LinkedIn post here]
-
-VARIATION 2:
-[Your second LinkedIn post here]
+        return prompt
 
-VARIATION 3:
-[Your third LinkedIn post here]
 
-Do not include any additional text outside of these three variations."""
-
-        return prompt
-    
-    def _parse_response(self, response_text: str) -> List[str]:
-        """Parse the Claude response into 3 separate posts"""
-        
-        # Split by variation markers
-        variations = []
-        
-        # Try to split by VARIATION markers
-        parts = response_text.split('VARIATION')
-        
-        for part in parts[1:]:  # Skip the first empty part
-            # Remove the variation number and colon
-            lines = part.strip().split('\n', 1)
-            if len(lines) > 1:
-                post_content = lines[1].strip()
-                variations.append(post_content)
-        
-        # Ensure we have exactly 3 variations
-        if len(variations) != 3:
-            # Fallback: try to split by double newlines
-            parts = response_text.split('\n\n\n')
-            variations = [part.strip() for part in parts if part.strip()]
-        
-        # If we still don't have 3, pad or truncate
-        while len(variations) < 3:
-            variations.append("Error: Could not generate variation. Please try again.")
-        
-        variations = variations[:3]
-        
-        return variations
+def test_cacheable_prefix():
+    """The cached guide must reach the caching minimum, or Anthropic ignores the marker"""
+    # Roughly four characters per token for English text
+    assert len(STYLE_GUIDE) / 4 >= config.PROMPT_CACHE_MIN_TOKENS, "STYLE_GUIDE is too short to be cached"
 
 
 def test_repurposer():
@@ -150,7 +523,7 @@ def test_repurposer():
     """
     
     print("Generating LinkedIn posts...")
-    posts = repurposer.generate_linkedin_posts(sample_content, "twitter", "Tech Influencer")
+    posts = asyncio.run(repurposer.generate_linkedin_posts(sample_content, "twitter", "Tech Influencer"))
     
     for i, post in enumerate(posts, 1):
         print(f"\n{'='*50}")
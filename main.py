@@ -1,25 +1,332 @@
 """
 FastAPI application for Content Repurposing Agent
 """
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Form, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from scraper import ContentScraper
-from llm_service import ContentRepurposer
-from slm_service import ContentRepurposerSLM
+from backends import BackendRegistry
+from batch import parse_items, run_batch
+from concurrency import run_blocking, shutdown as shutdown_executor
+from streaming import MISSING_VARIATION, VariationParser, sse_event
+from structured import StructuredPost, render
+import variations
+from cache import GenerationCache, ScrapeCache, generation_key
+from dedup import NearDuplicates, scope_of
+from http_client import create_http_client, connection_stats
+from singleflight import SingleFlight
+from jobs import JobQueue, QueueFull, SQLiteJobStore, SQLitePendingQueue
+import config
+import metrics
+import tracing
+import httpx
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Content Repurposing Agent")
+# Initialize services
+scrape_cache = ScrapeCache()
+generation_cache = GenerationCache()
+# Concurrent requests for the same generation key share one model call
+generation_flights = SingleFlight()
+# Earlier generations by content similarity (loaded in the lifespan)
+near_duplicates: NearDuplicates = None
+
+# Created by the lifespan: one keep-alive connection pool shared by the
+# scrapers and the Ollama client
+http_client: httpx.AsyncClient = None
+scraper: ContentScraper = None
+backends: BackendRegistry = None
+jobs: JobQueue = None
+# Outcome of the startup model preload: model -> seconds each server spent loading it
+ollama_preload = {}
+_preload_task: asyncio.Task = None
+
+
+async def _preload_models():
+    """
+    Load the configured Ollama models so the first requests don't pay for it
+    
+    The leases are never released: a preloaded backend stays in the
+    registry, keeping its model warm through quiet periods, and serves
+    every request for that model on OLLAMA_BASE_URL.
+    """
+    for model in config.OLLAMA_PRELOAD_MODELS:
+        try:
+            lease = await backends.lease("slm", base_url=config.OLLAMA_BASE_URL, model=model)
+            ollama_preload[model] = await lease.backend.warm_up()
+        except Exception as e:
+            ollama_preload[model] = {'error': str(e)}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the shared connection pool and job workers; release them and worker threads on shutdown"""
+    global http_client, scraper, backends, jobs, near_duplicates, _preload_task
+    tracing.configure()
+    if config.DEDUP_ENABLED:
+        # Loading a saved index rebuilds its buckets, keep it off the event loop
+        near_duplicates = await run_blocking(NearDuplicates)
+    http_client = create_http_client()
+    scraper = ContentScraper(client=http_client, cache=scrape_cache)
+    backends = BackendRegistry(http_client=http_client)
+    if config.JOB_STORE_DB:
+        # Every server using the file shares the job records and the queue
+        store = SQLiteJobStore(config.JOB_STORE_DB)
+        jobs = JobQueue(_run_job, store=store, pending=SQLitePendingQueue(store))
+    else:
+        jobs = JobQueue(_run_job)
+    jobs.start()
+    # In the background: startup shouldn't wait for (or need) Ollama
+    _preload_task = asyncio.ensure_future(_preload_models())
+    yield
+    _preload_task.cancel()
+    await asyncio.gather(_preload_task, return_exceptions=True)
+    await jobs.stop()
+    await backends.aclose()
+    await http_client.aclose()
+    generation_cache.close()
+    if near_duplicates is not None:
+        near_duplicates.save()
+    await tracing.shutdown()
+    shutdown_executor()
+
+
+app = FastAPI(title="Content Repurposing Agent", lifespan=lifespan)
+app.add_middleware(metrics.ServerTimingMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 # Setup templates
 templates = Jinja2Templates(directory="templates")
 
-# Initialize services
-scraper = ContentScraper()
+
+async def _resolve_content(url: str, manual_content: str, platform: str):
+    """Scrape the URL if given, otherwise use the manual content"""
+    if url:
+        with metrics.stage('scrape'):
+            scraped_data = await scraper.scrape(url)
+        if scraped_data.get('error'):
+            raise ValueError(scraped_data['content'])
+        return scraped_data['content'], scraped_data['platform'], scraped_data['author']
+    return manual_content, platform, "Manual Input"
+
+
+def _is_complete(posts) -> bool:
+    """True if no variation is the parser's error placeholder (or, for structured output, missing)"""
+    return MISSING_VARIATION not in posts and None not in posts
+
+
+def _generation_params(repurposer, parallel: bool = False, structured: bool = False) -> dict:
+    """
+    Model and sampling parameters; parallel mode writes differently and
+    structured output is stored as fields, so each gets its own entries
+    """
+    params = repurposer.generation_params()
+    if parallel:
+        params['mode'] = 'parallel'
+    if structured:
+        params['output'] = 'structured'
+    return params
+
+
+def _generation_key(repurposer, content: str, platform: str, author: str, parallel: bool = False,
+                    structured: bool = False) -> str:
+    """Cache key for a request"""
+    return generation_key(content, platform, author, **_generation_params(repurposer, parallel, structured))
+
+
+def _fields(posts) -> list:
+    """Structured posts as field dicts (None where a post could not be completed), as cached"""
+    return [post.to_dict() if post is not None else None for post in posts]
+
+
+def _render_fields(fields) -> list:
+    """Cached field dicts as post text"""
+    return render([StructuredPost(**post) if post is not None else None for post in fields])
+
+
+async def _near_duplicate(repurposer, content: str, platform: str, author: str, parallel: bool = False,
+                          structured: bool = False):
+    """
+    Look for earlier content close to this one
+    
+    Returns:
+        Tuple of (match or None, the match's stored posts when DEDUP_ACTION
+        is "reuse" and they are still cached, else None)
+    """
+    if near_duplicates is None:
+        return None, None
+    with metrics.stage('dedup'):
+        scope = scope_of(platform, author, **_generation_params(repurposer, parallel, structured))
+        match = await near_duplicates.find(content, scope)
+        if match is None or config.DEDUP_ACTION != 'reuse':
+            return match, None
+        return match, await generation_cache.get(match['key'])
+
+
+async def _remember(repurposer, content: str, platform: str, author: str, parallel: bool, key: str,
+                    structured: bool = False):
+    """Index generated content for near-duplicate lookups"""
+    if near_duplicates is not None:
+        scope = scope_of(platform, author, **_generation_params(repurposer, parallel, structured))
+        await near_duplicates.add(content, scope, key)
+
+
+async def _generate(repurposer, content: str, platform: str, author: str, fresh: bool = False,
+                    parallel: bool = False, structured: bool = False):
+    """
+    Generate posts through the generation cache
+    
+    Identical requests arriving while one is being generated wait for it
+    instead of calling the model again. A near-duplicate of earlier content
+    gets the earlier posts, or is generated and flagged (DEDUP_ACTION).
+    `fresh` requests ask for a new sample, so they are neither looked up,
+    stored, coalesced nor matched.
+    
+    With `structured` (or the backend's STRUCTURED_OUTPUT default) the
+    posts are generated as typed fields, which are cached and returned
+    along with the rendered text.
+    
+    Returns:
+        Tuple of (posts, cached, near_duplicate match or None, fields or None)
+    """
+    structured = structured or repurposer.structured_output
+    key = _generation_key(repurposer, content, platform, author, parallel, structured)
+    
+    async def generate():
+        if structured:
+            posts = _fields(await repurposer.generate_structured_posts(content, platform, author, parallel=parallel))
+        else:
+            posts = await repurposer.generate_linkedin_posts(
+                original_content=content,
+                platform=platform,
+                author=author,
+                parallel=parallel
+            )
+        if _is_complete(posts) and not fresh:
+            await generation_cache.set(key, posts)
+            await _remember(repurposer, content, platform, author, parallel, key, structured)
+        return posts
+    
+    def result(posts, cached, duplicate):
+        if structured:
+            return _render_fields(posts), cached, duplicate, posts
+        return posts, cached, duplicate, None
+    
+    if fresh:
+        with metrics.stage('generate'):
+            return result(await generate(), False, None)
+    
+    with metrics.stage('cache'):
+        posts = await generation_cache.get(key)
+    if posts is not None:
+        return result(posts, True, None)
+    duplicate, posts = await _near_duplicate(repurposer, content, platform, author, parallel, structured)
+    if posts is not None:
+        return result(posts, True, duplicate)
+    with metrics.stage('generate'):
+        posts = await generation_flights.do(key, generate)
+    return result(list(posts), False, duplicate)
+
+
+def _variations_as_completed(repurposer, content: str, platform: str, author: str, structured: bool,
+                             model_type: str):
+    """
+    (style number, post) as each style finishes, skipping styles that fail;
+    structured posts are StructuredPost or None
+    """
+    if structured:
+        return variations.variations_as_completed(
+            lambda number: repurposer.generate_structured_variation(content, platform, author, number),
+            model_type
+        )
+    return repurposer.variations_as_completed(content, platform, author)
+
+
+async def _holding(lease, body):
+    """Pass a streamed response body through, releasing the backend lease once it ends or is closed"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        lease.release()
+
+
+def _error_response(e: Exception, status_code: int = 400) -> JSONResponse:
+    """Count the error and report it to the client"""
+    metrics.record_error('request', e)
+    return JSONResponse(
+        content={"error": str(e)},
+        status_code=status_code
+    )
+
+
+def _collect_metrics():
+    """Copy the counters kept by the caches and the job queue into the metrics registry"""
+    scrape = scrape_cache.stats()
+    lookups = {'hit': scrape['hits'], 'negative_hit': scrape['negative_hits'],
+               'revalidated': scrape['revalidated'], 'miss': scrape['misses']}
+    for result, count in lookups.items():
+        metrics.CACHE_LOOKUPS.set(count, cache='scrape', result=result)
+    total = sum(lookups.values())
+    metrics.CACHE_HIT_RATIO.set((scrape['hits'] + scrape['negative_hits']) / total if total else 0.0, cache='scrape')
+    
+    generation = generation_cache.stats()
+    metrics.CACHE_LOOKUPS.set(generation['hits'] - generation['disk_hits'], cache='generation', result='hit')
+    metrics.CACHE_LOOKUPS.set(generation['disk_hits'], cache='generation', result='disk_hit')
+    metrics.CACHE_LOOKUPS.set(generation['misses'], cache='generation', result='miss')
+    metrics.CACHE_HIT_RATIO.set(generation['hit_rate'], cache='generation')
+    
+    if near_duplicates is not None:
+        duplicates = near_duplicates.stats()
+        metrics.CACHE_LOOKUPS.set(duplicates['matches'], cache='near_duplicate', result='hit')
+        metrics.CACHE_LOOKUPS.set(duplicates['lookups'] - duplicates['matches'], cache='near_duplicate', result='miss')
+        metrics.CACHE_HIT_RATIO.set(duplicates['match_rate'], cache='near_duplicate')
+    
+    if jobs is not None:
+        metrics.JOB_QUEUE_DEPTH.set(jobs.depth)
+
+
+metrics.REGISTRY.add_callback(_collect_metrics)
+
+
+async def _run_job(params, lease):
+    """
+    Job handler: the work of /api/scrape-and-generate
+    
+    Ollama jobs come without a lease (any server sharing the queue may run
+    them) and take their own.
+    """
+    # Spans of the job belong to the request that submitted it
+    tracing.use_request_id(params.get('request_id'))
+    if lease is None:
+        lease = await backends.lease(params['model_type'], base_url=params.get('base_url'), model=params.get('model'))
+    try:
+        with tracing.span('job', platform=params['platform']):
+            content, platform, author = await _resolve_content(
+                params['url'], params['manual_content'], params['platform']
+            )
+            posts, cached, duplicate, fields = await _generate(lease.backend, content, platform, author,
+                                                               params['fresh'], params['parallel'],
+                                                               params.get('structured', False))
+    finally:
+        lease.release()
+    return {
+        "success": True,
+        "scraped_content": content,
+        "platform": platform,
+        "author": author,
+        "posts": posts,
+        "fields": fields,
+        "cached": cached,
+        "near_duplicate": duplicate
+    }
+
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -30,35 +337,34 @@ async def home(request: Request):
 async def scrape_content(url: str = Form(...)):
     """Scrape content from URL"""
     try:
-        result = scraper.scrape(url)
+        result = await scraper.scrape(url)
         return JSONResponse(content=result)
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=400
-        )
+        return _error_response(e)
 
 @app.post("/api/generate")
 async def generate_posts(
     content: str = Form(...),
     platform: str = Form(...),
     author: str = Form(default="Unknown"),
-    api_key: str = Form(...)
+    api_key: str = Form(...),
+    fresh: bool = Form(False),
+    parallel: bool = Form(False),
+    structured: bool = Form(False)
 ):
-    """Generate LinkedIn posts from content"""
+    """
+    Generate LinkedIn posts from content
+    
+    With `structured`, `fields` holds each post's style, hook, body and
+    hashtags (null for a post that could not be completed).
+    """
     try:
-        repurposer = ContentRepurposer(api_key=api_key)
-        posts = repurposer.generate_linkedin_posts(
-            original_content=content,
-            platform=platform,
-            author=author
-        )
-        return JSONResponse(content={"posts": posts})
+        async with backends.use("llm", api_key) as repurposer:
+            posts, cached, duplicate, fields = await _generate(repurposer, content, platform, author,
+                                                               fresh, parallel, structured)
+        return JSONResponse(content={"posts": posts, "fields": fields, "cached": cached, "near_duplicate": duplicate})
     except Exception as e:
-        return JSONResponse(
-            content={"error": str(e)},
-            status_code=400
-        )
+        return _error_response(e)
 
 @app.post("/api/scrape-and-generate")
 async def scrape_and_generate(
@@ -67,59 +373,402 @@ async def scrape_and_generate(
     platform: str = Form(...),
     model_type: str = Form(...),
     api_key: str = Form(None),
-    base_url: str = Form(None)
+    base_url: str = Form(None),
+    model: str = Form(None),
+    fresh: bool = Form(False),
+    parallel: bool = Form(False),
+    first_only: bool = Form(False),
+    structured: bool = Form(False)
 ):
-    """Combined endpoint - scrape URL or use manual content, then generate posts"""
+    """
+    Combined endpoint - scrape URL or use manual content, then generate posts
+    
+    With `first_only`, the styles are generated in parallel and the first one
+    to finish is returned; the others are cancelled. With `structured`,
+    `fields` holds each post's typed fields as well.
+    """
     try:
         # Get content
-        if url:
-            scraped_data = scraper.scrape(url)
-            if scraped_data.get('error'):
-                return JSONResponse(
-                    content={"error": scraped_data['content']},
-                    status_code=400
-                )
-            content = scraped_data['content']
-            platform = scraped_data['platform']
-            author = scraped_data['author']
-        else:
-            content = manual_content
-            author = "Manual Input"
+        content, platform, author = await _resolve_content(url, manual_content, platform)
         
         # Generate posts based on model type
-        if model_type == "llm":
-            if not api_key:
-                return JSONResponse(
-                    content={"error": "API key is required for LLM"},
-                    status_code=400
-                )
-            repurposer = ContentRepurposer(api_key=api_key)
-        else:  # slm
-            if not base_url:
-                return JSONResponse(
-                    content={"error": "Base URL is required for SLM"},
-                    status_code=400
-                )
-            repurposer = ContentRepurposerSLM(base_url=base_url)
-        
-        posts = repurposer.generate_linkedin_posts(
-            original_content=content,
-            platform=platform,
-            author=author
-        )
-        
-        return JSONResponse(content={
-            "success": True,
+        async with backends.use(model_type, api_key, base_url, model) as repurposer:
+            structured = structured or repurposer.structured_output
+            if first_only:
+                completed = _variations_as_completed(repurposer, content, platform, author, structured, model_type)
+                try:
+                    number, post = await completed.__anext__()
+                finally:
+                    # Cancels the styles still being written
+                    await completed.aclose()
+                fields = _fields([post]) if structured else None
+                return JSONResponse(content={
+                    "success": True,
+                    "scraped_content": content,
+                    "platform": platform,
+                    "author": author,
+                    "posts": render([post]) if structured else [post],
+                    "fields": fields,
+                    "variation": number,
+                    "cached": False
+                })
+            
+            posts, cached, duplicate, fields = await _generate(repurposer, content, platform, author,
+                                                               fresh, parallel, structured)
+            
+            return JSONResponse(content={
+                "success": True,
+                "scraped_content": content,
+                "platform": platform,
+                "author": author,
+                "posts": posts,
+                "fields": fields,
+                "cached": cached,
+                "near_duplicate": duplicate
+            })
+    except Exception as e:
+        return _error_response(e)
+
+@app.post("/api/scrape-and-generate/stream")
+async def scrape_and_generate_stream(
+    url: str = Form(None),
+    manual_content: str = Form(None),
+    platform: str = Form(...),
+    model_type: str = Form(...),
+    api_key: str = Form(None),
+    base_url: str = Form(None),
+    model: str = Form(None),
+    fresh: bool = Form(False),
+    parallel: bool = Form(False),
+    structured: bool = Form(False)
+):
+    """
+    Streaming variant of /api/scrape-and-generate using Server-Sent Events
+    
+    Events: `meta` (source content), `token` (text delta for a variation),
+    `variation` (a variation is complete), `done` (final posts) and `error`.
+    In parallel mode there are no `token` events; each `variation` is sent
+    as soon as its request finishes, in completion order. With structured
+    output there are no `token` events either: the posts are validated as a
+    whole, then sent as `variation` events carrying their `fields`.
+    """
+    try:
+        content, platform, author = await _resolve_content(url, manual_content, platform)
+        lease = await backends.lease(model_type, api_key, base_url, model)
+    except Exception as e:
+        return _error_response(e)
+    repurposer = lease.backend
+    
+    structured = structured or repurposer.structured_output
+    
+    def variation(number, text, fields=None):
+        data = {"variation": number, "text": text}
+        if structured:
+            data["fields"] = fields
+        return sse_event('variation', data)
+    
+    def done(posts, cached, duplicate):
+        # Structured posts are handled as field dicts and rendered here
+        if structured:
+            return sse_event('done', {"posts": _render_fields(posts), "fields": posts,
+                                      "cached": cached, "near_duplicate": duplicate})
+        return sse_event('done', {"posts": posts, "fields": None, "cached": cached, "near_duplicate": duplicate})
+    
+    async def events():
+        yield sse_event('meta', {
             "scraped_content": content,
             "platform": platform,
-            "author": author,
-            "posts": posts
+            "author": author
         })
+        
+        key = _generation_key(repurposer, content, platform, author, parallel, structured)
+        duplicate = None
+        if not fresh:
+            cached_posts = await generation_cache.get(key)
+            if cached_posts is None:
+                duplicate, cached_posts = await _near_duplicate(repurposer, content, platform, author,
+                                                                parallel, structured)
+            if cached_posts is not None:
+                texts = _render_fields(cached_posts) if structured else cached_posts
+                for number, (text, post) in enumerate(zip(texts, cached_posts), 1):
+                    yield variation(number, text, post)
+                yield done(cached_posts, True, duplicate)
+                return
+        
+        if parallel:
+            posts = {}
+            try:
+                async for number, post in _variations_as_completed(repurposer, content, platform, author,
+                                                                   structured, model_type):
+                    if structured:
+                        post = _fields([post])[0]
+                        yield variation(number, _render_fields([post])[0], post)
+                    else:
+                        yield variation(number, post)
+                    posts[number] = post
+                # A style whose request failed keeps the placeholder (and the result isn't cached)
+                missing = None if structured else MISSING_VARIATION
+                posts = [posts.get(number, missing) for number in variations.VARIATION_NUMBERS]
+                if _is_complete(posts) and not fresh:
+                    await generation_cache.set(key, posts)
+                    await _remember(repurposer, content, platform, author, parallel, key, structured)
+                yield done(posts, False, duplicate)
+            except Exception as e:
+                metrics.record_error('stream', e)
+                yield sse_event('error', {"error": str(e)})
+            return
+        
+        if structured:
+            try:
+                posts = _fields(await repurposer.generate_structured_posts(content, platform, author))
+                for number, (text, post) in enumerate(zip(_render_fields(posts), posts), 1):
+                    yield variation(number, text, post)
+                if _is_complete(posts) and not fresh:
+                    await generation_cache.set(key, posts)
+                    await _remember(repurposer, content, platform, author, parallel, key, structured)
+                yield done(posts, False, duplicate)
+            except Exception as e:
+                metrics.record_error('stream', e)
+                yield sse_event('error', {"error": str(e)})
+            return
+        
+        parser = VariationParser()
+        try:
+            async for text in repurposer.stream_linkedin_posts(
+                original_content=content,
+                platform=platform,
+                author=author
+            ):
+                for kind, number, payload in parser.feed(text):
+                    yield sse_event(kind, {"variation": number, "text": payload})
+            
+            for kind, number, payload in parser.close():
+                yield sse_event(kind, {"variation": number, "text": payload})
+            
+            # Write any variation the stream lacked on its own
+            outcome = parser.outcome()
+            posts = await variations.fill_missing(
+                outcome,
+                lambda number: repurposer.generate_variation(content, platform, author, number),
+                model_type
+            )
+            for number in outcome.missing:
+                yield sse_event('variation', {"variation": number, "text": posts[number - 1], "retried": True})
+            if _is_complete(posts) and not fresh:
+                await generation_cache.set(key, posts)
+                await _remember(repurposer, content, platform, author, parallel, key)
+            yield done(posts, False, duplicate)
+        except Exception as e:
+            metrics.record_error('stream', e)
+            yield sse_event('error', {"error": str(e)})
+    
+    return StreamingResponse(
+        _holding(lease, events()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _feed_items(url: str):
+    """Batch items for a feed's entries, read lazily and capped at BATCH_MAX_ITEMS"""
+    count = 0
+    async for entry in scraper.items(url):
+        yield {
+            'id': entry.get('url') or entry.get('id'),
+            'content': entry['content'],
+            'platform': entry['platform'],
+            'author': entry['author']
+        }
+        count += 1
+        if count >= config.BATCH_MAX_ITEMS:
+            break
+
+@app.post("/api/batch")
+async def batch_generate(
+    items: str = Form(None),
+    feed: str = Form(None),
+    platform: str = Form("other"),
+    model_type: str = Form(...),
+    api_key: str = Form(None),
+    base_url: str = Form(None),
+    model: str = Form(None),
+    scrape_concurrency: int = Form(config.BATCH_SCRAPE_CONCURRENCY),
+    generate_concurrency: int = Form(config.BATCH_GENERATE_CONCURRENCY),
+    fresh: bool = Form(False),
+    parallel: bool = Form(False),
+    structured: bool = Form(False)
+):
+    """
+    Repurpose a list of URLs or texts, streaming NDJSON results as items finish
+    
+    `items` is a JSON array or JSON Lines (see batch.py for the item format).
+    Alternatively, `feed` is the URL of an RSS/Atom feed whose entries are
+    the items; generation starts while the feed is still downloading.
+    Each output line is one item's result; failed items carry an `error`.
+    With `structured`, results carry each post's `fields` too. A final line with `"done": true` summarizes the batch.
+    """
+    try:
+        if feed:
+            scraper.adapters.resolve(feed)
+            parsed = _feed_items(feed)
+        elif items:
+            parsed = parse_items(items)
+            if len(parsed) > config.BATCH_MAX_ITEMS:
+                raise ValueError(f"Batch is limited to {config.BATCH_MAX_ITEMS} items")
+        else:
+            raise ValueError("Either items or a feed URL is required")
+        if scrape_concurrency < 1 or generate_concurrency < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+        lease = await backends.lease(model_type, api_key, base_url, model)
     except Exception as e:
+        return _error_response(e)
+    repurposer = lease.backend
+    
+    async def generate(content, platform, author):
+        posts, _, _, fields = await _generate(repurposer, content, platform, author, fresh, parallel, structured)
+        if fields is not None:
+            return {"posts": posts, "fields": fields}
+        return posts
+    
+    async def lines():
+        total = failed = 0
+        async for result in run_batch(parsed, scraper, generate,
+                                      scrape_concurrency=scrape_concurrency,
+                                      generate_concurrency=generate_concurrency,
+                                      default_platform=platform):
+            total += 1
+            failed += result['error'] is not None
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "total": total, "failed": failed}) + "\n"
+    
+    return StreamingResponse(_holding(lease, lines()), media_type="application/x-ndjson")
+
+@app.post("/api/jobs")
+async def submit_job(
+    url: str = Form(None),
+    manual_content: str = Form(None),
+    platform: str = Form(...),
+    model_type: str = Form(...),
+    api_key: str = Form(None),
+    base_url: str = Form(None),
+    model: str = Form(None),
+    fresh: bool = Form(False),
+    parallel: bool = Form(False),
+    structured: bool = Form(False)
+):
+    """
+    Queue a scrape-and-generate job and return its id right away
+    
+    Takes the same fields as /api/scrape-and-generate. Poll
+    /api/jobs/{id} or subscribe to /api/jobs/{id}/events for the result,
+    which has the same shape as that endpoint's response. Answers 429 when
+    the queue is full.
+    """
+    try:
+        if not url and not manual_content:
+            raise ValueError("Either a URL or manual content is required")
+        # Resolve the backend now so bad credentials fail the request, not the job
+        lease = await backends.lease(model_type, api_key, base_url, model)
+        if model_type != "llm":
+            # Ollama jobs can run on any server sharing the queue, which leases its own backend.
+            # Claude jobs need the API key, which is never stored: they run here, on this lease.
+            lease.release()
+            lease = None
+        try:
+            job = await jobs.submit({
+                "url": url,
+                "manual_content": manual_content,
+                "platform": platform,
+                "model_type": model_type,
+                "base_url": base_url,
+                "model": model,
+                "fresh": fresh,
+                "parallel": parallel,
+                "structured": structured,
+                "request_id": tracing.current_request_id()
+            }, context=lease)
+        except Exception:
+            if lease is not None:
+                lease.release()
+            raise
+    except QueueFull as e:
         return JSONResponse(
             content={"error": str(e)},
-            status_code=400
+            status_code=429,
+            headers={"Retry-After": str(config.JOB_RETRY_AFTER)}
         )
+    except Exception as e:
+        return _error_response(e)
+    
+    return JSONResponse(content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }, status_code=202)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0)):
+    """
+    Job status and, once finished, its result or error
+    
+    `wait` long-polls: hold the request up to that many seconds (at most
+    JOB_WAIT_MAX) for the job to finish.
+    """
+    wait = min(max(wait, 0), config.JOB_WAIT_MAX)
+    job = await jobs.wait(job_id, wait) if wait else await jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    # Where the job's time went, in this response's Server-Timing header
+    if job.started_at is not None:
+        metrics.record_stage('queue', job.started_at - job.created_at)
+        if job.finished_at is not None:
+            metrics.record_stage('run', job.finished_at - job.started_at)
+    return JSONResponse(content=job.to_dict())
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Subscribe to a job with Server-Sent Events
+    
+    Sends a `status` event for each status change; the last one carries
+    the result or error and the stream ends.
+    """
+    if await jobs.get(job_id) is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    
+    async def events():
+        async for job in jobs.watch(job_id):
+            yield sse_event('status', job.to_dict())
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency histograms, token counts, cache hit rates and error counts in the Prometheus text format"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/stats")
+async def stats():
+    """Cache, connection pool, rate limit, backend registry, job queue, model preload and request coalescing counters"""
+    return JSONResponse(content={
+        "scrape_cache": scrape_cache.stats(),
+        "http_pool": connection_stats(http_client) if http_client else None,
+        "rate_limits": scraper.rate_limiter.stats() if scraper else None,
+        "backends": backends.stats() if backends else None,
+        "generation_cache": generation_cache.stats(),
+        "near_duplicates": near_duplicates.stats() if near_duplicates else None,
+        "jobs": jobs.stats() if jobs else None,
+        "tracing": tracing.stats(),
+        "ollama_preload": ollama_preload,
+        "coalescing": {
+            "scrape": scraper.flights.stats() if scraper else None,
+            "generate": generation_flights.stats()
+        }
+    })
 
 if __name__ == "__main__":
     import uvicorn
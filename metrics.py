@@ -0,0 +1,272 @@
+"""
+Prometheus metrics and per-request stage timings (Server-Timing)
+
+Metrics are kept in-process and rendered in the Prometheus text format by
+GET /metrics. Updates happen on the event loop, so no locking is done.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """A metric family: one series per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    """Monotonic count; by convention the name ends in _total"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Mirror a count kept elsewhere (e.g. a cache's hit counter)"""
+        self._series[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in self._series.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+
+class _Series:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series.count if series is not None else 0
+
+    def _samples(self) -> Iterator[str]:
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series.counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {series.count}"
+
+
+class Registry:
+    """A set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._callbacks: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Run `callback` before each render, e.g. to copy counters kept elsewhere into gauges"""
+        self._callbacks.append(callback)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        for callback in self._callbacks:
+            callback()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SCRAPE_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_scrape_seconds', 'Scrape latency by platform and outcome', ['platform', 'outcome']))
+GENERATION_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_generation_seconds', 'Model call latency', ['backend', 'model']))
+TTFT_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_time_to_first_token_seconds', 'Time from request to the first generated token', ['backend', 'model']))
+TOKENS = REGISTRY.register(Histogram(
+    'repurposer_tokens', 'Tokens per model call', ['backend', 'model', 'direction'], buckets=TOKEN_BUCKETS))
+MODEL_LOAD_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_ollama_load_seconds', 'Model load time reported by Ollama (warm-ups included)', ['model']))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_stage_seconds', 'Request stage latency', ['stage']))
+JOB_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'repurposer_job_queue_wait_seconds', 'Time jobs wait for a worker'))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'repurposer_job_queue_depth', 'Jobs waiting for a worker'))
+VARIATION_PARSES = REGISTRY.register(Counter(
+    'repurposer_variation_parses_total', 'Completions parsed, by whether every variation was found', ['backend', 'outcome']))
+VARIATION_RETRIES = REGISTRY.register(Counter(
+    'repurposer_variation_retries_total', 'Missing variations generated again on their own', ['backend', 'result']))
+VARIATION_FAILURES = REGISTRY.register(Counter(
+    'repurposer_variation_failures_total', 'Styles whose own request failed while the others carried on', ['backend']))
+STRUCTURED_VALIDATION_FAILURES = REGISTRY.register(Counter(
+    'repurposer_structured_validation_failures_total', 'Structured post fields that failed validation', ['backend', 'field']))
+STRUCTURED_FIELD_RETRIES = REGISTRY.register(Counter(
+    'repurposer_structured_field_retries_total', 'Invalid structured post fields, by whether a follow-up call fixed them',
+    ['backend', 'field', 'result']))
+ERRORS = REGISTRY.register(Counter(
+    'repurposer_errors_total', 'Errors by stage and exception type', ['stage', 'type']))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'repurposer_cache_lookups_total', 'Cache lookups by result', ['cache', 'result']))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'repurposer_cache_hit_ratio', 'Share of cache lookups answered from the cache', ['cache']))
+
+
+def record_error(stage: str, error: BaseException):
+    """Count an error under the stage where it happened"""
+    ERRORS.inc(stage=stage, type=type(error).__name__)
+
+
+def observe_generation(backend: str, model: str, seconds: float, input_tokens: int, output_tokens: int):
+    """Record one completed model call"""
+    GENERATION_SECONDS.observe(seconds, backend=backend, model=model)
+    TOKENS.observe(input_tokens, backend=backend, model=model, direction='input')
+    TOKENS.observe(output_tokens, backend=backend, model=model, direction='output')
+
+
+def observe_ttft(backend: str, model: str, seconds: float):
+    """Record a time to first token, and report the request's first one in Server-Timing"""
+    TTFT_SECONDS.observe(seconds, backend=backend, model=model)
+    record_stage('ttft', seconds, first=True)
+
+
+# Stage timings of the request being handled (None outside a request)
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar('stages', default=None)
+
+
+def record_stage(name: str, seconds: float, first: bool = False):
+    """
+    Add a duration to the current request's Server-Timing entries
+
+    Repeated stages are summed, unless `first` is set, in which case only
+    the first value is kept.
+    """
+    stages = _stages.get()
+    if stages is None:
+        return
+    if first:
+        stages.setdefault(name, seconds)
+    else:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a request stage (histogram plus Server-Timing)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        record_stage(name, seconds)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware reporting the request's stage timings in a Server-Timing header
+
+    The header goes out with the response start, so a streamed response
+    reports the stages finished before streaming began, and `total` is the
+    time to the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stages: Dict[str, float] = {}
+        token = _stages.set(stages)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+                entries.append(f"total;dur={(time.perf_counter() - start) * 1000:.1f}")
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', ', '.join(entries).encode('latin-1')))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stages.reset(token)
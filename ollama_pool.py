@@ -0,0 +1,306 @@
+"""
+Pool of Ollama servers with load balancing, circuit breakers and health checks
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Union
+
+import httpx
+
+import config
+from http_client import HOST_LIMIT
+
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY_WEIGHTED = 'latency'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Request extensions for every call to an Ollama server
+OLLAMA_EXTENSIONS = {HOST_LIMIT: config.OLLAMA_MAX_CONNECTIONS_PER_HOST}
+
+
+def parse_base_urls(base_url: Union[str, Sequence[str]]) -> List[str]:
+    """
+    Normalize one URL, a comma-separated list, or a sequence of URLs
+
+    Returns:
+        Unique base URLs without trailing slashes, in the order given
+    """
+    urls = base_url.split(',') if isinstance(base_url, str) else list(base_url)
+    seen = []
+    for url in urls:
+        url = url.strip().rstrip('/')
+        if url and url not in seen:
+            seen.append(url)
+    if not seen:
+        raise ValueError("At least one Ollama base URL is required")
+    return seen
+
+
+def is_node_failure(error: BaseException) -> bool:
+    """
+    True if an error says the server itself is unwell: it couldn't be
+    reached, timed out, dropped the connection or answered with a 5xx.
+    A 4xx (e.g. the model isn't pulled) or an error reported inside an
+    otherwise healthy response is the request's problem, not the server's,
+    and a PoolTimeout only means our own connection slots were busy.
+    """
+    if isinstance(error, httpx.PoolTimeout):
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+
+def _has_model(names: Set[str], model: str) -> bool:
+    # Ollama reports "llama3.2:latest" for a model pulled as "llama3.2"
+    return any(name == model or name.split(':')[0] == model for name in names)
+
+
+class OllamaNode:
+    """One Ollama server and what the pool knows about it"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # EWMA of request seconds
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.models: Optional[Set[str]] = None  # pulled, from /api/tags
+        self.loaded: Set[str] = set()  # in memory, from /api/ps
+        self.requests = 0
+        self.errors = 0
+        self.last_used = 0.0  # monotonic time of the last success or model load
+
+    def stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'outstanding': self.outstanding,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'loaded': sorted(self.loaded)
+        }
+
+
+class OllamaPool:
+    """
+    Routes requests across several Ollama servers
+
+    Nodes known not to have the model pulled are skipped. While a node with
+    the model already in memory (per /api/ps) is idle, only such nodes are
+    considered, so requests avoid cold model loads until the warm nodes are
+    busy. Among the candidates, `least_outstanding` picks the node with the
+    fewest requests in flight and `latency` the lowest expected wait
+    (latency EWMA times requests in flight + 1).
+
+    Each node has a circuit breaker: after `failure_threshold` consecutive
+    failures (see is_node_failure; failed health checks count too) it stops receiving traffic for `reset_timeout` seconds, then
+    lets a single trial request through. A background task refreshes model
+    lists and reachability every `health_interval` seconds; a successful
+    check also lets an open breaker try again.
+    """
+
+    def __init__(self, base_urls: Union[str, Sequence[str]], client: Optional[httpx.AsyncClient] = None,
+                 strategy: str = config.OLLAMA_ROUTING,
+                 failure_threshold: int = config.OLLAMA_BREAKER_FAILURES,
+                 reset_timeout: float = config.OLLAMA_BREAKER_RESET,
+                 health_interval: float = config.OLLAMA_HEALTH_INTERVAL):
+        """
+        Initialize the pool
+
+        Args:
+            base_urls: Ollama base URLs (list or comma-separated string)
+            client: Async HTTP client for health checks (a short-lived one is used if not provided)
+            strategy: "least_outstanding" or "latency"
+            failure_threshold: Consecutive failures that open a node's breaker
+            reset_timeout: Seconds an open breaker waits before a trial request
+            health_interval: Seconds between background health checks
+        """
+        if strategy not in (LEAST_OUTSTANDING, LATENCY_WEIGHTED):
+            raise ValueError(f"Unknown Ollama routing strategy: {strategy}")
+        self.nodes = [OllamaNode(url) for url in parse_base_urls(base_urls)]
+        self.client = client
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.health_interval = health_interval
+        self._health_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start background health checks (needs a running event loop)"""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def aclose(self):
+        """Stop background health checks"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    async def _health_loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_interval)
+
+    async def check_all(self):
+        """Check every node now"""
+        await asyncio.gather(*[self.check(node) for node in self.nodes])
+
+    async def check(self, node: OllamaNode) -> bool:
+        """
+        Refresh a node's model lists and reachability
+
+        Returns:
+            True if the node answered
+        """
+        try:
+            tags = await self._get(f"{node.base_url}/api/tags")
+            node.models = {model['name'] for model in tags.get('models', [])}
+            try:
+                running = await self._get(f"{node.base_url}/api/ps")
+                node.loaded = {model['name'] for model in running.get('models', [])}
+            except httpx.HTTPStatusError:
+                # Older Ollama versions have no /api/ps
+                node.loaded = set()
+        except (httpx.HTTPError, ValueError):
+            # Unreachable: one more failure towards opening the breaker
+            self._trip(node)
+            return False
+
+        if node.state == OPEN:
+            # Reachable again; let the next request be the trial
+            node.state = HALF_OPEN
+        return True
+
+    async def _get(self, url: str) -> Dict:
+        if self.client is not None:
+            response = await self.client.get(url, timeout=config.OLLAMA_CONNECT_TIMEOUT, extensions=OLLAMA_EXTENSIONS)
+        else:
+            async with httpx.AsyncClient(timeout=config.OLLAMA_CONNECT_TIMEOUT) as client:
+                response = await client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    def _available(self, node: OllamaNode) -> bool:
+        if node.state == OPEN and time.monotonic() - node.opened_at >= self.reset_timeout:
+            node.state = HALF_OPEN
+        if node.state == HALF_OPEN:
+            return not node.trial_in_flight
+        return node.state == CLOSED
+
+    def available(self, exclude: Sequence[OllamaNode] = ()) -> List[OllamaNode]:
+        """Nodes that can take a request now"""
+        return [node for node in self.nodes if node not in exclude and self._available(node)]
+
+    def choose(self, model: str, exclude: Sequence[OllamaNode] = ()) -> OllamaNode:
+        """
+        Pick the node for the next request
+
+        Args:
+            model: Model the request needs
+            exclude: Nodes already tried for this request
+
+        Returns:
+            The chosen node
+
+        Raises:
+            ConnectionError: No node is available
+        """
+        candidates = self.available(exclude)
+        if not candidates:
+            raise ConnectionError(
+                f"No healthy Ollama server among {', '.join(node.base_url for node in self.nodes)}"
+            )
+        # Skip nodes known not to have the model, unless that's all there is
+        pulled = [node for node in candidates if node.models is None or _has_model(node.models, model)]
+        candidates = pulled or candidates
+        loaded = [node for node in candidates if _has_model(node.loaded, model)]
+        if any(node.outstanding == 0 for node in loaded):
+            candidates = loaded
+
+        if self.strategy == LATENCY_WEIGHTED:
+            known = [node.latency for node in candidates if node.latency is not None]
+            # Untried nodes are assumed to be as fast as the best known one
+            default = min(known) if known else 1.0
+
+            def score(node):
+                return (node.latency if node.latency is not None else default) * (node.outstanding + 1)
+        else:
+            def score(node):
+                return node.outstanding
+
+        best = min(score(node) for node in candidates)
+        return random.choice([node for node in candidates if score(node) == best])
+
+    @asynccontextmanager
+    async def lease(self, model: str, exclude: Sequence[OllamaNode] = ()) -> AsyncIterator[OllamaNode]:
+        """
+        Choose a node and track the request made on it
+
+        Only exceptions inside the block for which is_node_failure() is
+        true count as failures of the node. Other exceptions (a 4xx, an
+        error inside the response, cancellation) leave the breaker as it is.
+        """
+        node = self.choose(model, exclude)
+        trial = node.state == HALF_OPEN
+        if trial:
+            node.trial_in_flight = True
+        node.outstanding += 1
+        node.requests += 1
+        start = time.perf_counter()
+        try:
+            yield node
+        except Exception as e:
+            if is_node_failure(e):
+                node.errors += 1
+                self._trip(node)
+            raise
+        else:
+            self._succeed(node, time.perf_counter() - start, model)
+        finally:
+            node.outstanding -= 1
+            if trial:
+                node.trial_in_flight = False
+
+    def _succeed(self, node: OllamaNode, elapsed: float, model: str):
+        alpha = config.OLLAMA_LATENCY_EWMA_ALPHA
+        node.latency = elapsed if node.latency is None else alpha * elapsed + (1 - alpha) * node.latency
+        node.failures = 0
+        node.state = CLOSED
+        # Ollama keeps a model in memory for a while after serving it
+        self.mark_loaded(node, model)
+
+    def mark_loaded(self, node: OllamaNode, model: str):
+        """Record that a node has just served or loaded a model"""
+        node.last_used = time.monotonic()
+        if not _has_model(node.loaded, model):
+            node.loaded.add(model)
+
+    def idle(self, seconds: float) -> List[OllamaNode]:
+        """Available nodes that haven't served or loaded anything for `seconds`"""
+        now = time.monotonic()
+        return [node for node in self.available() if now - node.last_used >= seconds]
+
+    def _trip(self, node: OllamaNode):
+        node.failures += 1
+        if node.state == HALF_OPEN or node.failures >= self.failure_threshold:
+            node.state = OPEN
+            node.opened_at = time.monotonic()
+
+    def has_model(self, model: str) -> bool:
+        """True if a reachable node has the model pulled"""
+        return any(node.state != OPEN and node.models is not None and _has_model(node.models, model)
+                   for node in self.nodes)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-node routing state and counters"""
+        return {node.base_url: node.stats() for node in self.nodes}
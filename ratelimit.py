@@ -0,0 +1,195 @@
+"""
+Per-host rate limiting with adaptive (AIMD) concurrency for the scrapers
+"""
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import config
+
+
+# Responses that mean "slow down"
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header
+
+    Args:
+        value: Header value, either delay-seconds or an HTTP date
+
+    Returns:
+        Seconds from now (0 if the date has passed), or None if absent or unparseable
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """
+    Token bucket plus an AIMD concurrency limit for one host
+
+    Requests wait for a concurrency slot, for any Retry-After pause to end
+    and for a token. Each success raises the concurrency limit and the
+    refill rate additively (by about one per round of requests); each
+    429/503 halves both and pauses the host for the Retry-After delay.
+    """
+
+    def __init__(self, rate: float, burst: int, concurrency: int, max_concurrency: int,
+                 min_rate: float = 0.1, max_rate: Optional[float] = None):
+        """
+        Args:
+            rate: Starting refill rate (requests per second)
+            burst: Bucket size
+            concurrency: Starting concurrency limit
+            max_concurrency: Ceiling for the concurrency limit
+            min_rate: Floor for the refill rate
+            max_rate: Ceiling for the refill rate (defaults to the starting rate)
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.burst = burst
+        self.limit = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a slot and a token"""
+        async with self._changed:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await self._wait(self._paused_until - now)
+                    continue
+                if self.in_flight >= max(int(self.limit), 1):
+                    await self._changed.wait()
+                    continue
+                self._refill(now)
+                if self._tokens < 1:
+                    await self._wait((1 - self._tokens) / self.rate)
+                    continue
+                self._tokens -= 1
+                self.in_flight += 1
+                return
+
+    async def _wait(self, seconds: float):
+        """Sleep, waking early if the limits change"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    async def release(self, status: Optional[int] = None, retry_after: Optional[float] = None):
+        """
+        Return the slot and adapt to the outcome
+
+        Args:
+            status: Response status (None if the request failed without one)
+            retry_after: Seconds the server asked us to wait, if any
+        """
+        async with self._changed:
+            self.in_flight -= 1
+            if status in THROTTLE_STATUSES or retry_after is not None:
+                self._throttle(retry_after)
+            elif status is not None and status < 400:
+                self.successes += 1
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+            self._changed.notify_all()
+
+    async def throttle(self, retry_after: Optional[float] = None):
+        """Back off after a block signal that isn't a status code (e.g. an HTML block page)"""
+        async with self._changed:
+            self._throttle(retry_after)
+            self._changed.notify_all()
+
+    def _throttle(self, retry_after: Optional[float]):
+        self.throttled += 1
+        self.limit = max(1.0, self.limit / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        # Nothing to spend until the pause is over
+        self._tokens = min(self._tokens, 0.0)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'concurrency_limit': round(self.limit, 2),
+            'rate': round(self.rate, 2),
+            'in_flight': self.in_flight,
+            'successes': self.successes,
+            'throttled': self.throttled,
+            'paused_for': round(max(self._paused_until - time.monotonic(), 0.0), 2)
+        }
+
+
+class RateLimiter:
+    """
+    Hands out a HostLimiter per host, configured from config.PLATFORMS
+
+    A host uses the `rate_limit` policy of the platform whose `domains`
+    it belongs to, else that of the platform the caller names (the scraper
+    adapter fetching it, e.g. "blog" for any article site), else `default`.
+    Policies only come from `platforms` and `default`, so a limiter built
+    with neither leaves every host unlimited. The first policy found for a
+    host sticks.
+    """
+
+    def __init__(self, platforms: Dict[str, Dict] = config.PLATFORMS,
+                 default: Optional[Dict] = config.DEFAULT_RATE_LIMIT):
+        """
+        Args:
+            platforms: Platform settings with `domains` and `rate_limit` entries
+            default: Policy for hosts that match no platform (None to leave them unlimited)
+        """
+        self._policies = {
+            domain: settings['rate_limit']
+            for settings in platforms.values() if settings.get('rate_limit')
+            for domain in settings.get('domains', [])
+        }
+        self._platform_policies = {
+            name: settings['rate_limit'] for name, settings in platforms.items() if settings.get('rate_limit')
+        }
+        self.default = default
+        self._hosts: Dict[str, Optional[HostLimiter]] = {}
+
+    def policy_for(self, host: str, platform: Optional[str] = None) -> Optional[Dict]:
+        """Rate limit policy for a host (matches subdomains), fetched by a platform's adapter"""
+        domain = host
+        while domain:
+            policy = self._policies.get(domain)
+            if policy is not None:
+                return policy
+            domain = domain.partition('.')[2]
+        return self._platform_policies.get(platform, self.default)
+
+    def for_host(self, host: str, platform: Optional[str] = None) -> Optional[HostLimiter]:
+        """The host's limiter, or None if it isn't limited"""
+        if host not in self._hosts:
+            policy = self.policy_for(host, platform)
+            self._hosts[host] = HostLimiter(**policy) if policy else None
+        return self._hosts[host]
+
+    def stats(self) -> Dict[str, Dict]:
+        """Current limits and counters per host"""
+        return {host: limiter.stats() for host, limiter in self._hosts.items() if limiter is not None}
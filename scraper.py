@@ -1,177 +1,322 @@
 """
-Content scraper for Twitter, LinkedIn, and Reddit posts
+Content scraper for social media posts, articles and feeds
+
+ContentScraper does the fetching (rate limits, size limits, revalidation)
+and caching; what to fetch and how to read it is up to the adapter the URL
+resolves to (see adapters.py).
 """
-import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Optional
-import re
+import asyncio
+import contextvars
+import time
+import httpx
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import config
+import metrics
+import tracing
+from adapters import AdapterRegistry, SourceError, default_registry
+from cache import ScrapeCache
+from concurrency import run_blocking
+from ratelimit import THROTTLE_STATUSES, RateLimiter, parse_retry_after
+from singleflight import SingleFlight
+from extraction import LXML_AVAILABLE, Target, TargetedExtractor, extract_with_soup
+from http_client import PUBLIC_ONLY, public_only_transport
+
+
+class NotModified(Exception):
+    """Raised by fetch when the source confirms the cached copy is still current"""
+
+
+class ResponseTooLarge(ValueError):
+    """Raised when a response body is bigger than the scraper's size limit"""
+
+
+class _Revalidation:
+    """Validators sent with the current scrape and those received back"""
+    
+    def __init__(self, validators: Dict[str, str]):
+        self.sent = validators
+        self.received: Dict[str, str] = {}
+
+
+# Revalidation state of the scrape running in the current task
+_revalidation: contextvars.ContextVar = contextvars.ContextVar('revalidation', default=None)
+
+
+@contextmanager
+def conditional(validators: Dict[str, str]):
+    """
+    Make the fetches in the block conditional on validators from an earlier response
+    
+    A source that answers 304 raises NotModified out of the fetch. Only the
+    fetches of one URL should happen inside the block.
+    
+    Args:
+        validators: {'etag', 'last_modified'} as stored from the earlier response
+        
+    Yields:
+        State whose `received` holds the validators of the new response
+    """
+    state = _Revalidation(validators)
+    token = _revalidation.set(state)
+    try:
+        yield state
+    finally:
+        _revalidation.reset(token)
 
 
 class ContentScraper:
-    """Scrapes content from various social media platforms"""
+    """Scrapes content from social media posts, articles and feeds"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, cache: Optional[ScrapeCache] = None,
+                 max_response_bytes: int = config.SCRAPE_MAX_RESPONSE_BYTES,
+                 rate_limiter: Optional[RateLimiter] = None, adapters: Optional[AdapterRegistry] = None):
+        """
+        Initialize the scraper
+        
+        Args:
+            client: Async HTTP client to use (a private one is created if not provided)
+            cache: Scrape result cache (no caching if not provided)
+            max_response_bytes: Downloads larger than this are aborted
+            rate_limiter: Per-host limits (built from config.PLATFORMS if not provided)
+            adapters: Source adapters by host (adapters.default_registry() if not provided)
+        """
         self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': config.USER_AGENT
         }
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            transport=public_only_transport(httpx.AsyncHTTPTransport()),
+            timeout=config.REQUEST_TIMEOUT,
+            follow_redirects=True
+        )
+        self.cache = cache
+        self.max_response_bytes = max_response_bytes
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.adapters = adapters or default_registry()
+        # Concurrent scrapes of the same URL share one download
+        self.flights = SingleFlight()
+    
+    async def aclose(self):
+        """Close the HTTP client if this scraper created it"""
+        if self._owns_client:
+            await self.client.aclose()
     
-    def scrape(self, url: str) -> Dict[str, str]:
+    async def scrape(self, url: str) -> Dict[str, str]:
         """
-        Main scraping method that routes to appropriate scraper based on URL
+        Main scraping method that routes to the adapter for the URL's host
         
         Args:
-            url: URL of the social media post
+            url: URL of the post, article or feed
             
         Returns:
             Dictionary containing platform, content, and author information
         """
-        if 'twitter.com' in url or 'x.com' in url:
-            return self._scrape_twitter(url)
-        elif 'linkedin.com' in url:
-            return self._scrape_linkedin(url)
-        elif 'reddit.com' in url:
-            return self._scrape_reddit(url)
-        else:
-            raise ValueError(f"Unsupported platform. URL: {url}")
+        with tracing.span('scrape', url=url) as span:
+            result = await self.flights.do(url, lambda: self._scrape(url))
+            span.set_attribute('scrape.platform', result.get('platform', 'unknown'))
+            span.set_attribute('scrape.error', bool(result.get('error')))
+        return dict(result)
     
-    def _scrape_twitter(self, url: str) -> Dict[str, str]:
+    async def _scrape(self, url: str) -> Dict[str, str]:
+        """Scrape through the cache (one call per URL at a time, see scrape), timing the result"""
+        start = time.perf_counter()
+        result, outcome = await self._scrape_cached(url)
+        metrics.SCRAPE_SECONDS.observe(
+            time.perf_counter() - start,
+            platform=result.get('platform', 'unknown'),
+            outcome='error' if result.get('error') else outcome
+        )
+        return result
+    
+    async def items(self, url: str) -> AsyncIterator[Dict[str, str]]:
         """
-        Scrape Twitter/X post
-        Note: Twitter requires authentication for most scraping. 
-        This is a basic implementation that may not work for all cases.
-        For production, consider using Twitter API or services like nitter.net
+        Every post at a URL (each entry of a feed), yielded as it is read
+        
+        Unlike scrape(), results are not cached and failures raise.
+        
+        Raises:
+            ValueError: The URL is not supported
+            SourceError: The source has nothing to repurpose
         """
+        adapter = self.adapters.resolve(url)
+        items = adapter.items(self, url)
         try:
-            # Try to use nitter as a fallback (public Twitter frontend)
-            nitter_url = url.replace('twitter.com', 'nitter.net').replace('x.com', 'nitter.net')
-            
-            response = requests.get(nitter_url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract tweet content
-            tweet_content = soup.find('div', class_='tweet-content')
-            content = tweet_content.get_text(strip=True) if tweet_content else ""
-            
-            # Extract author
-            author_elem = soup.find('a', class_='fullname')
-            author = author_elem.get_text(strip=True) if author_elem else "Unknown"
-            
-            if not content:
-                return {
-                    'platform': 'twitter',
-                    'content': 'Unable to scrape Twitter content. Please provide the tweet text manually.',
-                    'author': 'Unknown',
-                    'error': True
-                }
-            
-            return {
-                'platform': 'twitter',
-                'content': content,
-                'author': author,
-                'error': False
-            }
-        except Exception as e:
-            return {
-                'platform': 'twitter',
-                'content': f'Error scraping Twitter: {str(e)}. Please provide the tweet text manually.',
-                'author': 'Unknown',
-                'error': True
-            }
+            async for item in items:
+                yield item
+        finally:
+            await items.aclose()
     
-    def _scrape_linkedin(self, url: str) -> Dict[str, str]:
+    async def _scrape_cached(self, url: str) -> Tuple[Dict[str, str], str]:
         """
-        Scrape LinkedIn post
-        Note: LinkedIn heavily restricts scraping and requires authentication.
-        This is a basic implementation for demonstration purposes.
+        Returns:
+            Tuple of (result, outcome): "cached", "revalidated" or "fetched"
         """
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # LinkedIn's structure varies, this is a basic attempt
-            # Look for meta tags that might contain the content
-            og_description = soup.find('meta', property='og:description')
-            content = og_description['content'] if og_description else ""
-            
-            # Try to find title/author
-            og_title = soup.find('meta', property='og:title')
-            author = og_title['content'] if og_title else "Unknown"
+        adapter = self.adapters.resolve(url)
+        if self.cache is None:
+            return await self._dispatch(adapter, url), 'fetched'
+        
+        entry = self.cache.lookup(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            if entry.is_error:
+                self.cache.negative_hits += 1
+            else:
+                self.cache.hits += 1
+            return dict(entry.result), 'cached'
+        
+        with conditional(entry.validators if entry is not None else {}) as state:
+            try:
+                result = await self._dispatch(adapter, url)
+            except NotModified:
+                self.cache.refresh(entry)
+                return dict(entry.result), 'revalidated'
+        
+        self.cache.misses += 1
+        self.cache.store(url, result, state.received, adapter.cache)
+        return result, 'fetched'
+    
+    async def _dispatch(self, adapter, url: str) -> Dict[str, str]:
+        """Scrape the URL with its adapter, turning failures into error results"""
+        with tracing.span(f'scrape.{adapter.platform}', expected=(NotModified,)):
+            try:
+                return await adapter.scrape(self, url)
+            except NotModified:
+                raise
+            except SourceError as e:
+                return adapter.failure(str(e))
+            except Exception as e:
+                metrics.record_error('scrape', e)
+                return adapter.failure(adapter.error_message(e))
+    
+    @asynccontextmanager
+    async def fetch(self, url: str, headers: Dict[str, str],
+                    platform: Optional[str] = None) -> AsyncIterator[httpx.Response]:
+        """
+        Start a GET, revalidating against the cached copy when there is one
+        
+        The body is not read yet; the connection is released when the
+        context exits, even if only part of the body was consumed.
+        
+        Requests go through the host's rate limiter. A 429/503 slows the
+        host down and is retried after the Retry-After delay (when there is
+        one and it is short enough), up to RATE_LIMIT_RETRIES times.
+        
+        Args:
+            url: URL to fetch
+            headers: Request headers
+            platform: The adapter's platform, whose rate limit applies to hosts with none configured
             
-            if not content:
-                return {
-                    'platform': 'linkedin',
-                    'content': 'Unable to scrape LinkedIn content due to authentication requirements. Please provide the post text manually.',
-                    'author': 'Unknown',
-                    'error': True
-                }
+        Yields:
+            The streaming response (status already checked)
             
-            return {
-                'platform': 'linkedin',
-                'content': content,
-                'author': author,
-                'error': False
-            }
-        except Exception as e:
-            return {
-                'platform': 'linkedin',
-                'content': f'Error scraping LinkedIn: {str(e)}. Please provide the post text manually.',
-                'author': 'Unknown',
-                'error': True
-            }
+        Raises:
+            NotModified: The source answered 304 to a conditional request
+            ResponseTooLarge: Content-Length is over the size limit
+        """
+        state = _revalidation.get()
+        if state is not None and state.sent:
+            headers = dict(headers)
+            if state.sent.get('etag'):
+                headers['If-None-Match'] = state.sent['etag']
+            if state.sent.get('last_modified'):
+                headers['If-Modified-Since'] = state.sent['last_modified']
+        
+        limiter = self.rate_limiter.for_host(httpx.URL(url).host, platform)
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire()
+            status = retry_after = None
+            try:
+                # Source URLs come from users: only public addresses, on every redirect hop
+                async with self.client.stream('GET', url, headers=headers, timeout=config.REQUEST_TIMEOUT,
+                                              extensions={PUBLIC_ONLY: True}) as response:
+                    status = response.status_code
+                    if status in THROTTLE_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get('retry-after'))
+                        if (limiter is not None and attempt < config.RATE_LIMIT_RETRIES
+                                and (retry_after or 0) <= config.RATE_LIMIT_MAX_WAIT):
+                            attempt += 1
+                            continue
+                    
+                    if status == 304 and state is not None and state.sent:
+                        raise NotModified(url)
+                    response.raise_for_status()
+                    
+                    length = response.headers.get('content-length')
+                    if length and length.isdigit() and int(length) > self.max_response_bytes:
+                        raise ResponseTooLarge(f"Response is {length} bytes, over the {self.max_response_bytes} byte limit")
+                    
+                    if state is not None:
+                        state.received = {
+                            name: value for name, value in (
+                                ('etag', response.headers.get('etag')),
+                                ('last_modified', response.headers.get('last-modified'))
+                            ) if value
+                        }
+                    yield response
+                    return
+            finally:
+                if limiter is not None:
+                    await limiter.release(status, retry_after)
     
-    def _scrape_reddit(self, url: str) -> Dict[str, str]:
+    async def read(self, response: httpx.Response, limit: Optional[int] = None) -> AsyncIterator[bytes]:
         """
-        Scrape Reddit post
-        Reddit is more scraping-friendly than other platforms
+        Iterate over the body, aborting once it passes the size limit
+        
+        Args:
+            response: Response from fetch
+            limit: Size limit for this body (defaults to max_response_bytes)
+        
+        Raises:
+            ResponseTooLarge: More than the limit arrived
         """
-        try:
-            # Add .json to the URL to get JSON response
-            json_url = url.rstrip('/') + '.json'
-            
-            # Update headers to look more like a real browser
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': 'application/json, text/html',
-                'Accept-Language': 'en-US,en;q=0.9'
-            }
-            
-            response = requests.get(json_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            # Check content type
-            content_type = response.headers.get('content-type', '')
-            if 'json' not in content_type.lower():
-                raise ValueError("Reddit returned HTML instead of JSON. The URL may be invalid or Reddit is blocking the request.")
-            
-            data = response.json()
-            
-            # Extract post data
-            post_data = data[0]['data']['children'][0]['data']
-            
-            title = post_data.get('title', '')
-            selftext = post_data.get('selftext', '')
-            author = post_data.get('author', 'Unknown')
-            
-            # Combine title and selftext
-            content = f"{title}\n\n{selftext}" if selftext else title
+        limit = limit or self.max_response_bytes
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > limit:
+                raise ResponseTooLarge(f"Response is over the {limit} byte limit")
+            yield chunk
+    
+    async def extract(self, url: str, headers: Dict[str, str], targets: Dict[str, Target],
+                      platform: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """
+        Download a page and pull out the target nodes
+        
+        With lxml the body is parsed while it downloads and the download
+        stops as soon as every target is found. Without lxml, or if the fast
+        path can't find the main content, the full body is parsed with
+        BeautifulSoup on the worker pool.
+        
+        Args:
+            url: Page URL
+            headers: Request headers
+            targets: Name -> Target (must include 'content')
+            platform: The adapter's platform, whose rate limit applies to hosts with none configured
             
-            return {
-                'platform': 'reddit',
-                'content': content,
-                'author': f"u/{author}",
-                'error': False
-            }
-        except Exception as e:
-            return {
-                'platform': 'reddit',
-                'content': f'Error scraping Reddit: {str(e)}. Please provide the post text manually.',
-                'author': 'Unknown',
-                'error': True
-            }
+        Returns:
+            Name -> extracted value (None if missing)
+        """
+        async with self.fetch(url, headers, platform) as response:
+            body_chunks = self.read(response)
+            chunks = []
+            if LXML_AVAILABLE:
+                extractor = TargetedExtractor(targets, response.charset_encoding)
+                async for chunk in body_chunks:
+                    chunks.append(chunk)
+                    if extractor.feed(chunk):
+                        break
+                if extractor.results.get('content'):
+                    return extractor.results
+            # No lxml, or the fast path missed the content: read the rest for BeautifulSoup
+            async for chunk in body_chunks:
+                chunks.append(chunk)
+            body = b"".join(chunks)
+        
+        # Parsing is CPU-bound, keep it off the event loop
+        return await run_blocking(extract_with_soup, body, targets)
 
 
 def test_scraper():
@@ -181,7 +326,7 @@ def test_scraper():
     # Test Reddit (most reliable)
     reddit_url = "https://www.reddit.com/r/Python/comments/example/"
     print("Testing Reddit scraper...")
-    result = scraper.scrape(reddit_url)
+    result = asyncio.run(scraper.scrape(reddit_url))
     print(f"Platform: {result['platform']}")
     print(f"Content: {result['content'][:100]}...")
     print(f"Author: {result['author']}")
@@ -0,0 +1,164 @@
+"""
+Single-flight coalescing of identical in-flight requests
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    """One in-flight call and the number of callers waiting on it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time
+
+    Callers that ask for a key while a call for it is already running wait
+    on that call and get its result (or its exception) instead of starting
+    another. The key is released as soon as the call finishes, so a failed
+    call is retried by the next request rather than cached. A caller that
+    is cancelled stops waiting without cancelling the call for the others;
+    the call itself is cancelled only once nobody is waiting on it.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run func() for key, or join the call already running for it
+
+        Args:
+            key: Identifies identical requests
+            func: Coroutine function making the upstream call
+
+        Returns:
+            The call's result, shared by every caller that joined it
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._release(key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up
+                flight.task.cancel()
+
+    def _release(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark the exception as retrieved even if every waiter left
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Upstream calls made, requests that joined one, and calls running now"""
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._flights)
+        }
+
+
+def test_singleflight():
+    """N concurrent identical requests make one upstream call"""
+    import httpx
+    from scraper import ContentScraper
+
+    async def run():
+        flights = SingleFlight()
+        upstream = 0
+        release = asyncio.Event()
+
+        async def call():
+            nonlocal upstream
+            upstream += 1
+            await release.wait()
+            return upstream
+
+        # 50 identical requests share one call
+        waiters = [asyncio.ensure_future(flights.do('post', call)) for _ in range(50)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        assert upstream == 1 and results == [1] * 50, (upstream, results)
+        assert flights.stats() == {'calls': 1, 'coalesced': 49, 'in_flight': 0}, flights.stats()
+
+        # The key is free again once the call finishes
+        await flights.do('post', call)
+        assert upstream == 2
+
+        # Errors reach every waiter and are not remembered
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        outcomes = await asyncio.gather(*[flights.do('bad', failing) for _ in range(5)], return_exceptions=True)
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes), outcomes
+        assert flights.stats()['in_flight'] == 0
+
+        # A cancelled waiter doesn't cancel the call for the others
+        release.clear()
+        first = asyncio.ensure_future(flights.do('shared', call))
+        second = asyncio.ensure_future(flights.do('shared', call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == 3
+
+        # ...but the call is cancelled once every waiter is gone
+        release.clear()
+        started = asyncio.Event()
+        finished = False
+
+        async def slow():
+            nonlocal finished
+            started.set()
+            await asyncio.sleep(10)
+            finished = True
+
+        lone = asyncio.ensure_future(flights.do('abandoned', slow))
+        await started.wait()
+        lone.cancel()
+        await asyncio.sleep(0.01)
+        assert not finished and flights.stats()['in_flight'] == 0
+
+        # End to end through the scraper: one download for 20 concurrent scrapes
+        downloads = 0
+
+        async def handler(request):
+            nonlocal downloads
+            downloads += 1
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json=[{'data': {'children': [{'data': {
+                'title': 'Viral post', 'selftext': '', 'author': 'someone'}}]}}])
+
+        scraper = ContentScraper(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        url = "https://www.reddit.com/r/Python/comments/abc/viral/"
+        scraped = await asyncio.gather(*[scraper.scrape(url) for _ in range(20)])
+        await scraper.client.aclose()
+        assert downloads == 1 and all(result['content'] == 'Viral post' for result in scraped), downloads
+        assert scraper.flights.stats()['coalesced'] == 19
+
+    asyncio.run(run())
+    print("single-flight: 50 identical requests -> 1 upstream call; errors and cancellation clean up")
+
+
+if __name__ == "__main__":
+    test_singleflight()
@@ -1,41 +1,238 @@
 """
 SLM service for content repurposing using local Small Language Models via Ollama
 """
-import requests
-from typing import List, Dict
+import asyncio
+import time
+import httpx
+from typing import AsyncIterator, List, Dict, Optional, Sequence, Tuple, Union
 import json
 
+import config
+import metrics
+import structured
+import tracing
+import variations
+from streaming import parse_variations
+from ollama_pool import OLLAMA_EXTENSIONS, OllamaNode, OllamaPool
+
+
+def summarize_timings(counters: Dict[str, float]) -> Dict[str, float]:
+    """Add per-request averages to raw Ollama timing counters"""
+    timings = dict(counters)
+    requests = timings["requests"]
+    timings.update({
+        "avg_load_seconds": timings["load_seconds"] / requests if requests else None,
+        "avg_prompt_eval_seconds": timings["prompt_eval_seconds"] / requests if requests else None,
+        "avg_eval_seconds": timings["eval_seconds"] / requests if requests else None,
+        "eval_tokens_per_second": timings["eval_tokens"] / timings["eval_seconds"] if timings["eval_seconds"] else None
+    })
+    return timings
+
 
 class ContentRepurposerSLM:
     """Uses local SLM via Ollama to repurpose content for LinkedIn"""
     
-    def __init__(self, model_name: str = "llama3.2", base_url: str = "http://localhost:11434"):
+    def __init__(self, model_name: str = config.OLLAMA_MODEL,
+                 base_url: Union[str, Sequence[str]] = config.OLLAMA_BASE_URL,
+                 client: Optional[httpx.AsyncClient] = None, check_connection: bool = True,
+                 pool: Optional[OllamaPool] = None, structured_output: Optional[bool] = None):
         """
         Initialize the content repurposer with local SLM
         
+        Note: the connection check is blocking; async callers should pass
+        check_connection=False and use check_health() instead.
+        
         Args:
             model_name: Name of the Ollama model to use (default: llama3.2)
-            base_url: Ollama API base URL (default: http://localhost:11434)
+            base_url: Ollama API base URL, or several (list or comma-separated) to balance across
+            client: Async HTTP client for generation calls (a short-lived one is used per call if not provided)
+            check_connection: Test the connection to Ollama before returning
+            pool: Server pool to route through (built from base_url if not provided)
+            structured_output: Ask for posts as JSON through Ollama's format option (default: config.STRUCTURED_OUTPUT)
         """
         self.model_name = model_name
-        self.base_url = base_url
-        self.api_endpoint = f"{base_url}/api/generate"
+        self.pool = pool or OllamaPool(base_url, client=client)
+        self.base_urls = [node.base_url for node in self.pool.nodes]
+        # The first server answers the synchronous helpers
+        self.base_url = self.base_urls[0]
+        self.api_endpoint = f"{self.base_url}/api/generate"
+        self.client = client
+        self.temperature = config.TEMPERATURE
+        self.max_tokens = config.MAX_TOKENS
+        self.keep_alive = config.OLLAMA_KEEP_ALIVE
+        self.structured_output = config.STRUCTURED_OUTPUT if structured_output is None else structured_output
+        self._keep_warm_task: Optional[asyncio.Task] = None
+        
+        # Durations Ollama reports with each response; model loads show up as cold starts
+        self.timings = {
+            "requests": 0,
+            "cold_starts": 0,
+            "load_seconds": 0.0,
+            "max_load_seconds": 0.0,
+            "prompt_eval_seconds": 0.0,
+            "eval_seconds": 0.0,
+            "prompt_tokens": 0,
+            "eval_tokens": 0,
+            "warm_ups": 0,
+            "warm_up_load_seconds": 0.0
+        }
         
         # Test connection to Ollama
-        self._test_connection()
+        if check_connection:
+            self._test_connection()
+    
+    async def aclose(self):
+        """Stop keep-warm pings and the pool's background health checks"""
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            await asyncio.gather(self._keep_warm_task, return_exceptions=True)
+            self._keep_warm_task = None
+        await self.pool.aclose()
+    
+    async def warm_up(self) -> Dict[str, Optional[float]]:
+        """
+        Load the model into memory on every available server
+        
+        Uses Ollama's load-only request (no prompt), which also restarts the
+        model's keep-alive timer.
+        
+        Returns:
+            Seconds each server spent loading the model (None where it failed)
+        """
+        nodes = self.pool.available()
+        results = await asyncio.gather(*[self._load(node) for node in nodes], return_exceptions=True)
+        return {
+            node.base_url: None if isinstance(result, Exception) else result
+            for node, result in zip(nodes, results)
+        }
+    
+    async def _load(self, node: OllamaNode) -> float:
+        payload = {"model": self.model_name}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        timeout = httpx.Timeout(config.OLLAMA_TIMEOUT, connect=config.OLLAMA_CONNECT_TIMEOUT)
+        endpoint = f"{node.base_url}/api/generate"
+        if self.client is not None:
+            response = await self.client.post(endpoint, json=payload, timeout=timeout, extensions=OLLAMA_EXTENSIONS)
+        else:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                response = await client.post(endpoint, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        self._record_timings(result, warm_up=True)
+        self.pool.mark_loaded(node, self.model_name)
+        return result.get('load_duration', 0) / 1e9
+    
+    def start_keep_warm(self, interval: float = config.OLLAMA_KEEP_WARM_INTERVAL):
+        """
+        Reload the model every `interval` seconds on servers that have been idle that long
+        
+        Keeps the model resident across quiet periods, and reloads it after
+        an Ollama restart or after another model pushed it out of memory.
+        """
+        if interval and (self._keep_warm_task is None or self._keep_warm_task.done()):
+            self._keep_warm_task = asyncio.ensure_future(self._keep_warm(interval))
+    
+    async def _keep_warm(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*[self._load(node) for node in self.pool.idle(interval)],
+                                 return_exceptions=True)
+    
+    def _record_timings(self, result: Dict, warm_up: bool = False, elapsed: Optional[float] = None, span=None):
+        """
+        Add the durations (nanoseconds) from a final Ollama response to the counters
+        
+        Args:
+            result: The final response object
+            warm_up: The response is to a load-only request
+            elapsed: Seconds the call took, as measured here
+            span: Tracing span of the call, tagged with the durations and token counts
+        """
+        load = result.get('load_duration', 0) / 1e9
+        if span is not None:
+            span.set_attribute('ollama.load_ms', round(load * 1000, 1))
+            span.set_attribute('ollama.prompt_eval_ms', round(result.get('prompt_eval_duration', 0) / 1e6, 1))
+            span.set_attribute('ollama.eval_ms', round(result.get('eval_duration', 0) / 1e6, 1))
+            span.set_attribute('tokens.input', result.get('prompt_eval_count', 0))
+            span.set_attribute('tokens.output', result.get('eval_count', 0))
+        metrics.MODEL_LOAD_SECONDS.observe(load, model=self.model_name)
+        if elapsed is not None:
+            metrics.observe_generation('slm', self.model_name, elapsed,
+                                       result.get('prompt_eval_count', 0), result.get('eval_count', 0))
+        if load >= config.OLLAMA_COLD_LOAD_SECONDS:
+            self.timings["cold_starts"] += 1
+        self.timings["max_load_seconds"] = max(self.timings["max_load_seconds"], load)
+        if warm_up:
+            self.timings["warm_ups"] += 1
+            self.timings["warm_up_load_seconds"] += load
+            return
+        self.timings["requests"] += 1
+        self.timings["load_seconds"] += load
+        self.timings["prompt_eval_seconds"] += result.get('prompt_eval_duration', 0) / 1e9
+        self.timings["eval_seconds"] += result.get('eval_duration', 0) / 1e9
+        self.timings["prompt_tokens"] += result.get('prompt_eval_count', 0)
+        self.timings["eval_tokens"] += result.get('eval_count', 0)
+    
+    def timing_stats(self) -> Dict[str, float]:
+        """
+        Model load and evaluation time reported by Ollama
+        
+        `cold_starts` counts responses (including warm-ups) whose model load
+        took at least OLLAMA_COLD_LOAD_SECONDS.
+        """
+        return summarize_timings(self.timings)
     
     def _test_connection(self):
-        """Test if Ollama is running and accessible"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
+        """Test if Ollama is running and accessible (on at least one server)"""
+        errors = []
+        for base_url in self.base_urls:
+            try:
+                response = httpx.get(f"{base_url}/api/tags", timeout=config.OLLAMA_CONNECT_TIMEOUT)
+                response.raise_for_status()
+                return
+            except httpx.HTTPError as e:
+                errors.append(str(e))
+        raise ConnectionError(
+            f"Cannot connect to Ollama at {', '.join(self.base_urls)}. "
+            f"Please ensure Ollama is running. Error: {'; '.join(errors)}"
+        )
+    
+    async def check_health(self) -> List[str]:
+        """
+        Check that Ollama is reachable and has the configured model
+        
+        Checks every server in the pool and starts the pool's background
+        health checks, which keep routing up to date from then on, and the
+        keep-warm pings.
+        
+        Returns:
+            Names of the models available on the reachable servers
+            
+        Raises:
+            ConnectionError: No server can be reached
+            ValueError: The configured model has not been pulled on any reachable server
+        """
+        await self.pool.check_all()
+        self.pool.start()
+        
+        reachable = [node for node in self.pool.nodes if node.models is not None and node.state != 'open']
+        if not reachable:
             raise ConnectionError(
-                f"Cannot connect to Ollama at {self.base_url}. "
-                f"Please ensure Ollama is running. Error: {str(e)}"
+                f"Cannot connect to Ollama at {', '.join(self.base_urls)}. "
+                f"Please ensure Ollama is running."
+            )
+        
+        if not self.pool.has_model(self.model_name):
+            raise ValueError(
+                f"Model '{self.model_name}' is not available on Ollama at {', '.join(self.base_urls)}. "
+                f"Run: ollama pull {self.model_name}"
             )
+        self.start_keep_warm()
+        return sorted(set().union(*(node.models for node in reachable)))
     
-    def generate_linkedin_posts(self, original_content: str, platform: str, author: str = None) -> List[str]:
+    async def generate_linkedin_posts(self, original_content: str, platform: str, author: str = None,
+                                      parallel: bool = False) -> List[str]:
         """
         Generate 3 variations of LinkedIn posts from the original content
         
@@ -43,30 +240,171 @@ class ContentRepurposerSLM:
             original_content: The scraped content from social media
             platform: Source platform (twitter, linkedin, reddit)
             author: Original author name
+            parallel: Request each style separately and concurrently instead of in one completion
             
         Returns:
             List of 3 repurposed LinkedIn posts
         """
         
+        if parallel:
+            return await variations.generate_parallel(
+                lambda number: self.generate_variation(original_content, platform, author, number)
+            )
+        
+        if self.structured_output:
+            return structured.render(await self.generate_structured_posts(original_content, platform, author))
+        
         prompt = self._create_prompt(original_content, platform, author)
         
         try:
-            response = self._call_ollama(prompt)
+            response = await self._call_ollama(prompt)
             
             # Parse the three variations
-            posts = self._parse_response(response)
+            with metrics.stage('parse'):
+                outcome = parse_variations(response)
             
-            return posts
+            # Write any variation the completion lacks on its own
+            return await variations.fill_missing(
+                outcome,
+                lambda number: self.generate_variation(original_content, platform, author, number),
+                'slm'
+            )
             
         except Exception as e:
             raise Exception(f"Error generating content: {str(e)}")
     
-    def _call_ollama(self, prompt: str) -> str:
+    async def generate_variation(self, original_content: str, platform: str, author: str = None,
+                                 number: int = 1) -> str:
+        """
+        Generate a single variation in one style
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            number: Style number from config.VARIATION_STYLES
+            
+        Returns:
+            The LinkedIn post
+        """
+        
+        if self.structured_output:
+            post = await self.generate_structured_variation(original_content, platform, author, number)
+            return structured.render([post])[0]
+        
+        prompt = variations.create_variation_prompt(original_content, platform, author, number)
+        
+        try:
+            response = await self._call_ollama(prompt, max_tokens=config.VARIATION_MAX_TOKENS)
+            return variations.clean_variation(response)
+            
+        except Exception as e:
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    async def generate_structured_posts(self, original_content: str, platform: str, author: str = None,
+                                        parallel: bool = False) -> List[Optional[structured.StructuredPost]]:
+        """
+        Generate every variation as typed fields, constrained by a JSON schema
+        
+        Fields that fail validation are requested again on their own; see
+        structured.complete_post.
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            parallel: Request each style separately and concurrently instead of in one call
+            
+        Returns:
+            Posts in style order; None where a post could not be completed
+        """
+        if parallel:
+            return await variations.generate_parallel(
+                lambda number: self.generate_structured_variation(original_content, platform, author, number)
+            )
+        try:
+            return await structured.generate_posts(
+                self._call_structured, variations.create_source_prompt(original_content, platform, author),
+                'slm', self.max_tokens
+            )
+            
+        except Exception as e:
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    async def generate_structured_variation(self, original_content: str, platform: str, author: str = None,
+                                            number: int = 1) -> Optional[structured.StructuredPost]:
+        """
+        Generate a single variation in one style as typed fields
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            number: Style number from config.VARIATION_STYLES
+            
+        Returns:
+            The post, or None if it could not be completed
+        """
+        return await structured.generate_post(
+            self._call_structured, variations.create_source_prompt(original_content, platform, author), number, 'slm'
+        )
+    
+    async def _call_structured(self, instructions: str, prompt: str, schema: Dict, max_tokens: int) -> Dict:
+        """
+        One generation constrained to the schema
+        
+        Returns:
+            The decoded object ({} if the output isn't valid JSON, e.g. cut off at max_tokens)
+        """
+        response = await self._call_ollama(f"{instructions}\n\n{prompt}", max_tokens=max_tokens, format=schema)
+        try:
+            return json.loads(response)
+        except ValueError:
+            return {}
+    
+    def variations_as_completed(self, original_content: str, platform: str,
+                                author: str = None) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Generate each style concurrently, yielding (style number, post) as each finishes
+        
+        Stop iterating early to cancel the variations still in flight. Styles
+        that fail are skipped; the error is raised only if all of them fail.
+        """
+        return variations.variations_as_completed(
+            lambda number: self.generate_variation(original_content, platform, author, number), 'slm'
+        )
+    
+    async def stream_linkedin_posts(self, original_content: str, platform: str, author: str = None) -> AsyncIterator[str]:
+        """
+        Stream the generated posts token by token
+        
+        Args:
+            original_content: The scraped content from social media
+            platform: Source platform (twitter, linkedin, reddit)
+            author: Original author name
+            
+        Yields:
+            Text chunks as the model produces them
+        """
+        
+        prompt = self._create_prompt(original_content, platform, author)
+        
+        try:
+            async for text in self._stream_ollama(prompt):
+                yield text
+                
+        except Exception as e:
+            raise Exception(f"Error generating content: {str(e)}")
+    
+    async def _call_ollama(self, prompt: str, max_tokens: Optional[int] = None,
+                           format: Optional[Dict] = None) -> str:
         """
         Call Ollama API to generate response
         
         Args:
             prompt: The prompt to send to the model
+            max_tokens: Output token limit (defaults to self.max_tokens)
+            format: JSON schema the output must follow
             
         Returns:
             Generated text response
@@ -76,27 +414,161 @@ class ContentRepurposerSLM:
             "prompt": prompt,
             "stream": False,
             "options": {
-                "temperature": 0.7,
-                "num_predict": 2000
+                "temperature": self.temperature,
+                "num_predict": max_tokens or self.max_tokens
             }
         }
+        if format is not None:
+            payload["format"] = format
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        
+        timeout = httpx.Timeout(config.OLLAMA_TIMEOUT, connect=config.OLLAMA_CONNECT_TIMEOUT)  # Longer timeout for local models
         
+        tried = []
+        start = time.perf_counter()
         try:
-            response = requests.post(
-                self.api_endpoint,
-                json=payload,
-                timeout=120  # Longer timeout for local models
-            )
-            response.raise_for_status()
+            while True:
+                try:
+                    async with self.pool.lease(self.model_name, exclude=tried) as node:
+                        tried.append(node)
+                        endpoint = f"{node.base_url}/api/generate"
+                        with tracing.span('model.call', backend='slm', model=self.model_name,
+                                          server=node.base_url, attempt=len(tried)) as span:
+                            if self.client is not None:
+                                response = await self.client.post(endpoint, json=payload, timeout=timeout,
+                                                                  headers=tracing.outbound_headers(),
+                                                                  extensions=OLLAMA_EXTENSIONS)
+                            else:
+                                async with httpx.AsyncClient(timeout=timeout) as client:
+                                    response = await client.post(endpoint, json=payload,
+                                                                 headers=tracing.outbound_headers())
+                            response.raise_for_status()
+                            
+                            result = response.json()
+                            self._record_timings(result, elapsed=time.perf_counter() - start, span=span)
+                        # Not streamed, but Ollama reports the time spent before the first token
+                        metrics.observe_ttft('slm', self.model_name,
+                                             (result.get('load_duration', 0) + result.get('prompt_eval_duration', 0)) / 1e9)
+                        return result.get('response', '')
+                except httpx.HTTPError as e:
+                    if not self._should_fail_over(e, tried):
+                        raise
             
-            result = response.json()
-            return result.get('response', '')
+        except httpx.TimeoutException as e:
+            metrics.record_error('generate', e)
+            raise Exception("Request timed out. The model might be taking too long to respond.")
+        except httpx.HTTPError as e:
+            metrics.record_error('generate', e)
+            raise Exception(f"Error calling Ollama API: {str(e)}")
+        except ConnectionError as e:
+            metrics.record_error('generate', e)
+            raise
+    
+    async def _stream_ollama(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Call Ollama API with streaming enabled
+        
+        Ollama answers with one JSON object per line, each carrying the
+        next piece of the response until an object with "done": true.
+        
+        Args:
+            prompt: The prompt to send to the model
             
-        except requests.exceptions.Timeout:
+        Yields:
+            Generated text chunks
+        """
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens
+            }
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        
+        timeout = httpx.Timeout(config.OLLAMA_TIMEOUT, connect=config.OLLAMA_CONNECT_TIMEOUT)
+        
+        try:
+            if self.client is not None:
+                client, owned = self.client, False
+            else:
+                client, owned = httpx.AsyncClient(timeout=timeout), True
+            
+            tried = []
+            started = False
+            start = time.perf_counter()
+            try:
+                while True:
+                    try:
+                        async with self.pool.lease(self.model_name, exclude=tried) as node:
+                            tried.append(node)
+                            endpoint = f"{node.base_url}/api/generate"
+                            # Not activated: this generator runs in the consumer's context
+                            with tracing.span('model.stream', activate=False, backend='slm', model=self.model_name,
+                                              server=node.base_url, attempt=len(tried)) as span:
+                                async with client.stream('POST', endpoint, json=payload, timeout=timeout,
+                                                         headers=tracing.outbound_headers(),
+                                                         extensions=OLLAMA_EXTENSIONS) as response:
+                                    response.raise_for_status()
+                                    async for line in response.aiter_lines():
+                                        if not line.strip():
+                                            continue
+                                        chunk = json.loads(line)
+                                        if chunk.get('error'):
+                                            raise Exception(chunk['error'])
+                                        if chunk.get('response'):
+                                            if not started:
+                                                metrics.observe_ttft('slm', self.model_name, time.perf_counter() - start)
+                                                span.set_attribute('ttft_ms', round((time.perf_counter() - start) * 1000, 1))
+                                                started = True
+                                            yield chunk['response']
+                                        if chunk.get('done'):
+                                            self._record_timings(chunk, elapsed=time.perf_counter() - start, span=span)
+                                            break
+                        return
+                    except httpx.HTTPError as e:
+                        # Once text has been sent, switching servers would repeat it
+                        if started or not self._should_fail_over(e, tried):
+                            raise
+            finally:
+                if owned:
+                    await client.aclose()
+            
+        except httpx.TimeoutException as e:
+            metrics.record_error('generate', e)
             raise Exception("Request timed out. The model might be taking too long to respond.")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
+            metrics.record_error('generate', e)
             raise Exception(f"Error calling Ollama API: {str(e)}")
+        except ConnectionError as e:
+            metrics.record_error('generate', e)
+            raise
+    
+    def _should_fail_over(self, error: httpx.HTTPError, tried: List) -> bool:
+        """Retry on another server if this one couldn't be reached or failed server-side"""
+        if not self.pool.available(exclude=tried):
+            return False
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        return isinstance(error, httpx.HTTPStatusError) and error.response.status_code >= 500
+    
+    def generation_params(self) -> Dict[str, object]:
+        """Model and sampling parameters that determine the output (used for cache keys)"""
+        params = {
+            "backend": "slm",
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        if self.structured_output:
+            params["output"] = "structured"
+        return params
     
+    @tracing.traced('prompt')
     def _create_prompt(self, content: str, platform: str, author: str = None) -> str:
         """Create the prompt for the SLM"""
         
@@ -141,36 +613,6 @@ Do not include any additional text outside of these three variations."""
 
         return prompt
     
-    def _parse_response(self, response_text: str) -> List[str]:
-        """Parse the SLM response into 3 separate posts"""
-        
-        # Split by variation markers
-        variations = []
-        
-        # Try to split by VARIATION markers
-        parts = response_text.split('VARIATION')
-        
-        for part in parts[1:]:  # Skip the first empty part
-            # Remove the variation number and colon
-            lines = part.strip().split('\n', 1)
-            if len(lines) > 1:
-                post_content = lines[1].strip()
-                variations.append(post_content)
-        
-        # Ensure we have exactly 3 variations
-        if len(variations) != 3:
-            # Fallback: try to split by double newlines
-            parts = response_text.split('\n\n\n')
-            variations = [part.strip() for part in parts if part.strip()]
-        
-        # If we still don't have 3, pad or truncate
-        while len(variations) < 3:
-            variations.append("Error: Could not generate variation. Please try again.")
-        
-        variations = variations[:3]
-        
-        return variations
-    
     def list_available_models(self) -> List[str]:
         """
         List all available models in Ollama
@@ -179,7 +621,7 @@ Do not include any additional text outside of these three variations."""
             List of model names
         """
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
+            response = httpx.get(f"{self.base_url}/api/tags", timeout=config.OLLAMA_CONNECT_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             return [model['name'] for model in data.get('models', [])]
@@ -208,7 +650,7 @@ def test_repurposer_slm():
         print(f"Generating LinkedIn posts using {repurposer.model_name}...")
         print("This may take a moment with local models...\n")
         
-        posts = repurposer.generate_linkedin_posts(sample_content, "twitter", "Tech Influencer")
+        posts = asyncio.run(repurposer.generate_linkedin_posts(sample_content, "twitter", "Tech Influencer"))
         
         for i, post in enumerate(posts, 1):
             print(f"\n{'='*50}")
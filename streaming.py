@@ -0,0 +1,290 @@
+"""
+Helpers for streaming generated posts to the browser as they are written
+"""
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import config
+import tracing
+
+
+# "VARIATION 2:" header at the start of a line. Models vary the case,
+# spacing and punctuation, and some wrap it in markdown (## / **). The
+# colon may be missing when the header is alone on its line.
+HEADER = re.compile(
+    r'[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*|__)?[ \t]*VARIATION[ \t]*(\d+)[ \t]*(?:\*\*|__)?'
+    r'(?:[ \t]*[:.)\-–—][ \t]*(?:\*\*?|__?)?[ \t]*|[ \t]*(?=\r?\n))',
+    re.IGNORECASE
+)
+
+# Start of a line that may still turn into a header once more tokens arrive
+PARTIAL_HEADER = re.compile(
+    r'[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*?|__?)?[ \t]*'
+    r'(?:V(?:A(?:R(?:I(?:A(?:T(?:I(?:O(?:N[ \t]*\d*[ \t]*(?:\*\*?|__?)?[ \t]*)?)?)?)?)?)?)?)?)?',
+    re.IGNORECASE
+)
+
+# Horizontal rules some models put between variations
+_TRAILING_RULE = re.compile(r'(?:(?:^|\n)[ \t]*(?:-{3,}|\*{3,}|_{3,})[ \t]*)+\s*$')
+
+# Stands in for a variation that could not be generated
+MISSING_VARIATION = "Error: Could not generate variation. Please try again."
+
+
+@dataclass
+class ParseOutcome:
+    """What a completion yielded, variation by variation"""
+    variations: Dict[int, str]
+    expected: int = config.NUM_VARIATIONS
+    # Numbers of header-like lines that were kept as post text (out of range or repeated)
+    ignored_headers: List[int] = field(default_factory=list)
+
+    @property
+    def missing(self) -> List[int]:
+        """Variation numbers with no text, in order"""
+        return [number for number in range(1, self.expected + 1) if not self.variations.get(number)]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing
+
+    def posts(self) -> List[str]:
+        """The variations in order, MISSING_VARIATION for the missing ones"""
+        return [self.variations.get(number) or MISSING_VARIATION for number in range(1, self.expected + 1)]
+
+    def to_dict(self) -> Dict:
+        return {'found': sorted(number for number, text in self.variations.items() if text),
+                'missing': self.missing, 'ignored_headers': self.ignored_headers}
+
+
+class VariationParser:
+    """
+    Incremental parser splitting model output into variations
+
+    A state machine over lines: text before the first header is dropped,
+    and a header only counts at the start of a line and for a variation
+    not seen yet, so "variation" in post text is just text. Feed it chunks
+    as they arrive; it returns events of the form ('token', number, text)
+    for each piece of post text and ('variation', number, full_text) once
+    a variation is closed by the next header or the end of the stream.
+
+    Text is passed on as soon as it can't be part of a header, so only the
+    start of a line that looks like "VARIATION 2" is held back.
+    """
+
+    def __init__(self, expected: int = config.NUM_VARIATIONS):
+        """
+        Args:
+            expected: Number of variations the completion should contain
+        """
+        self.expected = expected
+        self._line = ""  # held-back start of the current line
+        self._line_start = True  # the next text begins a line
+        self._current = 0
+        self._parts: List[str] = []
+        self.variations: Dict[int, str] = {}
+        self.ignored_headers: List[int] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, int, str]]:
+        """
+        Consume a chunk of model output
+
+        Args:
+            chunk: Next piece of text from the model
+
+        Returns:
+            List of events produced by this chunk
+        """
+        events = []
+        while chunk:
+            newline = chunk.find('\n')
+            piece, chunk = (chunk, "") if newline < 0 else (chunk[:newline + 1], chunk[newline + 1:])
+            if self._line_start:
+                self._line += piece
+                self._scan_line(events, final=False)
+            else:
+                self._emit_text(piece, events)
+                self._line_start = piece.endswith('\n')
+        return events
+
+    def close(self) -> List[Tuple[str, int, str]]:
+        """
+        Flush held-back text at the end of the stream
+
+        Returns:
+            Remaining events, including the close of the last variation
+        """
+        events = []
+        if self._line:
+            self._scan_line(events, final=True)
+        self._emit_text(self._line, events)
+        self._line = ""
+        self._close_current(events)
+        return events
+
+    def outcome(self) -> ParseOutcome:
+        """The variations closed so far (all of them after close())"""
+        return ParseOutcome(dict(self.variations), self.expected, list(self.ignored_headers))
+
+    def _scan_line(self, events: List[Tuple[str, int, str]], final: bool):
+        """Decide whether the held-back line is a header, text, or still undecided"""
+        line = self._line
+        ended = final or line.endswith('\n')
+        header = HEADER.match(line if not final or line.endswith('\n') else line + '\n')
+        # A match that reaches the end of an unfinished line may still grow (e.g. a closing "**")
+        if header and (ended or header.end() < len(line)):
+            number = int(header.group(1))
+            if self._accepts(number):
+                self._close_current(events)
+                self._current = number
+                self._line = ""
+                rest = line[header.end():]
+                self._line_start = not rest or rest.endswith('\n')
+                self._emit_text(rest, events)
+                return
+            self.ignored_headers.append(number)
+        elif not ended and PARTIAL_HEADER.fullmatch(line):
+            return
+        elif not ended and header:
+            return
+        self._line = ""
+        self._line_start = ended
+        self._emit_text(line, events)
+
+    def _accepts(self, number: int) -> bool:
+        return 1 <= number <= self.expected and number != self._current and number not in self.variations
+
+    def _emit_text(self, text: str, events: List[Tuple[str, int, str]]):
+        if not self._current:
+            return
+        if not self._parts:
+            # Drop the line break that follows the header
+            text = text.lstrip()
+        if text:
+            self._parts.append(text)
+            events.append(('token', self._current, text))
+
+    def _close_current(self, events: List[Tuple[str, int, str]]):
+        if not self._current:
+            return
+        text = _TRAILING_RULE.sub('', "".join(self._parts)).strip()
+        self.variations[self._current] = text
+        events.append(('variation', self._current, text))
+        self._parts = []
+        self._current = 0
+
+
+@tracing.traced('parse')
+def parse_variations(text: str, expected: int = config.NUM_VARIATIONS) -> ParseOutcome:
+    """
+    Parse a complete model response into its variations
+
+    Args:
+        text: The whole completion
+        expected: Number of variations it should contain
+
+    Returns:
+        The parse outcome; see ParseOutcome.missing for variations to regenerate
+    """
+    parser = VariationParser(expected)
+    parser.feed(text)
+    parser.close()
+    return parser.outcome()
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Format a Server-Sent Event
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+
+    Returns:
+        SSE frame ready to be written to the response
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+_HEADER_STYLES = [
+    "VARIATION {n}:\n", "VARIATION {n}:", "Variation {n}:\n", "**VARIATION {n}:**\n", "## Variation {n}\n",
+    "VARIATION  {n} :\n", "**Variation {n}**\n", "variation {n}.\n", "  VARIATION {n}:\n\n"
+]
+_DISTRACTIONS = [
+    "Every variation of this idea failed.", "VARIATION is the spice of life.", "We tried VARIATION 2: no luck.",
+    "Here is VARIATION 4: wait, there are only three.", "Variations matter", "V", "VAR", "VARIATION"
+]
+
+
+def _random_post(rng: random.Random) -> str:
+    words = ["focus", "ship", "bugs", "team", "🚀", "#growth", "data", "80%", "code", "learn", "—", "why?"]
+    lines = []
+    for _ in range(rng.randint(1, 6)):
+        if rng.random() < 0.25:
+            lines.append(rng.choice(_DISTRACTIONS) if rng.random() < 0.5 else "- " + rng.choice(_DISTRACTIONS))
+        elif rng.random() < 0.15:
+            lines.append("")
+        else:
+            lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(1, 12))))
+    post = "\n".join(lines).strip()
+    return post if post and not HEADER.match(post + "\n") and not post.startswith(("-", "*", "_")) else "Plain post."
+
+
+def _chunks(text: str, rng: random.Random) -> List[str]:
+    chunks, position = [], 0
+    while position < len(text):
+        size = rng.choice([1, 1, 2, 3, 5, 8, 13, 40])
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def test_variation_parser(cases: int = 2000, seed: int = 0):
+    """
+    Property test over generated completions
+
+    Each completion has a random preamble, header style, post text full of
+    the word "variation", sometimes a missing or empty variation, and is fed
+    in random chunk sizes. The streamed result must match a one-shot parse
+    and the posts that were written, and tokens must add up to each variation.
+    """
+    rng = random.Random(seed)
+    for case in range(cases):
+        posts = {number: _random_post(rng) for number in range(1, 4)}
+        dropped = rng.choice([None, None, None, 1, 2, 3])
+        text = rng.choice(["", "Here are your posts:\n\n", "Sure! VARIATION ahead.\n", "VARIATION\n"])
+        for number, post in posts.items():
+            if number == dropped:
+                continue
+            text += rng.choice(_HEADER_STYLES).format(n=number)
+            if not rng.random() < 0.05:
+                text += (" " if not text.endswith("\n") else "") + post
+            else:
+                posts[number] = ""
+            text += rng.choice(["\n\n", "\n", "\n\n---\n\n", "\n\n\n"])
+
+        parser = VariationParser()
+        events = []
+        for chunk in _chunks(text, rng):
+            events.extend(parser.feed(chunk))
+        events.extend(parser.close())
+        streamed = parser.outcome()
+        whole = parse_variations(text)
+
+        expected = {number: post for number, post in posts.items() if number != dropped}
+        context = f"case {case}: {text!r}"
+        assert streamed.variations == whole.variations, context
+        assert streamed.variations == expected, f"{context}\n{streamed.variations}"
+        assert streamed.missing == [number for number in range(1, 4) if not expected.get(number)], context
+        for number, post in expected.items():
+            tokens = "".join(payload for kind, n, payload in events if kind == 'token' and n == number)
+            assert _TRAILING_RULE.sub('', tokens).strip() == post, context
+            assert ('variation', number, post) in events, context
+    print(f"{cases} generated completions parsed consistently")
+
+
+if __name__ == "__main__":
+    test_variation_parser()
@@ -0,0 +1,317 @@
+"""
+Structured output: posts as typed objects instead of free text
+
+With config.STRUCTURED_OUTPUT on, the backends ask for the variations as
+JSON matching POSTS_SCHEMA: Claude through a forced tool call, Ollama
+through the `format` option. Each post has a style, a hook, a body and
+hashtags. Every field is validated on its own, and only the fields that
+fail are requested again (with the reason), so a bad hashtag list costs
+a few output tokens instead of a new set of three posts.
+"""
+import asyncio
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import config
+import metrics
+from streaming import MISSING_VARIATION
+
+
+# Forced tool call that carries Claude's answer
+TOOL_NAME = "submit_linkedin_posts"
+FIELDS = ('hook', 'body', 'hashtags')
+STYLES = [config.VARIATION_STYLES[number]['name'] for number in sorted(config.VARIATION_STYLES)]
+
+# Calls the model with fixed instructions, the per-request prompt, a JSON schema and an
+# output token limit; returns the parsed object
+StructuredCall = Callable[[str, str, Dict, int], Awaitable[Any]]
+
+_PROPERTIES = {
+    'style': {'type': 'string', 'enum': STYLES, 'description': "Which style this post is written in"},
+    'hook': {'type': 'string', 'description': "The opening line that makes people stop scrolling"},
+    'body': {'type': 'string', 'description': "The rest of the post, without the hook or hashtags"},
+    'hashtags': {
+        'type': 'array',
+        'items': {'type': 'string'},
+        'minItems': config.HASHTAG_COUNT_RANGE[0],
+        'maxItems': config.HASHTAG_COUNT_RANGE[1],
+        'description': "Hashtags, each starting with #"
+    }
+}
+
+
+def field_schema(fields: Sequence[str]) -> Dict:
+    """JSON schema for an object with the given post fields, all required"""
+    return {
+        'type': 'object',
+        'properties': {name: _PROPERTIES[name] for name in fields},
+        'required': list(fields)
+    }
+
+
+POST_SCHEMA = field_schema(('style',) + FIELDS)
+
+POSTS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'variations': {
+            'type': 'array',
+            'items': POST_SCHEMA,
+            'minItems': len(STYLES),
+            'maxItems': len(STYLES)
+        }
+    },
+    'required': ['variations']
+}
+
+
+@dataclass
+class StructuredPost:
+    """One LinkedIn post as typed fields"""
+    style: str
+    hook: str
+    body: str
+    hashtags: List[str]
+
+    def to_text(self) -> str:
+        """The post as it would be published"""
+        body = self.body
+        if not body.startswith(self.hook):
+            body = f"{self.hook}\n\n{body}"
+        return f"{body}\n\n{' '.join(self.hashtags)}"
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def create_instructions(number: Optional[int] = None) -> str:
+    """
+    Fixed instructions for structured generation
+
+    Args:
+        number: Key into config.VARIATION_STYLES for a single post in that style (default: one post per style)
+
+    Returns:
+        Instruction text (identical across requests, so it can be cached)
+    """
+    numbers = sorted(config.VARIATION_STYLES) if number is None else [number]
+    styles = "\n".join(
+        f"- {config.VARIATION_STYLES[n]['name']}: {config.VARIATION_STYLES[n]['description'].lower()}"
+        for n in numbers
+    )
+    return f"""You are an expert content strategist specializing in LinkedIn content creation.
+
+The user will share a post from another platform that they want to repurpose for LinkedIn.
+
+Write {'one LinkedIn post' if number is not None else f'{len(numbers)} LinkedIn posts, one per style,'} based on it. Each post has:
+
+- hook: one line, at most {config.STRUCTURED_HOOK_MAX_CHARS} characters, that makes people stop scrolling
+- body: the rest of the post ({config.MIN_POST_LENGTH}-{config.MAX_POST_LENGTH} words with the hook): professional yet engaging, keeping the core message and insights of the original, in short paragraphs with line breaks, ending with a call-to-action or a thought-provoking question. No hashtags in the body.
+- hashtags: {config.HASHTAG_COUNT_RANGE[0]}-{config.HASHTAG_COUNT_RANGE[1]} relevant hashtags
+
+{'Style' if number is not None else 'Styles'}:
+{styles}
+
+Answer only with the structured result."""
+
+
+def create_field_prompt(source_prompt: str, style: str, draft: Dict[str, Any], errors: Dict[str, str]) -> str:
+    """
+    Prompt asking again for just the fields of a post that failed validation
+
+    Args:
+        source_prompt: The per-source part of the original prompt
+        style: The post's style
+        draft: The post's valid fields so far
+        errors: Field name -> what was wrong with it
+    """
+    problems = "\n".join(f"- {name}: {error}" for name, error in errors.items())
+    return f"""{source_prompt}
+
+A {style} style LinkedIn post based on this is being written. The parts that are done:
+{json.dumps(draft, ensure_ascii=False, indent=2)}
+
+Write only these parts, fixing the problems:
+{problems}"""
+
+
+def validate_field(name: str, value: Any) -> Tuple[Any, Optional[str]]:
+    """
+    Check and normalize one post field
+
+    Returns:
+        Tuple of (normalized value, error message or None)
+    """
+    if name == 'hook':
+        if not isinstance(value, str) or not value.strip():
+            return None, "missing; write an opening line"
+        hook = value.strip()
+        if '\n' in hook:
+            return None, "must be a single line"
+        if len(hook) > config.STRUCTURED_HOOK_MAX_CHARS:
+            return None, f"is {len(hook)} characters; keep it under {config.STRUCTURED_HOOK_MAX_CHARS}"
+        return hook, None
+    if name == 'body':
+        if not isinstance(value, str) or not value.strip():
+            return None, "missing; write the post body"
+        words = len(value.split())
+        if words < config.STRUCTURED_MIN_BODY_WORDS:
+            return None, f"is only {words} words; write at least {config.STRUCTURED_MIN_BODY_WORDS}"
+        return value.strip(), None
+    if name == 'hashtags':
+        if isinstance(value, str):
+            value = value.replace(',', ' ').split()
+        if not isinstance(value, list):
+            return None, "missing; give a list of hashtags"
+        tags = []
+        for tag in value:
+            if not isinstance(tag, str):
+                continue
+            tag = '#' + ''.join(tag.split()).lstrip('#')
+            if len(tag) > 1 and tag.lower() not in {existing.lower() for existing in tags}:
+                tags.append(tag)
+        low, high = config.HASHTAG_COUNT_RANGE
+        if not low <= len(tags) <= high:
+            return None, f"has {len(tags)} hashtags; give {low}-{high}"
+        return tags, None
+    raise ValueError(f"Unknown field: {name}")
+
+
+def validate_post(data: Any) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Validate every field of a post object
+
+    Returns:
+        Tuple of (valid fields, field name -> error for the rest)
+    """
+    data = data if isinstance(data, dict) else {}
+    valid, errors = {}, {}
+    for name in FIELDS:
+        value, error = validate_field(name, data.get(name))
+        if error is None:
+            valid[name] = value
+        else:
+            errors[name] = error
+    return valid, errors
+
+
+def _by_style(items: Any) -> List[Any]:
+    """The returned post objects in STYLES order, by their style or else their position"""
+    items = items if isinstance(items, list) else []
+    ordered: List[Any] = [None] * len(STYLES)
+    unplaced = []
+    for item in items:
+        style = item.get('style') if isinstance(item, dict) else None
+        index = next((i for i, name in enumerate(STYLES) if isinstance(style, str) and name.lower() == style.lower()), None)
+        if index is not None and ordered[index] is None:
+            ordered[index] = item
+        else:
+            unplaced.append(item)
+    for index in range(len(ordered)):
+        if ordered[index] is None and unplaced:
+            ordered[index] = unplaced.pop(0)
+    return ordered
+
+
+async def complete_post(call: StructuredCall, source_prompt: str, number: int, data: Any,
+                        backend: str) -> Optional[StructuredPost]:
+    """
+    Validate a post object, asking again for the fields that fail
+
+    Up to STRUCTURED_FIELD_RETRIES follow-up calls are made, each for only
+    the fields still invalid. Every failed check is counted per field.
+
+    Returns:
+        The post, or None if some field is still invalid
+    """
+    style = config.VARIATION_STYLES[number]['name']
+    valid, errors = validate_post(data)
+    for attempt in range(config.STRUCTURED_FIELD_RETRIES + 1):
+        for name in errors:
+            metrics.STRUCTURED_VALIDATION_FAILURES.inc(backend=backend, field=name)
+        if not errors or attempt == config.STRUCTURED_FIELD_RETRIES:
+            break
+        try:
+            fixed = await call(create_instructions(number), create_field_prompt(source_prompt, style, valid, errors),
+                               field_schema(list(errors)), config.VARIATION_MAX_TOKENS)
+        except Exception as e:
+            metrics.record_error('generate', e)
+            fixed = {}
+        fixed = fixed if isinstance(fixed, dict) else {}
+        for name in list(errors):
+            value, error = validate_field(name, fixed.get(name))
+            if error is None:
+                valid[name] = value
+                del errors[name]
+                metrics.STRUCTURED_FIELD_RETRIES.inc(backend=backend, field=name, result='succeeded')
+            else:
+                errors[name] = error
+    for name in errors:
+        metrics.STRUCTURED_FIELD_RETRIES.inc(backend=backend, field=name, result='gave_up')
+    if errors:
+        return None
+    return StructuredPost(style=style, **valid)
+
+
+async def generate_posts(call: StructuredCall, source_prompt: str, backend: str,
+                         max_tokens: int = config.MAX_TOKENS) -> List[Optional[StructuredPost]]:
+    """
+    Ask for every variation as one structured object and validate it
+
+    Args:
+        call: Backend call returning the parsed object for a prompt and schema
+        source_prompt: The per-source part of the prompt
+        backend: "llm" or "slm", for the metrics
+        max_tokens: Output token limit of the first call
+
+    Returns:
+        Posts in STYLES order; None where a post could not be completed
+    """
+    data = await call(create_instructions(), source_prompt, POSTS_SCHEMA, max_tokens)
+    items = _by_style(data.get('variations') if isinstance(data, dict) else None)
+    return list(await asyncio.gather(*[
+        complete_post(call, source_prompt, number, item, backend)
+        for number, item in zip(sorted(config.VARIATION_STYLES), items)
+    ]))
+
+
+async def generate_post(call: StructuredCall, source_prompt: str, number: int,
+                        backend: str) -> Optional[StructuredPost]:
+    """Ask for one variation (parallel mode) as a structured object and validate it"""
+    data = await call(create_instructions(number), source_prompt, field_schema(FIELDS), config.VARIATION_MAX_TOKENS)
+    return await complete_post(call, source_prompt, number, data, backend)
+
+
+def render(posts: Sequence[Optional[StructuredPost]]) -> List[str]:
+    """Posts as text, streaming.MISSING_VARIATION for the ones that could not be completed"""
+    return [post.to_text() if post is not None else MISSING_VARIATION for post in posts]
+
+
+def test_validation():
+    """Normalization and per-field errors of validate_post"""
+    body = " ".join(["word"] * config.STRUCTURED_MIN_BODY_WORDS)
+    valid, errors = validate_post({'hook': " Big news ", 'body': body, 'hashtags': ["Growth", "#data", "#growth", "dev ops"]})
+    assert valid == {'hook': "Big news", 'body': body, 'hashtags': ["#Growth", "#data", "#devops"]}, valid
+    assert not errors
+
+    valid, errors = validate_post({'hook': "Line one\nLine two", 'body': "Too short.", 'hashtags': ["#one"]})
+    assert valid == {} and set(errors) == set(FIELDS), errors
+
+    ordered = _by_style([{'style': STYLES[2]}, {'style': 'unknown'}, {'style': STYLES[0].upper()}])
+    assert ordered == [{'style': STYLES[0].upper()}, {'style': 'unknown'}, {'style': STYLES[2]}], ordered
+
+    async def call(instructions, prompt, schema, max_tokens):
+        if 'variations' in schema['properties']:
+            return {'variations': [{'style': style, 'hook': "Hook", 'body': body, 'hashtags': ["#a"]}
+                                   for style in STYLES]}
+        assert list(schema['properties']) == ['hashtags'], schema
+        return {'hashtags': ["#a", "#b"]}
+
+    posts = asyncio.run(generate_posts(call, "source", 'test'))
+    assert [post.hashtags for post in posts] == [["#a", "#b"]] * len(STYLES), posts
+    print("structured output validation OK")
+
+
+if __name__ == "__main__":
+    test_validation()
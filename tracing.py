@@ -0,0 +1,493 @@
+"""
+Optional request tracing: spans around scrape -> prompt -> model -> parse
+
+Spans follow the OpenTelemetry data model and are exported in the OTLP/JSON
+encoding, either as JSON lines in a local file or by POSTing to a collector
+(any OTLP/HTTP endpoint, e.g. the OpenTelemetry Collector on :4318). With
+the "opentelemetry" exporter, spans go through the OpenTelemetry API instead,
+so whatever SDK the deployment has configured receives them.
+
+Tracing is off unless configure() is called with enabled=True. While it is
+off, span() returns a shared no-op object, so instrumented code pays for
+one function call and an empty `with` block.
+"""
+import asyncio
+import functools
+import json
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import httpx
+
+import config
+from concurrency import run_blocking
+
+try:
+    from opentelemetry import trace as otel_trace
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+STATUS_ERROR = 2
+
+REQUEST_ID_HEADER = 'x-request-id'
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+_current: ContextVar[Optional["Span"]] = ContextVar('current_span', default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+_tracer: Optional["Tracer"] = None
+
+
+def span(name: str, activate: bool = True, expected: Tuple[Type[BaseException], ...] = (), **attributes):
+    """
+    Context manager timing a block as a span
+
+    Args:
+        name: Span name, e.g. "scrape.reddit"
+        activate: Make the span the parent of spans started inside the block.
+            Pass False in async generators, which run in their consumer's context.
+        expected: Exceptions that are part of normal control flow (see traced)
+        **attributes: Span attributes
+
+    Returns:
+        The span (use set_attribute to add results), or a no-op when tracing is off
+    """
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start(name, attributes, activate, expected=expected)
+
+
+def traced(name: str, expected: Tuple[Type[BaseException], ...] = ()) -> Callable:
+    """
+    Decorator running each call of a function (sync or async) in a span
+
+    Args:
+        name: Span name
+        expected: Exceptions that are part of normal control flow, recorded
+            as an attribute rather than as an error status
+    """
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if _tracer is None:
+                    return await func(*args, **kwargs)
+                with _tracer.start(name, {}, expected=expected):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if _tracer is None:
+                    return func(*args, **kwargs)
+                with _tracer.start(name, {}, expected=expected):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def outbound_headers() -> Dict[str, str]:
+    """traceparent and X-Request-ID headers carrying the current trace to a service we call"""
+    if _tracer is None:
+        return {}
+    headers = {}
+    request_id = _request_id.get()
+    if request_id is not None:
+        headers[REQUEST_ID_HEADER] = request_id
+    current = _current.get()
+    if current is not None:
+        headers['traceparent'] = current.traceparent
+    return headers
+
+
+def current_request_id() -> Optional[str]:
+    """The id of the request being handled, if any"""
+    return _request_id.get()
+
+
+def use_request_id(request_id: Optional[str]):
+    """Attribute spans started from here on (in this context) to a request id"""
+    _request_id.set(request_id)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'kind', 'attributes',
+                 'start_ns', 'end_ns', 'status', 'activate', 'expected', '_token')
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any], activate: bool,
+                 parent: Optional["Span"] = None, trace_id: Optional[str] = None,
+                 parent_id: Optional[str] = None, kind: int = KIND_INTERNAL,
+                 expected: Tuple[Type[BaseException], ...] = ()):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else (trace_id or '%032x' % random.getrandbits(128))
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.kind = kind
+        self.attributes = attributes
+        request_id = _request_id.get()
+        if request_id is not None:
+            self.attributes['request.id'] = request_id
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status: Optional[Dict[str, Any]] = None
+        self.activate = activate
+        self.expected = expected
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        if self.activate:
+            self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            _current.reset(self._token)
+        if exc_type is not None:
+            if issubclass(exc_type, self.expected + (GeneratorExit, asyncio.CancelledError)):
+                self.attributes['exception.type'] = exc_type.__name__
+            else:
+                self.status = {'code': STATUS_ERROR, 'message': f"{exc_type.__name__}: {exc}"}
+        self.tracer.finish(self)
+        return False
+
+    @property
+    def traceparent(self) -> str:
+        """W3C Trace Context header value naming this span as the parent"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in the OTLP/JSON encoding"""
+        otlp = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': _attribute_value(value)} for key, value in self.attributes.items()]
+        }
+        if self.parent_id:
+            otlp['parentSpanId'] = self.parent_id
+        if self.status is not None:
+            otlp['status'] = self.status
+        return otlp
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """(trace id, parent span id) from a W3C traceparent header, or None if absent or malformed"""
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if set(parts[1]) == {'0'} or set(parts[2]) == {'0'}:
+        return None
+    return parts[1], parts[2]
+
+
+class Exporter:
+    """Receives finished spans; subclasses decide where they go"""
+
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def flush(self):
+        """Called when a trace's root span ends"""
+
+    async def aclose(self):
+        self.flush()
+
+
+class _BatchExporter(Exporter):
+    """
+    Hands spans to a single background task once their trace's root span ends
+
+    A slow destination delays nothing but the export itself. Spans beyond
+    `max_pending` are dropped. Subclasses implement _send_batch().
+    """
+
+    def __init__(self, max_pending: int = config.TRACING_MAX_PENDING_SPANS):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.failed = 0
+        self._pending: List[Span] = []
+        self._ready: List[Span] = []
+        self._sender: Optional[asyncio.Task] = None
+
+    def export(self, span: Span):
+        if len(self._pending) + len(self._ready) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(span)
+
+    def flush(self):
+        self._ready.extend(self._pending)
+        self._pending = []
+        if self._ready and (self._sender is None or self._sender.done()):
+            try:
+                self._sender = asyncio.get_running_loop().create_task(self._send())
+            except RuntimeError:
+                pass  # no event loop; sent with the next flush or at close
+
+    async def _send(self):
+        while self._ready:
+            batch, self._ready = self._ready, []
+            await self._send_batch(batch)
+
+    async def _send_batch(self, spans: List[Span]):
+        raise NotImplementedError
+
+    async def aclose(self):
+        self._ready.extend(self._pending)
+        self._pending = []
+        if self._sender is not None:
+            await asyncio.gather(self._sender, return_exceptions=True)
+        if self._ready:
+            await self._send()
+
+
+class FileExporter(_BatchExporter):
+    """Appends spans to a file, one OTLP/JSON span per line, from the blocking thread pool"""
+
+    def __init__(self, path: str, max_pending: int = config.TRACING_MAX_PENDING_SPANS):
+        super().__init__(max_pending)
+        self.path = path
+
+    async def _send_batch(self, spans: List[Span]):
+        try:
+            # Encoding and disk latency stay off the event loop
+            await run_blocking(self._append, spans)
+        except OSError:
+            self.failed += len(spans)
+
+    def _append(self, spans: List[Span]):
+        lines = ''.join(json.dumps(span.to_otlp()) + '\n' for span in spans)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+class CollectorExporter(_BatchExporter):
+    """POSTs spans to an OTLP/HTTP JSON endpoint in the background"""
+
+    def __init__(self, endpoint: str, service_name: str = config.TRACING_SERVICE_NAME,
+                 max_pending: int = config.TRACING_MAX_PENDING_SPANS):
+        super().__init__(max_pending)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def _send_batch(self, spans: List[Span]):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=config.TRACING_EXPORT_TIMEOUT)
+        try:
+            response = await self._client.post(self.endpoint, json=self._payload(spans))
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.failed += len(spans)
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}
+
+    async def aclose(self):
+        await super().aclose()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to an exporter"""
+
+    def __init__(self, exporter: Exporter):
+        self.exporter = exporter
+        self.spans = 0
+
+    def start(self, name: str, attributes: Dict[str, Any], activate: bool = True,
+              traceparent: Optional[str] = None, kind: int = KIND_INTERNAL,
+              expected: Tuple[Type[BaseException], ...] = ()) -> Span:
+        parent = _current.get()
+        remote = parse_traceparent(traceparent) if parent is None else None
+        if remote is not None:
+            return Span(self, name, attributes, activate, trace_id=remote[0], parent_id=remote[1],
+                        kind=kind, expected=expected)
+        return Span(self, name, attributes, activate, parent=parent, kind=kind, expected=expected)
+
+    def finish(self, span: Span):
+        self.spans += 1
+        self.exporter.export(span)
+        if _current.get() is None:
+            # A root span (or one started outside any request) ended
+            self.exporter.flush()
+
+    async def aclose(self):
+        await self.exporter.aclose()
+
+
+class OpenTelemetryTracer:
+    """Starts spans through the OpenTelemetry API (exported by the configured SDK)"""
+
+    def __init__(self):
+        self._tracer = otel_trace.get_tracer(__name__)
+        self.spans = 0
+
+    def start(self, name: str, attributes: Dict[str, Any], activate: bool = True,
+              traceparent: Optional[str] = None, kind: int = KIND_INTERNAL,
+              expected: Tuple[Type[BaseException], ...] = ()):
+        # `expected` exceptions still mark the span as failed here; the API has no per-type switch
+        self.spans += 1
+        request_id = _request_id.get()
+        if request_id is not None:
+            attributes['request.id'] = request_id
+        span_kind = otel_trace.SpanKind.SERVER if kind == KIND_SERVER else otel_trace.SpanKind.INTERNAL
+        context = None
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            context = otel_trace.set_span_in_context(otel_trace.NonRecordingSpan(otel_trace.SpanContext(
+                int(remote[0], 16), int(remote[1], 16), is_remote=True,
+                trace_flags=otel_trace.TraceFlags(otel_trace.TraceFlags.SAMPLED)
+            )))
+        if activate:
+            return self._tracer.start_as_current_span(name, context=context, kind=span_kind, attributes=attributes)
+        return self._tracer.start_span(name, context=context, kind=span_kind, attributes=attributes)
+
+    async def aclose(self):
+        pass
+
+
+def configure(enabled: bool = config.TRACING_ENABLED, exporter: str = config.TRACING_EXPORTER,
+              path: str = config.TRACING_FILE, endpoint: str = config.TRACING_ENDPOINT):
+    """
+    Turn tracing on or off
+
+    Args:
+        enabled: Record spans
+        exporter: "file", "collector" or "opentelemetry"
+        path: JSON lines file for the file exporter
+        endpoint: OTLP/HTTP traces URL for the collector exporter
+    """
+    global _tracer
+    if not enabled:
+        _tracer = None
+    elif exporter == 'file':
+        _tracer = Tracer(FileExporter(path))
+    elif exporter == 'collector':
+        _tracer = Tracer(CollectorExporter(endpoint))
+    elif exporter == 'opentelemetry':
+        if not OTEL_AVAILABLE:
+            raise ValueError("The opentelemetry exporter needs the opentelemetry-api package")
+        _tracer = OpenTelemetryTracer()
+    else:
+        raise ValueError(f"Unknown tracing exporter: {exporter}")
+
+
+async def shutdown():
+    """Export what is still buffered and turn tracing off"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        await tracer.aclose()
+
+
+def stats() -> Dict[str, Any]:
+    """Whether tracing is on, and spans recorded and dropped"""
+    if _tracer is None:
+        return {'enabled': False}
+    exporter = getattr(_tracer, 'exporter', None)
+    return {
+        'enabled': True,
+        'spans': _tracer.spans,
+        'dropped': getattr(exporter, 'dropped', 0),
+        'export_failed': getattr(exporter, 'failed', 0)
+    }
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware giving each request an id and, while tracing is on, a root span
+
+    The id comes from the X-Request-ID header if the client sent one, and is
+    echoed back in the response. A W3C traceparent header makes the root
+    span part of the caller's trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        request_id = headers.get(REQUEST_ID_HEADER.encode(), b'').decode('latin-1')[:128] or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+        root = None
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                if root is not None:
+                    root.set_attribute('http.status_code', message['status'])
+                message = dict(message, headers=list(message.get('headers', [])) + [
+                    (REQUEST_ID_HEADER.encode(), request_id.encode('latin-1'))
+                ])
+            await send(message)
+
+        try:
+            if _tracer is None:
+                await self.app(scope, receive, send_with_id)
+                return
+            traceparent = headers.get(b'traceparent', b'').decode('latin-1') or None
+            with _tracer.start(f"{scope['method']} {scope['path']}",
+                               {'http.method': scope['method'], 'http.target': scope['path']},
+                               traceparent=traceparent, kind=KIND_SERVER) as root:
+                await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
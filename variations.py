@@ -0,0 +1,169 @@
+"""
+Per-variation generation: one smaller request per style, run concurrently
+
+The default mode asks the model for all three styles in one completion, so
+wall-clock time is the sum of every variation's output tokens. In parallel
+mode each style from config.VARIATION_STYLES is requested separately and
+the requests run concurrently; the cost is repeating the input tokens once
+per style.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+
+import config
+import metrics
+from streaming import HEADER, ParseOutcome
+
+
+VARIATION_NUMBERS = sorted(config.VARIATION_STYLES)
+
+
+def create_variation_instructions(number: int) -> str:
+    """
+    Fixed instructions for writing one variation in the given style
+
+    Args:
+        number: Key into config.VARIATION_STYLES
+
+    Returns:
+        Instruction text (identical across requests, so it can be cached)
+    """
+    style = config.VARIATION_STYLES[number]
+    return f"""You are an expert content strategist specializing in LinkedIn content creation.
+
+The user will share a post from another platform that they want to repurpose for LinkedIn.
+
+Write ONE LinkedIn post based on it, in a {style['name']} style: {style['description'].lower()}. The post should:
+
+1. Be professional yet engaging
+2. Maintain the core message and insights from the original
+3. Use LinkedIn-appropriate formatting (short paragraphs, line breaks for readability)
+4. Include relevant hashtags (2-5 hashtags)
+5. Have a strong hook in the first line
+6. Be between 150-300 words
+7. Have a clear call-to-action or thought-provoking question at the end
+
+Respond with the post text only, without a heading or any additional text."""
+
+
+def create_variation_prompt(content: str, platform: str, author: str = None, number: int = 1) -> str:
+    """
+    Full single-turn prompt for one variation (for backends without system prompts)
+
+    Args:
+        content: Source content
+        platform: Source platform
+        author: Original author name
+        number: Key into config.VARIATION_STYLES
+
+    Returns:
+        Prompt text
+    """
+    return f"{create_variation_instructions(number)}\n\n{create_source_prompt(content, platform, author)}"
+
+
+def create_source_prompt(content: str, platform: str, author: str = None) -> str:
+    """The per-source part of the prompt"""
+    author_info = f" by {author}" if author else ""
+    return f"""I have a post from {platform.upper()}{author_info} that I want to repurpose for LinkedIn.
+
+Original content:
+---
+{content}
+---"""
+
+
+def clean_variation(text: str) -> str:
+    """Strip whitespace and any VARIATION heading the model added (some still prefix one)"""
+    text = text.strip()
+    # The newline lets a heading with no colon and nothing after it match too
+    header = HEADER.match(text + '\n')
+    return text[header.end():].strip() if header else text
+
+
+async def generate_parallel(generate_one: Callable[[int], Awaitable[str]]) -> List[str]:
+    """
+    Run one request per style concurrently and return the posts in style order
+
+    Args:
+        generate_one: Coroutine function taking a style number and returning the post
+
+    Returns:
+        Posts ordered like config.VARIATION_STYLES
+    """
+    return list(await asyncio.gather(*[generate_one(number) for number in VARIATION_NUMBERS]))
+
+
+async def fill_missing(outcome: ParseOutcome, generate_one: Callable[[int], Awaitable[str]],
+                       backend: str) -> List[str]:
+    """
+    Posts in style order, generating again only the variations a completion lacked
+
+    Each missing variation is requested on its own, in its style, so a
+    truncated or malformed completion costs one short request per gap
+    instead of a whole new completion. A variation that still fails keeps
+    the streaming.MISSING_VARIATION placeholder.
+
+    Args:
+        outcome: Parse of the full completion
+        generate_one: Coroutine function taking a style number and returning the post
+        backend: "llm" or "slm", for the metrics
+
+    Returns:
+        Posts ordered like config.VARIATION_STYLES
+    """
+    metrics.VARIATION_PARSES.inc(backend=backend, outcome='complete' if outcome.complete else 'partial')
+    missing = outcome.missing
+    if not missing:
+        return outcome.posts()
+
+    found = dict(outcome.variations)
+    results = await asyncio.gather(*[generate_one(number) for number in missing], return_exceptions=True)
+    for number, result in zip(missing, results):
+        if isinstance(result, Exception) or not result:
+            metrics.VARIATION_RETRIES.inc(backend=backend, result='failed')
+        else:
+            metrics.VARIATION_RETRIES.inc(backend=backend, result='succeeded')
+            found[number] = result
+    return ParseOutcome(found, outcome.expected).posts()
+
+
+async def variations_as_completed(generate_one: Callable[[int], Awaitable[str]],
+                                  backend: str) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Run one request per style concurrently, yielding each as soon as it finishes
+
+    A style whose request fails is skipped and counted, so one fast failure
+    (e.g. a 429) doesn't hide the styles still being written. Requests still
+    running when the consumer stops iterating (e.g. after taking only the
+    first variation) are cancelled.
+
+    Args:
+        generate_one: Coroutine function taking a style number and returning the post
+        backend: "llm" or "slm", for the metrics
+
+    Yields:
+        (style number, post) in completion order, without the styles that failed
+
+    Raises:
+        The last style's error if every style failed
+    """
+    tasks = {asyncio.ensure_future(generate_one(number)): number for number in VARIATION_NUMBERS}
+    try:
+        pending = set(tasks)
+        succeeded = False
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    metrics.VARIATION_FAILURES.inc(backend=backend)
+                    error = task.exception()
+                    continue
+                succeeded = True
+                yield tasks[task], task.result()
+        if not succeeded:
+            raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,318 @@
+"""
+Watch subreddits and feeds, repurposing each new post once
+
+CLI usage:
+    python watcher.py https://www.reddit.com/r/Python/ https://example.com/feed.xml --model-type slm
+    python watcher.py sources.txt --model-type llm --interval 600   # one URL per line
+    python watcher.py https://example.com/feed.xml --model-type slm --once
+
+Each source keeps a high-water mark: the ids (Reddit fullnames, feed GUIDs)
+of the items seen so far, and the ETag / Last-Modified of its last
+response. A poll is a conditional request, so an unchanged feed costs a
+304, and reading stops at the first item already seen. New items are
+generated with bounded concurrency and results are written as NDJSON.
+
+The state lives in a SQLite file. Items are recorded as pending before
+generation and cleared once generated, so a restart neither loses new
+items nor generates finished ones again. A failed item is retried on the
+next polls, up to WATCH_MAX_ATTEMPTS times. Sources must list their
+newest items first, as Reddit listings and almost all feeds do.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import config
+from batch import GenerateFn, run_batch
+from concurrency import run_blocking
+from scraper import ContentScraper, NotModified, conditional
+
+
+@dataclass
+class SourceState:
+    """High-water mark of one watched source"""
+    url: str
+    seen: List[str] = field(default_factory=list)  # newest first
+    validators: Dict[str, str] = field(default_factory=dict)
+    polled_at: Optional[float] = None
+
+
+class WatchStore:
+    """
+    Source states and pending items in a SQLite file (":memory:" for none)
+
+    Calls block; use the async methods from the event loop.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "url TEXT PRIMARY KEY, seen TEXT NOT NULL, validators TEXT NOT NULL, polled_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "source TEXT NOT NULL, id TEXT NOT NULL, item TEXT NOT NULL, attempts INTEGER NOT NULL, "
+            "added_at REAL NOT NULL, PRIMARY KEY (source, id))"
+        )
+        self._conn.commit()
+
+    def _load(self, url: str) -> Tuple[SourceState, List[Dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seen, validators, polled_at FROM sources WHERE url = ?", (url,)
+            ).fetchone()
+            pending = self._conn.execute(
+                "SELECT item FROM pending WHERE source = ? ORDER BY added_at", (url,)
+            ).fetchall()
+        if row is None:
+            return SourceState(url), []
+        state = SourceState(url, json.loads(row[0]), json.loads(row[1]), row[2])
+        return state, [json.loads(item) for (item,) in pending]
+
+    def _record_poll(self, state: SourceState, new_items: List[Dict]):
+        """Save the source's new mark and its new items as pending, in one transaction"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (state.url, json.dumps(state.seen), json.dumps(state.validators), state.polled_at)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pending VALUES (?, ?, ?, 0, ?)",
+                [(state.url, item['id'], json.dumps(item), now + index * 1e-6)
+                 for index, item in enumerate(new_items)]
+            )
+
+    def _finish(self, source: str, item_id: str, failed: bool) -> bool:
+        """Clear a generated item, or count a failed attempt; True if the item is done with"""
+        with self._lock, self._conn:
+            if failed:
+                self._conn.execute(
+                    "UPDATE pending SET attempts = attempts + 1 WHERE source = ? AND id = ?", (source, item_id)
+                )
+                row = self._conn.execute(
+                    "SELECT attempts FROM pending WHERE source = ? AND id = ?", (source, item_id)
+                ).fetchone()
+                if row is not None and row[0] < config.WATCH_MAX_ATTEMPTS:
+                    return False
+            self._conn.execute("DELETE FROM pending WHERE source = ? AND id = ?", (source, item_id))
+            return True
+
+    async def load(self, url: str) -> Tuple[SourceState, List[Dict]]:
+        """The source's state and its pending items, oldest first"""
+        return await run_blocking(self._load, url)
+
+    async def record_poll(self, state: SourceState, new_items: List[Dict]):
+        await run_blocking(self._record_poll, state, new_items)
+
+    async def finish(self, source: str, item_id: str, failed: bool = False) -> bool:
+        return await run_blocking(self._finish, source, item_id, failed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _item_id(item: Dict) -> Optional[str]:
+    return item.get('id') or item.get('url')
+
+
+class Watcher:
+    """Polls sources through a ContentScraper and generates their new items"""
+
+    def __init__(self, scraper: ContentScraper, generate: GenerateFn, store: WatchStore,
+                 generate_concurrency: int = config.WATCH_GENERATE_CONCURRENCY,
+                 max_items: int = config.WATCH_MAX_ITEMS, backfill: int = config.WATCH_BACKFILL):
+        """
+        Args:
+            scraper: Scraper whose adapters list the sources' items
+            generate: Coroutine function (content, platform, author) -> posts
+            store: Where the high-water marks and pending items are kept
+            generate_concurrency: Generations in flight at once
+            max_items: New items taken from a source per poll
+            backfill: Items generated from a source's first poll
+        """
+        self.scraper = scraper
+        self.generate = generate
+        self.store = store
+        self.generate_concurrency = generate_concurrency
+        self.max_items = max_items
+        self.backfill = backfill
+
+    async def _scan(self, state: SourceState) -> List[Dict]:
+        """Items listed above the high-water mark, newest first; moves the mark"""
+        seen = set(state.seen)
+        found = []
+        with conditional(state.validators) as revalidation:
+            try:
+                async for item in self.scraper.items(state.url):
+                    item_id = _item_id(item)
+                    if item_id is None or item_id in seen:
+                        break
+                    found.append({**item, 'id': item_id})
+                    if len(found) >= self.max_items:
+                        break
+            except NotModified:
+                pass
+            else:
+                state.validators = revalidation.received
+        state.seen = ([item['id'] for item in found] + state.seen)[:config.WATCH_SEEN_IDS]
+        return found
+
+    async def poll(self, url: str) -> List[Dict]:
+        """
+        Check a source for new items
+
+        Returns:
+            Items to generate, oldest first: earlier unfinished ones, then new ones
+        """
+        state, pending = await self.store.load(url)
+        first_poll = state.polled_at is None
+        found = await self._scan(state)
+        state.polled_at = time.time()
+        if first_poll:
+            # Only the newest `backfill` items; the rest just set the mark
+            found = found[:self.backfill]
+        new_items = list(reversed(found))
+        await self.store.record_poll(state, new_items)
+        known = {item['id'] for item in pending}
+        return pending + [item for item in new_items if item['id'] not in known]
+
+    async def _polled_items(self, sources: Iterable[str], results: List[Dict]) -> AsyncIterator[Dict]:
+        """Batch items from every source, yielded as each source's poll finishes"""
+        async def poll(url):
+            try:
+                return url, await self.poll(url), None
+            except Exception as e:
+                return url, [], e
+
+        for finished in asyncio.as_completed([poll(url) for url in sources]):
+            url, items, error = await finished
+            if error is not None:
+                results.append({'source': url, 'error': f"Polling failed: {str(error)}"})
+            for item in items:
+                yield {'id': (url, item['id'], item.get('url')), 'content': item['content'],
+                       'platform': item['platform'], 'author': item['author']}
+
+    async def run_once(self, sources: Iterable[str]) -> AsyncIterator[Dict]:
+        """
+        Poll every source and generate its new items
+
+        Generation starts as soon as a source's items are known, without
+        waiting for the other sources.
+
+        Yields:
+            One result per item ({source, id, url, platform, author, posts,
+            error}) in completion order, and one per source that failed to poll
+        """
+        poll_errors: List[Dict] = []
+        async for result in run_batch(self._polled_items(sources, poll_errors), self.scraper, self.generate,
+                                      generate_concurrency=self.generate_concurrency):
+            source, item_id, url = result.pop('id')
+            result.pop('index')
+            failed = result['error'] is not None
+            given_up = await self.store.finish(source, item_id, failed)
+            if failed and not given_up:
+                result['retry'] = True
+            yield {'source': source, 'id': item_id, 'url': url, **result}
+        for error in poll_errors:
+            yield error
+
+    async def run(self, sources: List[str], interval: float = config.WATCH_INTERVAL) -> AsyncIterator[Dict]:
+        """Poll forever, `interval` seconds apart, yielding results as in run_once"""
+        while True:
+            started = time.monotonic()
+            async for result in self.run_once(sources):
+                yield result
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def read_sources(arguments: List[str]) -> List[str]:
+    """Source URLs from the command line; arguments that aren't URLs are files with one URL per line"""
+    sources = []
+    for argument in arguments:
+        if argument.startswith(('http://', 'https://')):
+            sources.append(argument)
+            continue
+        with open(argument, encoding='utf-8') as f:
+            sources.extend(line.strip() for line in f if line.strip() and not line.lstrip().startswith('#'))
+    return sources
+
+
+async def _run_cli(args) -> int:
+    from backends import BackendRegistry
+    from http_client import create_http_client
+
+    sources = read_sources(args.sources)
+    if not sources:
+        raise ValueError("No sources to watch")
+
+    http_client = create_http_client()
+    backends = BackendRegistry(http_client=http_client)
+    scraper = ContentScraper(client=http_client)
+    store = WatchStore(args.state)
+    output = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+    try:
+        for url in sources:
+            scraper.adapters.resolve(url)
+        repurposer = await backends.get(args.model_type, args.api_key, args.base_url)
+
+        async def generate(content, platform, author):
+            return await repurposer.generate_linkedin_posts(content, platform, author)
+
+        watcher = Watcher(scraper, generate, store,
+                          generate_concurrency=args.generate_concurrency,
+                          max_items=args.max_items, backfill=args.backfill)
+        results = watcher.run_once(sources) if args.once else watcher.run(sources, args.interval)
+        async for result in results:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        store.close()
+        await backends.aclose()
+        await http_client.aclose()
+    return 0
+
+
+def main():
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='+', help="subreddit or feed URLs, or files listing them")
+    parser.add_argument('--output', default='-', help="NDJSON file results are appended to (default: stdout)")
+    parser.add_argument('--state', default=config.WATCH_STATE_DB, help="SQLite file with the watch state")
+    parser.add_argument('--model-type', choices=['llm', 'slm'], default='llm')
+    parser.add_argument('--api-key', default=os.getenv('ANTHROPIC_API_KEY'), help="Anthropic API key for llm")
+    parser.add_argument('--base-url', default=config.OLLAMA_BASE_URL, help="Ollama base URL for slm")
+    parser.add_argument('--interval', type=float, default=config.WATCH_INTERVAL, help="seconds between polls")
+    parser.add_argument('--once', action='store_true', help="poll once and exit")
+    parser.add_argument('--generate-concurrency', type=int, default=config.WATCH_GENERATE_CONCURRENCY)
+    parser.add_argument('--max-items', type=int, default=config.WATCH_MAX_ITEMS,
+                        help="new items taken from a source per poll")
+    parser.add_argument('--backfill', type=int, default=config.WATCH_BACKFILL,
+                        help="items generated from a new source's first poll")
+    args = parser.parse_args()
+
+    try:
+        sys.exit(asyncio.run(_run_cli(args)))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except (OSError, ValueError, ConnectionError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()